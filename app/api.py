@@ -0,0 +1,130 @@
+"""Versioned JSON API over the stored leads (/api/v1/leads).
+
+Pages are ordered by lead id, oldest first, so a sync client keeps the
+`next_cursor` of its last page and asks again later for what was stored
+after it. Responses carry an ETag derived from the data version and are
+compressed with brotli or gzip when the client accepts it.
+
+Query args:
+    cursor: `next_cursor` of the previous page
+    since: ISO date, only leads fetched at or after it
+    source: source name(s), comma-separated or repeated
+    fields: fields of the lead payload to return, comma-separated
+    limit: page size (1..API_MAX_PAGE_SIZE)
+"""
+import base64
+import gzip
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from models import db, Lead
+from lead_feed import lead_fields
+from config import API_PAGE_SIZE, API_MAX_PAGE_SIZE, API_COMPRESS_MIN_BYTES
+
+# Optional: brotli compresses JSON better than gzip; gzip is always available
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+API_VERSION = 'v1'
+
+
+class ApiError(Exception):
+    """Raised for invalid API requests (answered with 400)."""
+    pass
+
+
+def encode_cursor(lead_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id:{lead_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()).decode()
+        prefix, lead_id = raw.split(':', 1)
+        if prefix != 'id':
+            raise ValueError(prefix)
+        return int(lead_id)
+    except Exception:
+        raise ApiError('Invalid cursor')
+
+
+def parse_since(value: str) -> datetime:
+    """ISO date or datetime, as naive UTC like the stored timestamps."""
+    try:
+        moment = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except ValueError:
+        raise ApiError(f'Invalid since: {value}')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _split(args, name: str) -> List[str]:
+    return [v for raw in args.getlist(name) for v in raw.split(',') if v]
+
+
+def list_leads(args) -> Dict:
+    """One page of leads for the request args (see module docstring)."""
+    try:
+        limit = int(args.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('Invalid limit')
+    limit = min(max(limit, 1), API_MAX_PAGE_SIZE)
+    after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    sources = _split(args, 'source')
+    fields = _split(args, 'fields')
+
+    stmt = select(Lead.id, Lead.source, Lead.key, Lead.fetched_at, Lead.created_at, Lead.data)
+    if after is not None:
+        stmt = stmt.where(Lead.id > after)
+    if args.get('since'):
+        stmt = stmt.where(Lead.fetched_at >= parse_since(args['since']))
+    if sources:
+        stmt = stmt.where(Lead.source.in_(sources))
+    # One extra row tells whether another page is already available
+    rows = db.session.execute(stmt.order_by(Lead.id).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        data = lead_fields(row.data)
+        items.append({
+            'id': row.id,
+            'source': row.source,
+            'key': row.key,
+            'fetched_at': row.fetched_at.isoformat() if row.fetched_at else None,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'data': {f: data[f] for f in fields if f in data} if fields else data,
+        })
+    # Without new rows the cursor stays put, so clients can poll with it
+    last_id = rows[-1].id if rows else after
+    return {
+        'items': items,
+        'has_more': has_more,
+        'next_cursor': encode_cursor(last_id) if last_id is not None else None,
+    }
+
+
+def compress(body: bytes, accept_encodings) -> Tuple[bytes, Optional[str]]:
+    """Compress `body` with the best encoding the client accepts.
+
+    Args:
+        body: Response body
+        accept_encodings: `request.accept_encodings`
+
+    Returns:
+        (body, Content-Encoding or None)
+    """
+    if len(body) < API_COMPRESS_MIN_BYTES:
+        return body, None
+    offered = ['br', 'gzip'] if BROTLI_AVAILABLE else ['gzip']
+    encoding = accept_encodings.best_match(offered)
+    if encoding == 'br':
+        return brotli.compress(body, quality=5), 'br'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
@@ -1,27 +1,166 @@
 """Flask application factory."""
+import hashlib
 import os
 from datetime import datetime
 import socket
 from flask import Flask
-from models import db
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, AppMeta
+from config import SQLITE_BUSY_TIMEOUT_MS, SQLITE_SYNCHRONOUS, DB_POOL_SIZE, DB_POOL_RECYCLE
 
-def create_app():
-    """Create Flask application."""
+# Connection pool sizing per process type. The web server runs one worker
+# with a couple of threads plus the background scrape thread; RQ workers and
+# CLI runs (main.py) only ever use one connection at a time.
+POOL_PROFILES = {
+    'web': {'pool_size': 4, 'max_overflow': 4},
+    'worker': {'pool_size': 2, 'max_overflow': 1},
+    'cli': {'pool_size': 1, 'max_overflow': 1},
+}
+
+def _database_uri(url: str) -> str:
+    """Pin the PostgreSQL driver shipped in requirements.txt (psycopg2):
+    newer SQLAlchemy releases default a bare postgresql:// URL to psycopg 3."""
+    for scheme in ('postgresql://', 'postgres://'):
+        if url.startswith(scheme):
+            return 'postgresql+psycopg2://' + url[len(scheme):]
+    return url
+
+def _is_sqlite(database_uri: str) -> bool:
+    return database_uri.startswith('sqlite:')
+
+def _engine_options(database_uri: str, process_type: str) -> dict:
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the given database and process type."""
+    options = dict(POOL_PROFILES.get(process_type, POOL_PROFILES['web']))
+    if DB_POOL_SIZE:
+        options['pool_size'] = DB_POOL_SIZE
+    if _is_sqlite(database_uri):
+        if ':memory:' in database_uri or database_uri in ('sqlite://', 'sqlite:///'):
+            # In-memory databases keep SQLAlchemy's default single-connection pool
+            return {}
+        options['connect_args'] = {
+            # sqlite3 waits this long on a locked database before raising
+            'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+            # Connections are handed between web threads and the scrape thread
+            'check_same_thread': False,
+        }
+    else:
+        # Server databases (PostgreSQL): drop connections killed by the
+        # server or a proxy instead of failing the next request
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = DB_POOL_RECYCLE
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply concurrency pragmas on every new SQLite connection.
+
+    WAL lets readers proceed while the scraper holds the write lock,
+    busy_timeout makes writers queue instead of failing with
+    "database is locked", and synchronous=NORMAL is durable in WAL mode
+    while avoiding an fsync on every commit. auto_vacuum=INCREMENTAL only
+    takes effect on new databases and lets retention.py reclaim space
+    without a blocking full VACUUM.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}')
+        if SQLITE_SYNCHRONOUS.upper() in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS.upper()}')
+        cursor.execute('PRAGMA foreign_keys=ON')
+    finally:
+        cursor.close()
+
+
+def _ensure_indexes():
+    """Create indexes declared on models that are missing from existing tables.
+
+    `db.create_all()` only creates indexes together with new tables, so
+    databases created before an index was added would never get it.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+SCHEMA_META_KEY = 'schema_version'
+
+# (database URI, schema version) pairs already verified by this process
+_checked_schemas = set()
+
+def schema_version() -> str:
+    """Return a short hash of the tables, columns and indexes declared by the models."""
+    parts = []
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{c.name}:{c.type!r}" for c in table.columns)
+        parts.extend(sorted(i.name for i in table.indexes))
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:16]
+
+def ensure_schema(app) -> bool:
+    """Create missing tables and indexes once per schema version.
+
+    The applied version is stored in AppMeta, so after the first process of
+    a deployment has run `db.create_all()`, every other process (gunicorn
+    workers, RQ jobs, CLI runs) only pays for a single primary-key lookup.
+
+    Returns:
+        True if the schema was (re)created, False if it was already current
+    """
+    version = schema_version()
+    marker = (app.config['SQLALCHEMY_DATABASE_URI'], version)
+    if marker in _checked_schemas:
+        return False
+
+    with app.app_context():
+        try:
+            row = db.session.get(AppMeta, SCHEMA_META_KEY)
+            current = row.value if row else None
+        except SQLAlchemyError:
+            # AppMeta itself does not exist yet
+            db.session.rollback()
+            current = None
+
+        created = current != version
+        if created:
+            db.create_all()
+            _ensure_indexes()
+            db.session.merge(AppMeta(key=SCHEMA_META_KEY, value=version))
+            db.session.commit()
+        db.session.remove()
+
+    _checked_schemas.add(marker)
+    return created
+
+def create_app(process_type: str = None):
+    """Create Flask application.
+
+    Args:
+        process_type: 'web', 'worker' or 'cli'; selects the connection pool
+            profile. Defaults to the APP_PROCESS_TYPE environment variable.
+    """
     app = Flask(__name__)
+    process_type = process_type or os.getenv('APP_PROCESS_TYPE', 'web')
+    database_uri = _database_uri(os.getenv('DATABASE_URL', 'sqlite:///app.db'))
     
     # Configuration
     app.config.update(
         SECRET_KEY=os.getenv('FLASK_SECRET_KEY', os.urandom(24).hex()),
-        SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', 'sqlite:///app.db'),
-        SQLALCHEMY_TRACK_MODIFICATIONS=False
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_ENGINE_OPTIONS=_engine_options(database_uri, process_type),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        PROCESS_TYPE=process_type
     )
     
     # Initialize extensions
     db.init_app(app)
     
-    # Create database tables
     with app.app_context():
-        db.create_all()
+        if _is_sqlite(database_uri):
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+
+    # Create database tables (skipped when the schema version is current)
+    ensure_schema(app)
     
     # Health check endpoint
     @app.route('/health')
@@ -0,0 +1,130 @@
+"""Lead arrival model for adaptive scheduling.
+
+Counts when new leads were first stored (`Lead.created_at`) per hour of
+the week (weekday x hour, in the scheduler's timezone) and turns those
+counts into a polling interval per slot. A lead counts once, when its
+identity (`guess_primary_key` of its row) is first seen: the Selenium
+scraper used to key rows by run time, so history holds the same lead once
+per run and counting rows would learn when scrapes ran, not when leads
+arrive.
+
+For leads arriving at random within a slot polled every T seconds, the
+expected detection latency is T / 2. Minimising runs for a given total
+latency gives T proportional to 1 / sqrt(arrival rate): hot hours are
+polled more often, cold hours less, and every interval is clamped to
+SCHEDULE_ADAPTIVE_MIN_INTERVAL..SCHEDULE_ADAPTIVE_MAX_INTERVAL.
+"""
+import math
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Dict, List, Optional
+from models import db, Lead
+from utils_text import guess_primary_key
+from config import (
+    SCHEDULE_ADAPTIVE_MIN_INTERVAL, SCHEDULE_ADAPTIVE_MAX_INTERVAL,
+    SCHEDULE_LEARN_DAYS
+)
+
+SLOTS = 7 * 24
+# Pseudo-count added to every slot so unseen hours are not treated as "never"
+PRIOR_LEADS = 0.5
+WEEKDAYS = ('lun', 'mar', 'mer', 'jeu', 'ven', 'sam', 'dim')
+
+
+def slot_of(moment: datetime) -> int:
+    """Hour-of-week index (Monday 00h = 0) of an aware local datetime."""
+    return moment.weekday() * 24 + moment.hour
+
+
+class ArrivalModel:
+    """Lead arrival rate per hour of the week."""
+
+    def __init__(self, counts: List[int], weeks: float,
+                 min_interval: float = SCHEDULE_ADAPTIVE_MIN_INTERVAL,
+                 max_interval: float = SCHEDULE_ADAPTIVE_MAX_INTERVAL):
+        self.counts = counts
+        self.weeks = max(weeks, 1.0)
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        # Leads per hour in each slot
+        self.rates = [(c + PRIOR_LEADS) / self.weeks for c in counts]
+        self.mean_rate = sum(self.rates) / SLOTS
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    @classmethod
+    def from_history(cls, tz: tzinfo, days: int = SCHEDULE_LEARN_DAYS,
+                     now: Optional[datetime] = None, **kwargs) -> 'ArrivalModel':
+        """Learn from leads first seen in the last `days` days.
+
+        Args:
+            tz: Timezone the hours of the week are counted in
+            days: History window
+            now: Current time, naive UTC (defaults to utcnow)
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=days)
+        counts = [0] * SLOTS
+        oldest = None
+        seen = set()
+        # One more window before the cutoff tells leads first seen earlier
+        # (still listed by the portal) from new ones
+        query = (db.session.query(Lead.created_at, Lead.key, Lead.data)
+                 .filter(Lead.created_at >= cutoff - timedelta(days=days))
+                 .order_by(Lead.created_at, Lead.id)
+                 .yield_per(1000))
+        for created_at, key, data in query:
+            identity = str(guess_primary_key(data)) if isinstance(data, dict) and data else key
+            if identity in seen:
+                continue
+            seen.add(identity)
+            if created_at < cutoff:
+                continue
+            counts[slot_of(created_at.replace(tzinfo=timezone.utc).astimezone(tz))] += 1
+            oldest = created_at if oldest is None or created_at < oldest else oldest
+        weeks = (now - oldest).total_seconds() / (7 * 86400) if oldest else 1.0
+        return cls(counts, weeks, **kwargs)
+
+    def interval(self, slot: int, base: float) -> float:
+        """Polling interval (seconds) for a slot.
+
+        Args:
+            slot: Hour-of-week index
+            base: Interval used for a slot with the average arrival rate
+        """
+        value = base * math.sqrt(self.mean_rate / self.rates[slot])
+        return min(max(value, self.min_interval), self.max_interval)
+
+    def expected(self, intervals: List[float]) -> Dict:
+        """Runs per week and lead-weighted detection latency for per-slot intervals."""
+        runs = sum(3600.0 / t for t in intervals)
+        latency = sum(r * t / 2 for r, t in zip(self.rates, intervals)) / sum(self.rates)
+        return {'runs_per_week': round(runs, 1), 'expected_latency_minutes': round(latency / 60, 1)}
+
+    def report(self, base: float) -> Dict:
+        """Compare a fixed `base` interval with the adaptive intervals.
+
+        `tradeoff` repeats the comparison for other base intervals, giving
+        expected latency against runs spent for both strategies.
+        """
+        adaptive = [self.interval(slot, base) for slot in range(SLOTS)]
+        hottest = sorted(range(SLOTS), key=lambda s: self.rates[s], reverse=True)[:5]
+        return {
+            'leads': self.total,
+            'weeks': round(self.weeks, 1),
+            'fixed': self.expected([base] * SLOTS),
+            'adaptive': self.expected(adaptive),
+            'tradeoff': [
+                {'base_minutes': round(base * factor / 60, 1),
+                 'fixed': self.expected([base * factor] * SLOTS),
+                 'adaptive': self.expected([self.interval(slot, base * factor) for slot in range(SLOTS)])}
+                for factor in (0.5, 1, 2, 4)
+            ],
+            'hot_slots': [
+                {'slot': f"{WEEKDAYS[s // 24]} {s % 24:02d}h",
+                 'leads_per_hour': round(self.rates[s], 2),
+                 'interval_minutes': round(adaptive[s] / 60, 1)}
+                for s in hottest
+            ],
+        }
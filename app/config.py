@@ -13,10 +13,29 @@ N8N_WEBHOOK_URL: Optional[str] = os.getenv('N8N_WEBHOOK_URL')
 STATE_FILE: str = os.getenv('STATE_FILE', '/data/state.json')
 LOG_FILE: str = os.getenv('LOG_FILE', '/data/leads.log')
 README_FILE: str = os.getenv('README_FILE', '/data/README_webhook.md')
+ARCHIVE_DIR: str = os.getenv('ARCHIVE_DIR', '/data/archive')
+SCREENSHOT_DIR: str = os.getenv('SCREENSHOT_DIR', '/app/static')
+COOKIES_FILE: str = os.getenv('COOKIES_FILE', '/data/tesla_cookies.json')
+COOKIES_EXPIRY_WARNING_HOURS: float = float(os.getenv('COOKIES_EXPIRY_WARNING_HOURS', '24'))  # warn before the session expires
+
+# Log rotation for LOG_FILE
+LOG_MAX_BYTES: int = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT: int = int(os.getenv('LOG_BACKUP_COUNT', '5'))
 
 # Table configuration
 TABLE_SOURCES: list[str] = os.getenv('TABLE_SOURCES', 'tesla.com,shop.tesla.com').split(',')
 
+# Browserless fetch (scraper_http.py) with the saved session cookies.
+# SCRAPER_FETCH_MODE: auto (HTTP first, browser when the session is rejected),
+# http (never launch a browser) or browser (always)
+SCRAPER_FETCH_MODE: str = os.getenv('SCRAPER_FETCH_MODE', 'auto')
+# Lead data JSON endpoints, one per TABLE_SOURCES entry; empty parses the PORTAL_URL HTML
+PORTAL_LEADS_API_URLS: list[str] = [u for u in os.getenv('PORTAL_LEADS_API_URLS', '').split(',') if u]
+HTTP_FETCH_TIMEOUT: float = float(os.getenv('HTTP_FETCH_TIMEOUT', '15'))  # seconds per portal request
+# Table fingerprints (fingerprints.py): hours an unchanged table may skip row
+# processing before a full run is forced; 0 always processes every row
+TABLE_FINGERPRINT_MAX_AGE: float = float(os.getenv('TABLE_FINGERPRINT_MAX_AGE', '24'))
+
 # Optional UI selectors with defaults
 SEL_EMAIL_INPUT: str = os.getenv('SEL_EMAIL_INPUT', 'input[type="email"]')
 SEL_NEXT_BTN: str = os.getenv('SEL_NEXT_BTN', 'button[type="submit"]')
@@ -25,6 +44,106 @@ SEL_SIGNIN_BTN: str = os.getenv('SEL_SIGNIN_BTN', 'button[type="submit"]')
 SEL_2FA_INPUT: str = os.getenv('SEL_2FA_INPUT', 'input[type="text"]')
 SEL_VERIFY_BTN: str = os.getenv('SEL_VERIFY_BTN', 'button:has-text("Verify")')
 
+# Database tuning
+SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '15000'))
+SQLITE_SYNCHRONOUS: str = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '0'))  # 0 = use the process type profile
+DB_POOL_RECYCLE: int = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # seconds, server databases only
+INGEST_COPY_THRESHOLD: int = int(os.getenv('INGEST_COPY_THRESHOLD', '200'))  # rows; PostgreSQL COPY
+
+# Scraper run progress: max seconds between buffered ScraperRun writes
+RUN_PROGRESS_FLUSH_INTERVAL: float = float(os.getenv('RUN_PROGRESS_FLUSH_INTERVAL', '5'))
+
+# Retention (days before rows are archived; 0 keeps them forever)
+RETENTION_LEADS_DAYS: int = int(os.getenv('RETENTION_LEADS_DAYS', '365'))
+RETENTION_RUNS_DAYS: int = int(os.getenv('RETENTION_RUNS_DAYS', '90'))
+RETENTION_ATTEMPTS_DAYS: int = int(os.getenv('RETENTION_ATTEMPTS_DAYS', '90'))
+RETENTION_LOGIN_ATTEMPTS_DAYS: int = int(os.getenv('RETENTION_LOGIN_ATTEMPTS_DAYS', '180'))
+RETENTION_SCREENSHOTS_DAYS: int = int(os.getenv('RETENTION_SCREENSHOTS_DAYS', '30'))
+RETENTION_OUTBOX_DAYS: int = int(os.getenv('RETENTION_OUTBOX_DAYS', '30'))  # delivered webhook messages
+RETENTION_BATCH_SIZE: int = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+RETENTION_VACUUM_PAGES: int = int(os.getenv('RETENTION_VACUUM_PAGES', '2000'))
+# Hours between retention passes of the scheduler daemon (0: only `retention.py run`)
+RETENTION_INTERVAL_HOURS: float = float(os.getenv('RETENTION_INTERVAL_HOURS', '24'))
+
+# Bulk export: rows fetched and encoded per chunk
+EXPORT_BATCH_SIZE: int = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+
+# Background jobs (Redis/RQ)
+REDIS_URL: Optional[str] = os.getenv('REDIS_URL')
+SCRAPE_JOB_TIMEOUT: int = int(os.getenv('SCRAPE_JOB_TIMEOUT', '900'))  # seconds
+SCRAPE_RESULT_TTL: int = int(os.getenv('SCRAPE_RESULT_TTL', '86400'))  # seconds
+WORKER_BROWSER_MAX_JOBS: int = int(os.getenv('WORKER_BROWSER_MAX_JOBS', '20'))
+WORKER_BROWSER_MAX_AGE: int = int(os.getenv('WORKER_BROWSER_MAX_AGE', '3600'))  # seconds
+
+# Single-flight scrape lock (Redis when REDIS_URL is set, this file otherwise)
+SCRAPE_LOCK_FILE: str = os.getenv('SCRAPE_LOCK_FILE', '/data/scrape.lock')
+SCRAPE_LOCK_TTL: int = int(os.getenv('SCRAPE_LOCK_TTL', '60'))  # seconds without heartbeat before the lock is stale
+
+# Built-in scheduler (scheduler.py): jittered interval between runs
+SCHEDULE_MIN_INTERVAL: int = int(os.getenv('SCHEDULE_MIN_INTERVAL', '600'))  # seconds
+SCHEDULE_MAX_INTERVAL: int = int(os.getenv('SCHEDULE_MAX_INTERVAL', '1800'))  # seconds
+SCHEDULE_QUIET_HOURS: str = os.getenv('SCHEDULE_QUIET_HOURS', '')  # e.g. "22:00-07:00", empty = none
+SCHEDULE_TIMEZONE: str = os.getenv('SCHEDULE_TIMEZONE', '')  # quiet hours timezone, empty = local time
+SCHEDULE_BACKOFF_MAX: int = int(os.getenv('SCHEDULE_BACKOFF_MAX', '21600'))  # seconds
+
+# Adaptive scheduling: interval per hour/weekday from past lead arrivals
+SCHEDULE_ADAPTIVE: bool = os.getenv('SCHEDULE_ADAPTIVE', 'true').lower() == 'true'
+SCHEDULE_ADAPTIVE_MIN_INTERVAL: int = int(os.getenv('SCHEDULE_ADAPTIVE_MIN_INTERVAL', '300'))  # seconds, hot hours
+SCHEDULE_ADAPTIVE_MAX_INTERVAL: int = int(os.getenv('SCHEDULE_ADAPTIVE_MAX_INTERVAL', '7200'))  # seconds, cold hours
+SCHEDULE_LEARN_DAYS: int = int(os.getenv('SCHEDULE_LEARN_DAYS', '56'))  # history used to learn arrivals
+SCHEDULE_LEARN_MIN_LEADS: int = int(os.getenv('SCHEDULE_LEARN_MIN_LEADS', '30'))  # below this, fixed interval
+
+# Scraper progress events (SSE). EVENT_BACKEND: redis, database or memory;
+# empty picks redis when REDIS_URL is set, database otherwise
+EVENT_BACKEND: str = os.getenv('EVENT_BACKEND', '')
+EVENT_HISTORY: int = int(os.getenv('EVENT_HISTORY', '500'))  # events kept for Last-Event-ID resume
+EVENT_POLL_INTERVAL: float = float(os.getenv('EVENT_POLL_INTERVAL', '1'))  # seconds, database backend
+SSE_MAX_STREAMS: int = int(os.getenv('SSE_MAX_STREAMS', '4'))  # open streams per web process
+SSE_STREAM_SECONDS: int = int(os.getenv('SSE_STREAM_SECONDS', '300'))  # then the browser reconnects
+SSE_HEARTBEAT_SECONDS: int = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+
+# Live lead feed (/leads/feed)
+LEAD_FEED_BUFFER: int = int(os.getenv('LEAD_FEED_BUFFER', '200'))  # queued leads per client before it is dropped
+LEAD_FEED_TOKEN: Optional[str] = os.getenv('LEAD_FEED_TOKEN')  # bearer token for non-browser consumers
+LEAD_FEED_MAX_STREAMS: int = int(os.getenv('LEAD_FEED_MAX_STREAMS', '8'))  # open feed streams per web process
+
+# Outbound HTTP client (http_client.py): pooling, rate limits, circuit breaker
+HTTP_TIMEOUT: float = float(os.getenv('HTTP_TIMEOUT', '10'))  # seconds, when the caller sets none
+HTTP_POOL_SIZE: int = int(os.getenv('HTTP_POOL_SIZE', '10'))  # keep-alive connections per host
+HTTP_MAX_CONCURRENCY: int = int(os.getenv('HTTP_MAX_CONCURRENCY', '4'))  # requests in flight per destination
+HTTP_RATE_LIMIT: float = float(os.getenv('HTTP_RATE_LIMIT', '10'))  # requests/s per destination, 0 = unlimited
+HTTP_RATE_LIMITS: str = os.getenv('HTTP_RATE_LIMITS', '')  # per host overrides: "n8n.example.com=5,..."
+HTTP_BREAKER_FAILURES: int = int(os.getenv('HTTP_BREAKER_FAILURES', '5'))  # consecutive failures, 0 disables
+HTTP_BREAKER_RESET: float = float(os.getenv('HTTP_BREAKER_RESET', '60'))  # seconds before a trial call
+
+# Webhook outbox (outbox.py): delivery retries with exponential backoff
+WEBHOOK_TIMEOUT: float = float(os.getenv('WEBHOOK_TIMEOUT', '10'))  # seconds per delivery
+# Batch mode: POST arrays of up to WEBHOOK_BATCH_SIZE leads (1 = one lead per request)
+WEBHOOK_BATCH_SIZE: int = int(os.getenv('WEBHOOK_BATCH_SIZE', '1'))
+WEBHOOK_BATCH_MAX_BYTES: int = int(os.getenv('WEBHOOK_BATCH_MAX_BYTES', '1000000'))
+OUTBOX_MAX_ATTEMPTS: int = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))  # then dead-lettered
+OUTBOX_BACKOFF_BASE: float = float(os.getenv('OUTBOX_BACKOFF_BASE', '30'))  # seconds before the first retry
+OUTBOX_BACKOFF_MAX: float = float(os.getenv('OUTBOX_BACKOFF_MAX', '3600'))
+OUTBOX_BATCH_SIZE: int = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))  # messages claimed per pass
+OUTBOX_POLL_INTERVAL: float = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_LEASE_SECONDS: int = int(os.getenv('OUTBOX_LEASE_SECONDS', '120'))  # claim lifetime before a retry
+
+# Lead routing (routing.py): JSON rules sending new leads to several webhooks
+# or files; empty sends every new lead to N8N_WEBHOOK_URL
+ROUTING_RULES_FILE: str = os.getenv('ROUTING_RULES_FILE', '')
+
+# JSON API (/api/v1/leads); accepts LEAD_FEED_TOKEN as bearer token too
+API_PAGE_SIZE: int = int(os.getenv('API_PAGE_SIZE', '100'))
+API_MAX_PAGE_SIZE: int = int(os.getenv('API_MAX_PAGE_SIZE', '1000'))
+API_COMPRESS_MIN_BYTES: int = int(os.getenv('API_COMPRESS_MIN_BYTES', '1024'))  # smaller bodies are sent as is
+
+# Dashboard pagination
+DASHBOARD_PAGE_SIZE: int = int(os.getenv('DASHBOARD_PAGE_SIZE', '10'))
+DASHBOARD_COUNT_TTL: float = float(os.getenv('DASHBOARD_COUNT_TTL', '60'))  # seconds
+DASHBOARD_RENDER_CACHE_SIZE: int = int(os.getenv('DASHBOARD_RENDER_CACHE_SIZE', '32'))  # pages, 0 disables
+LEAD_DETAIL_MAX_AGE: int = int(os.getenv('LEAD_DETAIL_MAX_AGE', '3600'))  # seconds browsers reuse /leads/<id>
+
 # Timeouts
 PAGE_TIMEOUT: float = 60.0  # seconds
 AUTH_TIMEOUT: float = 5.0   # seconds for auth prompts
\ No newline at end of file
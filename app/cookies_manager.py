@@ -1,51 +1,243 @@
-"""Cookie management for Tesla authentication bypass."""
+"""Cookie management for Tesla authentication bypass.
+
+Cookies are uploaded by hand (/upload-cookies) and then renewed after
+every successful run from the browser or HTTP session jar
+(`refresh_cookies()`), so the portal session keeps rolling instead of
+expiring:
+  - writes are atomic (temporary file + rename); a reader never sees a
+    partially written file
+  - each cookie keeps its expiry ('expiry', epoch seconds; absent for
+    session cookies) and expired cookies are dropped when loading
+  - the parsed file is cached in memory and re-read when its mtime changes
+  - a warning is logged when the session expires within
+    COOKIES_EXPIRY_WARNING_HOURS
+"""
 import os
 import json
+import tempfile
+import threading
+import time
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 from logger import get_logger
+from config import COOKIES_FILE, COOKIES_EXPIRY_WARNING_HOURS, PORTAL_URL
 
-COOKIES_FILE = "/data/tesla_cookies.json"
 logger = get_logger('COOKIES')
 
-def save_cookies(cookies_dict):
+# Expiry fields of Selenium, Playwright and browser-extension exports
+_EXPIRY_FIELDS = ('expiry', 'expires', 'expirationDate')
+
+# (mtime_ns, size) of COOKIES_FILE and its parsed content
+_cache: Tuple[Optional[Tuple[int, int]], Optional[Dict]] = (None, None)
+_cache_lock = threading.Lock()
+
+def cookie_expiry(cookie: Dict) -> Optional[float]:
+    """Expiry of a cookie (epoch seconds), None for a session cookie."""
+    for field in _EXPIRY_FIELDS:
+        value = cookie.get(field)
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        return value if value > 0 else None
+    return None
+
+def _normalize(cookie: Dict) -> Dict:
+    """Copy of a cookie with its expiry in 'expiry' and a domain."""
+    cookie = {k: v for k, v in cookie.items() if k not in _EXPIRY_FIELDS}
+    if not cookie.get('domain'):
+        cookie['domain'] = urlsplit(PORTAL_URL).hostname
+    cookie.setdefault('path', '/')
+    return cookie
+
+def _identity(cookie: Dict) -> Tuple[str, str, str]:
+    return cookie.get('name'), (cookie.get('domain') or '').lstrip('.'), cookie.get('path') or '/'
+
+def _as_list(cookies) -> List[Dict]:
+    if isinstance(cookies, dict):
+        return [{'name': name, 'value': value} for name, value in cookies.items()]
+    return [c for c in cookies if isinstance(c, dict) and c.get('name')]
+
+def _prepare(cookies) -> List[Dict]:
+    prepared = []
+    for cookie in _as_list(cookies):
+        expiry = cookie_expiry(cookie)
+        cookie = _normalize(cookie)
+        if expiry is not None:
+            cookie['expiry'] = int(expiry)
+        prepared.append(cookie)
+    return prepared
+
+def _read() -> Optional[Dict]:
+    """Parsed COOKIES_FILE, from the cache while its mtime is unchanged."""
+    global _cache
+    try:
+        stat = os.stat(COOKIES_FILE)
+    except OSError:
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if _cache[0] == stamp:
+            return _cache[1]
+    with open(COOKIES_FILE, 'r') as f:
+        data = json.load(f)
+    data['cookies'] = _prepare(data.get('cookies') or [])
+    with _cache_lock:
+        _cache = (stamp, data)
+    return data
+
+def _write(cookies: List[Dict], source: str) -> None:
+    """Replace COOKIES_FILE atomically (readable by the owner only)."""
+    directory = os.path.dirname(COOKIES_FILE) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cookies-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'cookies': cookies,
+                'saved_at': datetime.utcnow().isoformat(),
+                'source': source
+            }, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, COOKIES_FILE)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _valid(cookies: List[Dict], now: float) -> List[Dict]:
+    return [c for c in cookies if c.get('expiry') is None or c['expiry'] > now]
+
+def session_expires_at(cookies: List[Dict]) -> Optional[datetime]:
+    """Earliest expiry among the cookies that have one (UTC)."""
+    expiries = [c['expiry'] for c in cookies if c.get('expiry') is not None]
+    return datetime.utcfromtimestamp(min(expiries)) if expiries else None
+
+def save_cookies(cookies_dict, source: str = 'upload'):
     """
     Save cookies to file.
-    
+
     Args:
         cookies_dict: Dict or list of cookies from browser
+        source: Where the cookies come from (upload, selenium, ...)
+    """
+    cookies = _prepare(cookies_dict)
+    _write(cookies, source)
+    logger.info(f"Cookies sauvegardés: {len(cookies)} cookies")
+
+def refresh_cookies(cookies, source: str) -> bool:
+    """Merge cookies harvested after a successful run into the saved ones.
+
+    Harvested cookies replace saved cookies with the same name, domain and
+    path; other saved cookies (e.g. of another domain the browser was not
+    on) are kept unless expired. A harvested cookie without an expiry
+    (Selenium reports injected cookies as session cookies) keeps the saved
+    cookie's expiry. The file is only rewritten on a change.
+
+    Returns:
+        True if the saved cookies changed
     """
-    with open(COOKIES_FILE, 'w') as f:
-        json.dump({
-            'cookies': cookies_dict,
-            'saved_at': datetime.utcnow().isoformat()
-        }, f, indent=2)
-    logger.info(f"Cookies sauvegardés: {len(cookies_dict)} cookies")
+    harvested = _prepare(cookies)
+    if not harvested:
+        return False
+    try:
+        data = _read()
+    except Exception as e:
+        logger.warning(f"Cookies existants illisibles, remplacés: {e}")
+        data = None
+    saved = data['cookies'] if data else []
+    merged = {_identity(c): c for c in saved}
+    changed = 0
+    for cookie in harvested:
+        key = _identity(cookie)
+        previous = merged.get(key)
+        if previous and 'expiry' not in cookie and previous.get('expiry') is not None:
+            cookie['expiry'] = previous['expiry']
+        if previous != cookie:
+            merged[key] = cookie
+            changed += 1
+    now = time.time()
+    kept = _valid(list(merged.values()), now)
+    if not changed and len(kept) == len(saved):
+        return False
+    _write(kept, source)
+    expires_at = session_expires_at(kept)
+    logger.info(f"Cookies renouvelés ({source}): {changed} mis à jour, {len(kept)} au total"
+                + (f", expiration au plus tôt {expires_at:%Y-%m-%d %H:%M} UTC" if expires_at else ""))
+    return True
+
+def _warn_if_expiring(cookies: List[Dict], now: float) -> None:
+    expires_at = session_expires_at(cookies)
+    if expires_at is None:
+        return
+    hours = (expires_at - datetime.utcfromtimestamp(now)).total_seconds() / 3600
+    if hours <= COOKIES_EXPIRY_WARNING_HOURS:
+        logger.warning(f"Session Tesla: cookies expirant dans {hours:.1f}h "
+                       f"({expires_at:%Y-%m-%d %H:%M} UTC) — un run réussi ou un nouvel envoi les renouvellera")
 
 def load_cookies():
     """
     Load cookies from file.
-    
+
     Returns:
-        List of cookies or None if file doesn't exist
+        List of unexpired cookies or None if file doesn't exist
     """
     if not os.path.exists(COOKIES_FILE):
         logger.warning("Aucun fichier de cookies trouvé")
         return None
-    
+
     try:
-        with open(COOKIES_FILE, 'r') as f:
-            data = json.load(f)
-            cookies = data.get('cookies', [])
-            saved_at = data.get('saved_at', 'unknown')
-            logger.info(f"Cookies chargés: {len(cookies)} cookies (sauvegardés le {saved_at})")
-            return cookies
+        data = _read()
+        if data is None:
+            logger.warning("Aucun fichier de cookies trouvé")
+            return None
+        now = time.time()
+        cookies = _valid(data['cookies'], now)
+        saved_at = data.get('saved_at', 'unknown')
+        expired = len(data['cookies']) - len(cookies)
+        logger.info(f"Cookies chargés: {len(cookies)} cookies (sauvegardés le {saved_at})"
+                    + (f", {expired} expirés ignorés" if expired else ""))
+        _warn_if_expiring(cookies, now)
+        # Copies: callers adjust domains in place, the cache must not change
+        return [dict(c) for c in cookies]
     except Exception as e:
         logger.error(f"Erreur chargement cookies: {e}")
         return None
 
+def cookies_status() -> Dict:
+    """Saved cookies summary for the dashboard."""
+    try:
+        data = _read()
+    except Exception as e:
+        return {'exists': False, 'error': str(e)}
+    if data is None:
+        return {'exists': False}
+    now = time.time()
+    cookies = _valid(data['cookies'], now)
+    expires_at = session_expires_at(cookies)
+    return {
+        'exists': bool(cookies),
+        'count': len(cookies),
+        'saved_at': data.get('saved_at'),
+        'source': data.get('source', 'upload'),
+        'expires_at': expires_at.isoformat() if expires_at else None,
+        'expiring': expires_at is not None and
+                    (expires_at - datetime.utcfromtimestamp(now)).total_seconds() <= COOKIES_EXPIRY_WARNING_HOURS * 3600,
+    }
+
 def cookies_exist():
-    """Check if cookies file exists."""
-    exists = os.path.exists(COOKIES_FILE)
+    """Check if unexpired cookies are saved."""
+    try:
+        data = _read()
+    except Exception:
+        data = None
+    exists = bool(data and _valid(data['cookies'], time.time()))
     logger.debug(f"Cookies existent: {exists}")
     return exists
 
@@ -0,0 +1,65 @@
+"""Data version stamp and render cache for the dashboard.
+
+Every write that changes what the dashboard shows (lead ingestion, run
+progress, retention, scheduler plan) calls `bump()` inside its own
+transaction. Views derive their ETag and Last-Modified from `current()`,
+so an unchanged page costs one primary-key lookup and returns 304, and
+pages rendered for a version are reused from a small LRU cache.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Hashable, Optional, Tuple
+from sqlalchemy import Integer, Text, cast, select, update
+from models import db, AppMeta
+
+DATA_VERSION_KEY = 'data_version'
+
+
+def bump() -> None:
+    """Increment the data version in the caller's transaction (not committed)."""
+    stmt = (update(AppMeta)
+            .where(AppMeta.key == DATA_VERSION_KEY)
+            .values(value=cast(cast(AppMeta.value, Integer) + 1, Text), updated_at=datetime.utcnow()))
+    if db.session.execute(stmt).rowcount == 0:
+        db.session.merge(AppMeta(key=DATA_VERSION_KEY, value='1', updated_at=datetime.utcnow()))
+
+
+def current() -> Tuple[int, Optional[datetime]]:
+    """Return (version, last change time), bypassing the session's identity map."""
+    row = db.session.execute(
+        select(AppMeta.value, AppMeta.updated_at).where(AppMeta.key == DATA_VERSION_KEY)
+    ).first()
+    if row is None:
+        return 0, None
+    return int(row.value), row.updated_at
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered pages."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
@@ -4,18 +4,16 @@ set -euo pipefail
 # Ensure data directory exists
 mkdir -p /data
 
-# Create database tables if they don't exist
-echo "Initializing database tables..."
+# Create or upgrade database tables once per deployment. create_app()
+# records the schema version, so gunicorn workers and jobs skip this step.
+echo "Checking database schema..."
 export PYTHONPATH=/app
 python3 << 'EOF'
-from app_factory import create_app
-from models import db
+from app_factory import create_app, schema_version
 app = create_app()
-with app.app_context():
-    db.create_all()
-    print("Database tables initialized successfully")
+print(f"Database schema ready (version {schema_version()})")
 EOF
 
 echo "Starting web server..."
 export PYTHONPATH=/app
-exec gunicorn --access-logfile - --error-logfile - web:app --bind 0.0.0.0:${PORT:-8000} --workers 1 --threads 2 --timeout 120 --log-level debug
\ No newline at end of file
+exec gunicorn --access-logfile - --error-logfile - web:app --bind 0.0.0.0:${PORT:-8000} --workers 1 --threads ${WEB_THREADS:-8} --timeout 120 --log-level debug
@@ -0,0 +1,242 @@
+"""Cross-process event channels.
+
+Two channels exist: 'scraper' (progress of scrape runs, /scrape-events)
+and 'leads' (newly ingested leads, /leads/feed).
+
+Events are dicts {id, type, ts, data}. Ids increase within a channel, so a
+reader that reconnects with the last id it saw (SSE `Last-Event-ID`)
+receives exactly what it missed, as long as it is still in the history.
+
+Backends:
+  - RedisEventChannel: a capped Redis stream, shared by every process using
+    the same Redis (web workers, RQ workers, scheduler)
+  - DatabaseEventChannel: the ScraperEvent table, polled by readers. Writes
+    go through a background thread so a scraper holding a write transaction
+    never blocks on its own progress messages.
+  - MemoryEventChannel: process-local, for tests and single-process setups
+"""
+import atexit
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+from flask import current_app, has_app_context
+from sqlalchemy import delete, insert, select
+from models import db, ScraperEvent, LeadEvent
+from logger import get_logger
+from config import EVENT_BACKEND, EVENT_HISTORY, EVENT_POLL_INTERVAL, REDIS_URL
+
+logger = get_logger('EVENTS')
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+class MemoryEventChannel:
+    """Process-local channel with a bounded history."""
+
+    def __init__(self, history: int = EVENT_HISTORY):
+        self._events = deque(maxlen=history)
+        self._next_id = 1
+        self._cond = threading.Condition()
+
+    def publish(self, type: str, data: Dict) -> str:
+        with self._cond:
+            event = {'id': str(self._next_id), 'type': type, 'ts': _now(), 'data': data}
+            self._next_id += 1
+            self._events.append(event)
+            self._cond.notify_all()
+        return event['id']
+
+    def recent(self, limit: int) -> List[Dict]:
+        with self._cond:
+            return list(self._events)[-limit:]
+
+    def _after(self, last_id: int) -> List[Dict]:
+        return [e for e in self._events if int(e['id']) > last_id]
+
+    def read(self, last_id: Optional[str], timeout: float) -> List[Dict]:
+        """Events after `last_id`, waiting up to `timeout` seconds for new ones."""
+        after = int(last_id) if last_id and last_id.isdigit() else 0
+        with self._cond:
+            events = self._after(after)
+            if not events:
+                self._cond.wait(timeout)
+                events = self._after(after)
+        return events
+
+
+class DatabaseEventChannel:
+    """Channel stored in an event table (ScraperEvent, LeadEvent).
+
+    Publishing requires an app context (the event is written with that
+    app's engine). Readers poll every EVENT_POLL_INTERVAL seconds and are
+    woken up immediately by writes from their own process.
+    """
+
+    # Events written per transaction by the writer thread
+    BATCH = 100
+
+    def __init__(self, model=ScraperEvent, history: int = EVENT_HISTORY,
+                 poll_interval: float = EVENT_POLL_INTERVAL):
+        self.model = model
+        self.history = history
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue(maxsize=1000)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._written = threading.Condition()
+
+    def _ensure_writer(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._write_loop, name='event-writer', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def publish(self, type: str, data: Dict) -> Optional[str]:
+        if not has_app_context():
+            return None
+        row = {'created_at': datetime.utcnow(), 'type': type, 'data': data}
+        try:
+            self._queue.put_nowait((current_app._get_current_object(), row))
+        except queue.Full:
+            logger.warning("File d'événements pleine — événement ignoré")
+            return None
+        self._ensure_writer()
+        return None  # ids are assigned by the database
+
+    def _write_loop(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.BATCH:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                app = items[0][0]
+                with app.app_context():
+                    with db.engine.begin() as conn:
+                        result = conn.execute(insert(self.model).returning(self.model.id),
+                                              [row for _, row in items])
+                        last_id = max(result.scalars().all())
+                        conn.execute(delete(self.model).where(self.model.id <= last_id - self.history))
+            except Exception as e:
+                logger.error(f"Écriture des événements impossible: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+                with self._written:
+                    self._written.notify_all()
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Wait (bounded) for queued events to be written."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    @staticmethod
+    def _to_event(row) -> Dict:
+        return {'id': str(row.id), 'type': row.type, 'ts': row.created_at.isoformat() + 'Z', 'data': row.data}
+
+    def recent(self, limit: int) -> List[Dict]:
+        stmt = select(self.model).order_by(self.model.id.desc()).limit(limit)
+        with db.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        return [self._to_event(r) for r in reversed(rows)]
+
+    def read(self, last_id: Optional[str], timeout: float) -> List[Dict]:
+        after = int(last_id) if last_id and last_id.isdigit() else 0
+        stmt = (select(self.model).where(self.model.id > after)
+                .order_by(self.model.id).limit(self.BATCH))
+        deadline = time.monotonic() + timeout
+        while True:
+            with db.engine.connect() as conn:
+                rows = conn.execute(stmt).all()
+            if rows or time.monotonic() >= deadline:
+                return [self._to_event(r) for r in rows]
+            with self._written:
+                self._written.wait(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+
+class RedisEventChannel:
+    """Channel stored in a capped Redis stream (XADD / blocking XREAD).
+
+    A stream rather than pub/sub: it keeps ids and history, which
+    Last-Event-ID resume needs, and readers block server-side for new entries.
+    """
+
+    def __init__(self, connection, key: str = 'leads:events', history: int = EVENT_HISTORY):
+        self.connection = connection
+        self.key = key
+        self.history = history
+
+    def publish(self, type: str, data: Dict) -> str:
+        event_id = self.connection.xadd(
+            self.key, {'type': type, 'ts': _now(), 'data': json.dumps(data)},
+            maxlen=self.history, approximate=True
+        )
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+    @staticmethod
+    def _to_event(event_id, fields) -> Dict:
+        decode = lambda v: v.decode() if isinstance(v, bytes) else v
+        fields = {decode(k): decode(v) for k, v in fields.items()}
+        return {'id': decode(event_id), 'type': fields['type'], 'ts': fields['ts'], 'data': json.loads(fields['data'])}
+
+    def recent(self, limit: int) -> List[Dict]:
+        entries = self.connection.xrevrange(self.key, count=limit)
+        return [self._to_event(i, f) for i, f in reversed(entries)]
+
+    def read(self, last_id: Optional[str], timeout: float) -> List[Dict]:
+        response = self.connection.xread({self.key: last_id or '0-0'}, count=100,
+                                         block=max(1, int(timeout * 1000)))
+        return [self._to_event(i, f) for _, entries in response for i, f in entries]
+
+
+# Channel name -> (database model, Redis stream key)
+CHANNELS = {
+    'scraper': (ScraperEvent, 'leads:events'),
+    'leads': (LeadEvent, 'leads:feed'),
+}
+
+_channels: Dict[str, object] = {}
+_channels_lock = threading.Lock()
+
+def get_event_channel(name: str = 'scraper'):
+    """Return the process-wide channel `name` (backend per EVENT_BACKEND)."""
+    if name not in _channels:
+        with _channels_lock:
+            if name not in _channels:
+                model, key = CHANNELS[name]
+                backend = EVENT_BACKEND or ('redis' if REDIS_URL else 'database')
+                if backend == 'redis':
+                    from redis import Redis
+                    _channels[name] = RedisEventChannel(Redis.from_url(REDIS_URL), key)
+                elif backend == 'memory':
+                    _channels[name] = MemoryEventChannel()
+                else:
+                    _channels[name] = DatabaseEventChannel(model)
+    return _channels[name]
+
+def set_event_channel(channel, name: str = 'scraper') -> None:
+    """Replace a channel (used by worker.py and tests)."""
+    _channels[name] = channel
+
+def use_redis(connection) -> None:
+    """Route every channel through `connection` (worker.py)."""
+    for name, (_, key) in CHANNELS.items():
+        set_event_channel(RedisEventChannel(connection, key), name)
+
+def publish(type: str, data: Dict, channel: str = 'scraper') -> None:
+    """Publish an event; failures are logged, never raised to the caller."""
+    try:
+        get_event_channel(channel).publish(type, data)
+    except Exception as e:
+        logger.error(f"Publication de l'événement {type} impossible: {e}")
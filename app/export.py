@@ -0,0 +1,203 @@
+"""Streaming bulk export of leads as CSV, NDJSON or Parquet.
+
+Rows are read with a streaming cursor (`yield_per`) and encoded chunk by
+chunk, so memory stays flat whatever the number of leads. The same
+generators back the `/export/leads.<fmt>` endpoint and the CLI.
+
+Usage:
+    python export.py --format csv --source tesla.com --since 2025-01-01 -o leads.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import select
+from models import db, Lead
+from config import EXPORT_BATCH_SIZE
+
+# Optional: Parquet output requires pyarrow
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PARQUET_AVAILABLE = True
+except Exception:
+    PARQUET_AVAILABLE = False
+
+EXPORT_COLUMNS = ('id', 'source', 'key', 'fetched_at', 'created_at', 'data')
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be produced."""
+    pass
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def iter_lead_rows(source: Optional[str] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None) -> Iterator[tuple]:
+    """Yield raw lead rows (see EXPORT_COLUMNS) ordered by (fetched_at, id).
+
+    Plain column tuples are selected instead of ORM objects so rows never
+    accumulate in the session identity map.
+    """
+    stmt = select(*(getattr(Lead, c) for c in EXPORT_COLUMNS)).order_by(Lead.fetched_at, Lead.id)
+    if source:
+        stmt = stmt.where(Lead.source == source)
+    if since:
+        stmt = stmt.where(Lead.fetched_at >= since)
+    if until:
+        stmt = stmt.where(Lead.fetched_at < until)
+    result = db.session.execute(
+        stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    for partition in result.partitions():
+        yield from partition
+
+
+def iter_csv(rows: Iterator[tuple]) -> Iterator[str]:
+    """Encode rows as CSV, one chunk per EXPORT_BATCH_SIZE rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for i, (lead_id, source, key, fetched_at, created_at, data) in enumerate(rows, 1):
+        writer.writerow([lead_id, source, key, _iso(fetched_at), _iso(created_at),
+                         json.dumps(data, ensure_ascii=False)])
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows: Iterator[tuple]) -> Iterator[str]:
+    """Encode rows as newline-delimited JSON."""
+    chunk = []
+    for lead_id, source, key, fetched_at, created_at, data in rows:
+        chunk.append(json.dumps({
+            'id': lead_id,
+            'source': source,
+            'key': key,
+            'fetched_at': _iso(fetched_at),
+            'created_at': _iso(created_at),
+            'data': data,
+        }, ensure_ascii=False) + '\n')
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def iter_parquet(rows: Iterator[tuple]) -> Iterator[bytes]:
+    """Encode rows as Parquet, one row group per EXPORT_BATCH_SIZE rows.
+
+    `data` is stored as a JSON string column since lead payloads do not
+    share a fixed schema.
+    """
+    if not PARQUET_AVAILABLE:
+        raise ExportError("Parquet export requires pyarrow")
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('source', pyarrow.string()),
+        ('key', pyarrow.string()),
+        ('fetched_at', pyarrow.timestamp('us')),
+        ('created_at', pyarrow.timestamp('us')),
+        ('data', pyarrow.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_batch(batch):
+        columns = list(zip(*batch))
+        columns[5] = [json.dumps(d, ensure_ascii=False) for d in columns[5]]
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema
+        ))
+
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            write_batch(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_batch(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(fmt: str, source: Optional[str] = None, since: Optional[datetime] = None,
+                until: Optional[datetime] = None) -> Iterator:
+    """Return a chunk generator for the requested export format."""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format: {fmt}")
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        raise ExportError("Parquet export requires pyarrow")
+    encoder = {'csv': iter_csv, 'ndjson': iter_ndjson, 'parquet': iter_parquet}[fmt]
+    return encoder(iter_lead_rows(source, since, until))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--source', help='Only export leads from this source table')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='fetched_at >= SINCE')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='fetched_at < UNTIL')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    args = parser.parse_args()
+
+    from app_factory import create_app
+    app = create_app('cli')
+    with app.app_context():
+        chunks = iter_export(args.format, args.source, args.since, args.until)
+        binary = args.format == 'parquet'
+        if args.output:
+            out = open(args.output, 'wb' if binary else 'w', encoding=None if binary else 'utf-8', newline=None if binary else '')
+        else:
+            out = sys.stdout.buffer if binary else sys.stdout
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Table fingerprints: skip the per-row pipeline when the portal is unchanged.
+
+Each scraper computes a cheap fingerprint per table before extracting any
+row: the browser backends hash the table's text in the page
+(`TABLE_HASH_JS`, one call for all tables), the HTTP backend hashes the
+raw table markup or JSON body (`digest()`). The fingerprints of the last
+processed run are stored per source in AppMeta. When every table of a run
+matches, the scraper records an "unchanged" ScraperRun and returns no
+leads, so a steady-state run costs the page load plus one hash.
+
+Fingerprints are saved in the transaction that stores the leads
+(`TableFingerprints.save()` before `ingest_leads()`), so a run failing
+after the fetch never makes the next one skip its rows. A fingerprint
+older than TABLE_FINGERPRINT_MAX_AGE hours is ignored, forcing a full run
+now and then; 0 disables the short-circuit.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import select
+from models import db, AppMeta
+from config import TABLE_FINGERPRINT_MAX_AGE
+
+FINGERPRINT_KEY_PREFIX = 'table_fp:'
+
+# In-page hash of a table's text (53-bit cyrb53, prefixed with the length):
+# only a short string crosses the browser boundary
+TABLE_HASH_JS = """(table) => {
+    const s = table.textContent || '';
+    let h1 = 0xdeadbeef, h2 = 0x41c6ce57;
+    for (let i = 0; i < s.length; i++) {
+        const c = s.charCodeAt(i);
+        h1 = Math.imul(h1 ^ c, 2654435761);
+        h2 = Math.imul(h2 ^ c, 1597334677);
+    }
+    h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+    h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+    return 'js:' + s.length + ':' + (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(16);
+}"""
+
+# Fingerprints of every table of the page, for page.evaluate/execute_script
+ALL_TABLES_HASH_JS = f"Array.from(document.querySelectorAll('table')).map({TABLE_HASH_JS})"
+
+
+def digest(content) -> str:
+    """Fingerprint of raw table content (str or bytes) fetched over HTTP."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return 'sha1:' + hashlib.sha1(content).hexdigest()
+
+
+class TableFingerprints:
+    """Fingerprints of one run's tables, compared with the last processed run."""
+
+    def __init__(self):
+        self.current: Dict[str, str] = {}
+        # Set by the scraper when it skipped the rows of an unchanged run
+        self.skipped = False
+
+    def add(self, source: str, fingerprint: Optional[str]) -> None:
+        if fingerprint:
+            self.current[source] = fingerprint
+
+    def clear(self) -> None:
+        self.current.clear()
+        self.skipped = False
+
+    def unchanged(self) -> bool:
+        """True if every table matches the fingerprint stored for its source."""
+        if TABLE_FINGERPRINT_MAX_AGE <= 0 or not self.current:
+            return False
+        cutoff = datetime.utcnow() - timedelta(hours=TABLE_FINGERPRINT_MAX_AGE)
+        rows = db.session.execute(
+            select(AppMeta.key, AppMeta.value)
+            .where(AppMeta.key.in_([FINGERPRINT_KEY_PREFIX + s for s in self.current]))
+            .where(AppMeta.updated_at >= cutoff)
+        ).all()
+        stored = {key[len(FINGERPRINT_KEY_PREFIX):]: value for key, value in rows}
+        return all(stored.get(source) == fp for source, fp in self.current.items())
+
+    def save(self) -> None:
+        """Store the fingerprints in the caller's transaction (not committed)."""
+        now = datetime.utcnow()
+        for source, fp in self.current.items():
+            db.session.merge(AppMeta(key=FINGERPRINT_KEY_PREFIX + source, value=fp, updated_at=now))
@@ -0,0 +1,124 @@
+"""Header schema registry: cached header maps and schema drift detection.
+
+Normalizing a header (`normalize_key`: NFKD plus several regex passes) is
+done once per distinct raw header list: the compiled header→key mapping
+is cached by the list, so a known table costs one dict lookup per run
+(and per row for JSON objects) instead of normalizing every header.
+
+The last schema seen per source is kept in AppMeta
+('header_schema:<source>': hash of the raw headers, version, headers,
+keys). A header list that differs from it is a schema drift (columns
+added, removed, renamed or reordered): the new schema is stored with the
+next version, a warning is logged and a 'schema_drift' event is published
+on the scraper channel (dashboard log). A drift usually shows a portal
+change well before a run fails on it.
+
+`schema_version()` digests the current schemas of the lead sources; the
+webhook README is only regenerated when it changes (readme.py).
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from sqlalchemy import select
+from models import db, AppMeta
+from utils_text import normalize_key
+from logger import get_logger
+import events
+
+logger = get_logger('SCHEMA')
+
+SCHEMA_KEY_PREFIX = 'header_schema:'
+# Distinct header lists kept compiled; the portal has a handful
+_MAX_COMPILED = 256
+
+_lock = threading.Lock()
+# raw header tuple -> normalized keys
+_compiled: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+# source -> hash of its stored schema, once checked by this process
+_known: Dict[str, str] = {}
+
+
+def header_hash(headers: Sequence[str]) -> str:
+    """Stable identity of a raw header list."""
+    return hashlib.sha1('\x1f'.join(headers).encode('utf-8')).hexdigest()[:16]
+
+
+def compile_headers(headers: Iterable[str]) -> Tuple[str, ...]:
+    """Normalized keys of a raw header list, from the cache when known."""
+    headers = tuple(headers)
+    keys = _compiled.get(headers)
+    if keys is None:
+        keys = tuple(normalize_key(h) for h in headers)
+        with _lock:
+            if len(_compiled) >= _MAX_COMPILED:
+                _compiled.clear()
+            _compiled[headers] = keys
+    return keys
+
+
+def diff_headers(old: Sequence[str], new: Sequence[str]) -> Dict:
+    """Columns added, removed and renamed between two header lists.
+
+    A removed and an added column at the same position count as a rename.
+    """
+    removed = [h for h in old if h not in new]
+    added = [h for h in new if h not in old]
+    renamed = []
+    for header in list(removed):
+        position = list(old).index(header)
+        if position < len(new) and new[position] in added:
+            renamed.append([header, new[position]])
+            removed.remove(header)
+            added.remove(new[position])
+    return {
+        'added': added,
+        'removed': removed,
+        'renamed': renamed,
+        'reordered': not (added or removed or renamed) and list(old) != list(new),
+    }
+
+
+def _stored(source: str) -> Optional[Dict]:
+    # Bypass the identity map: another process may have stored a newer schema
+    value = db.session.execute(
+        select(AppMeta.value).where(AppMeta.key == SCHEMA_KEY_PREFIX + source)
+    ).scalar()
+    try:
+        return json.loads(value) if value else None
+    except ValueError:
+        return None
+
+
+def observe(source: str, headers: Sequence[str]) -> Tuple[str, ...]:
+    """Normalized keys of a table's raw headers; records a schema drift of
+    `source` (committed right away, so it survives a failing run)."""
+    headers = [str(h) for h in headers]
+    keys = compile_headers(headers)
+    digest = header_hash(headers)
+    if _known.get(source) == digest:
+        return keys
+    stored = _stored(source)
+    if stored is None or stored.get('hash') != digest:
+        version = (stored or {}).get('version', 0) + 1
+        db.session.merge(AppMeta(key=SCHEMA_KEY_PREFIX + source, value=json.dumps({
+            'hash': digest, 'version': version, 'headers': headers, 'keys': list(keys)
+        }, ensure_ascii=False)))
+        db.session.commit()
+        if stored is None:
+            logger.info(f"Schéma des en-têtes enregistré pour {source} ({len(headers)} colonnes)")
+        else:
+            drift = diff_headers(stored.get('headers') or [], headers)
+            logger.warning(f"Schéma modifié pour {source} (v{version}): "
+                           f"ajoutées={drift['added']} supprimées={drift['removed']} "
+                           f"renommées={drift['renamed']}" + (" (ordre modifié)" if drift['reordered'] else ""))
+            events.publish('schema_drift', dict(drift, source=source, version=version))
+    with _lock:
+        _known[source] = digest
+    return keys
+
+
+def schema_version(sources: Sequence[str]) -> str:
+    """Digest of the schemas last observed for `sources` in this process."""
+    return header_hash([f"{source}={_known.get(source, '')}" for source in sources])
+
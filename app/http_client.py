@@ -0,0 +1,243 @@
+"""Shared HTTP client for outbound calls (webhooks, emails).
+
+Every outbound request goes through one `HttpClient` per process:
+  - a requests.Session with a keep-alive connection pool
+    (HTTP_POOL_SIZE connections per host), so repeated webhook calls reuse
+    their TCP/TLS connection
+  - a default timeout (HTTP_TIMEOUT) when the caller gives none
+  - per destination (scheme://host:port):
+      * a token-bucket rate limit (HTTP_RATE_LIMIT requests/s, overridden
+        per host with HTTP_RATE_LIMITS="host=rate,...")
+      * at most HTTP_MAX_CONCURRENCY requests in flight
+      * a circuit breaker: after HTTP_BREAKER_FAILURES consecutive
+        failures (connection errors, timeouts, 5xx, 429) calls fail fast
+        with CircuitOpenError for HTTP_BREAKER_RESET seconds, then one
+        trial request decides whether it closes again
+  - `map()` runs calls concurrently on a bounded thread pool; each named
+    pool has its own threads, so a slow destination cannot occupy the
+    workers another one needs
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from logger import get_logger
+from config import (
+    HTTP_TIMEOUT, HTTP_POOL_SIZE, HTTP_MAX_CONCURRENCY, HTTP_RATE_LIMIT, HTTP_RATE_LIMITS,
+    HTTP_BREAKER_FAILURES, HTTP_BREAKER_RESET
+)
+
+logger = get_logger('HTTP')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a destination whose circuit is open."""
+    pass
+
+
+def destination(url: str) -> str:
+    """Rate-limit / breaker key of a URL: scheme://host:port."""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """Parse "host=rate,host2=rate" (rate in requests per second)."""
+    limits = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            host, rate = item.split('=', 1)
+            limits[host.strip()] = float(rate)
+    return limits
+
+
+class RateLimiter:
+    """Token bucket; `acquire()` blocks until a request may start."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one destination."""
+
+    def __init__(self, name: str, failures: int = HTTP_BREAKER_FAILURES, reset: float = HTTP_BREAKER_RESET):
+        self.name = name
+        self.threshold = failures
+        self.reset = reset
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before(self) -> None:
+        """Raise CircuitOpenError if the call must not be made."""
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset:
+                    raise CircuitOpenError(f"Circuit open for {self.name} after {self.failures} failures")
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == HALF_OPEN:
+                if self._trial:
+                    raise CircuitOpenError(f"Circuit half-open for {self.name}, trial call in progress")
+                self._trial = True
+
+    def release(self) -> None:
+        """End a call that got no answer to judge the destination by (it
+        raised before or besides the request), freeing the half-open trial."""
+        with self._lock:
+            self._trial = False
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit refermé pour {self.name}")
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.threshold > 0 and (self.state == HALF_OPEN or self.failures >= self.threshold):
+                if self.state != OPEN:
+                    logger.warning(f"Circuit ouvert pour {self.name} ({self.failures} échecs consécutifs), "
+                                   f"pause de {self.reset:.0f}s")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class _Destination:
+    def __init__(self, name: str, rate: float, concurrency: int):
+        self.limiter = RateLimiter(rate)
+        self.breaker = CircuitBreaker(name)
+        self.slots = threading.BoundedSemaphore(max(concurrency, 1))
+
+
+class HttpClient:
+    """Pooled, rate-limited HTTP client with a circuit breaker per destination."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, max_concurrency: int = HTTP_MAX_CONCURRENCY,
+                 rate: float = HTTP_RATE_LIMIT, rate_limits: Optional[Dict[str, float]] = None,
+                 timeout: float = HTTP_TIMEOUT):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.rate_limits = rate_limits if rate_limits is not None else parse_rate_limits(HTTP_RATE_LIMITS)
+        self.timeout = timeout
+        self._destinations: Dict[str, _Destination] = {}
+        self._lock = threading.Lock()
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+
+    def _destination(self, url: str) -> _Destination:
+        key = destination(url)
+        with self._lock:
+            if key not in self._destinations:
+                host = urlsplit(url).hostname
+                self._destinations[key] = _Destination(key, self.rate_limits.get(host, self.rate),
+                                                       self.max_concurrency)
+            return self._destinations[key]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the pool, limiter and breaker of its destination.
+
+        Raises:
+            CircuitOpenError: The destination's circuit is open
+            requests.RequestException: Connection errors and timeouts
+        """
+        dest = self._destination(url)
+        dest.breaker.before()
+        kwargs.setdefault('timeout', self.timeout)
+        judged = False
+        try:
+            with dest.slots:
+                dest.limiter.acquire()
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.RequestException:
+                    judged = True
+                    dest.breaker.failure()
+                    raise
+            judged = True
+            if response.status_code >= 500 or response.status_code == 429:
+                dest.breaker.failure()
+            else:
+                dest.breaker.success()
+            return response
+        finally:
+            if not judged:
+                dest.breaker.release()
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def _executor(self, pool: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if pool not in self._executors:
+                self._executors[pool] = ThreadPoolExecutor(max_workers=max(self.max_concurrency, 1),
+                                                           thread_name_prefix='http')
+            return self._executors[pool]
+
+    def map(self, fn: Callable, items: Iterable, pool: str = 'default') -> List:
+        """Apply `fn` to items concurrently (at most max_concurrency at a time
+        per pool), in order."""
+        return list(self._executor(pool).map(fn, items))
+
+    def status(self) -> Dict[str, Dict]:
+        """Breaker state per destination."""
+        with self._lock:
+            return {name: {'state': d.breaker.state, 'failures': d.breaker.failures}
+                    for name, d in self._destinations.items()}
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+def get_client() -> HttpClient:
+    """Return the process-wide HTTP client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
+
+def set_client(client: Optional[HttpClient]) -> None:
+    """Replace the HTTP client (used by tests and benchmarks)."""
+    global _client
+    _client = client
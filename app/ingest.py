@@ -0,0 +1,139 @@
+"""Bulk ingestion of scraped leads into the Lead table.
+
+Replaces the per-lead "SELECT then INSERT" loop with one set-based
+operation per batch:
+  - PostgreSQL: COPY into a temporary table, then
+    INSERT ... SELECT ... ON CONFLICT (key) DO NOTHING RETURNING key
+  - SQLite/others: one chunked lookup of existing keys, then a single
+    multi-row INSERT that ignores conflicts
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import db, Lead
+from config import INGEST_COPY_THRESHOLD
+from lead_feed import publish_new_leads
+import data_version
+
+# SQLite caps bound parameters per statement; stay well below it
+_KEY_CHUNK = 500
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def json_safe(value):
+    """Make a lead payload JSON-serializable (datetimes become ISO strings)."""
+    return json.loads(json.dumps(value, default=lambda o: o.isoformat() if isinstance(o, datetime) else str(o)))
+
+
+def lead_record(lead: Dict) -> Dict:
+    """Map a scraped lead dict to Lead column values.
+
+    Lead.data is the lead's 'data' entry when the scraper provides one
+    (Selenium: the row fields), the whole lead dict otherwise.
+    """
+    return {
+        'source': lead['source'],
+        'key': str(lead['key']),
+        'fetched_at': _as_datetime(lead.get('fetched_at')) or datetime.utcnow(),
+        'data': json_safe(lead.get('data', lead)),
+        'created_at': datetime.utcnow(),
+    }
+
+
+def _existing_keys(keys: List[str]) -> set:
+    found = set()
+    for start in range(0, len(keys), _KEY_CHUNK):
+        chunk = keys[start:start + _KEY_CHUNK]
+        found.update(k for (k,) in db.session.query(Lead.key).filter(Lead.key.in_(chunk)))
+    return found
+
+
+def _ingest_generic(records: List[Dict]) -> List[str]:
+    existing = _existing_keys([r['key'] for r in records])
+    fresh = [r for r in records if r['key'] not in existing]
+    if not fresh:
+        return []
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = pg_insert(Lead).on_conflict_do_nothing(index_elements=['key'])
+    elif dialect == 'sqlite':
+        stmt = insert(Lead).prefix_with('OR IGNORE')
+    else:
+        stmt = insert(Lead)
+    db.session.execute(stmt, fresh)
+    return [r['key'] for r in fresh]
+
+
+def _ingest_postgres_copy(records: List[Dict]) -> List[str]:
+    """COPY records into a temp table and merge them in one statement."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for r in records:
+        writer.writerow([r['source'], r['key'], r['fetched_at'].isoformat(),
+                         json.dumps(r['data'], ensure_ascii=False), r['created_at'].isoformat()])
+    buffer.seek(0)
+
+    connection = db.session.connection()
+    raw = connection.connection.dbapi_connection
+    with raw.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS lead_ingest "
+            "(source text, key text, fetched_at timestamp, data jsonb, created_at timestamp) "
+            "ON COMMIT DELETE ROWS"
+        )
+        # Rows of an earlier batch of the same transaction
+        cursor.execute("TRUNCATE lead_ingest")
+        copy_sql = "COPY lead_ingest (source, key, fetched_at, data, created_at) FROM STDIN WITH (FORMAT csv)"
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(copy_sql, buffer)  # psycopg2
+        else:
+            with cursor.copy(copy_sql) as copy:  # psycopg 3
+                copy.write(buffer.getvalue())
+        cursor.execute(
+            "INSERT INTO lead (source, key, fetched_at, data, created_at) "
+            "SELECT source, key, fetched_at, data, created_at FROM lead_ingest "
+            "ON CONFLICT (key) DO NOTHING RETURNING key"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ingest_leads(leads: Iterable[Dict], commit: bool = True) -> List[str]:
+    """Insert leads that are not stored yet.
+
+    Args:
+        leads: Scraped lead dicts with at least source, key and fetched_at
+        commit: Commit the session once the batch is written, then publish
+            the new leads to the live feed (with commit=False the caller
+            does both)
+
+    Returns:
+        Keys of the newly inserted leads
+    """
+    records = {}
+    for lead in leads:
+        record = lead_record(lead)
+        records.setdefault(record['key'], record)  # first occurrence wins
+    records = list(records.values())
+    if not records:
+        return []
+
+    if db.engine.dialect.name == 'postgresql' and len(records) >= INGEST_COPY_THRESHOLD:
+        inserted = _ingest_postgres_copy(records)
+    else:
+        inserted = _ingest_generic(records)
+    if inserted:
+        data_version.bump()
+    if commit:
+        db.session.commit()
+        if inserted:
+            publish_new_leads(inserted)
+    return inserted
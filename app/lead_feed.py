@@ -0,0 +1,172 @@
+"""Live feed of newly ingested leads.
+
+`ingest_leads()` publishes one 'lead' event per new lead on the 'leads'
+event channel once its batch is committed. In each web process a single
+pump thread reads that channel and fans the events out to the clients
+connected to /leads/feed:
+  - every client has its own filters (sources, text match) and field
+    projection
+  - every client has a bounded buffer (LEAD_FEED_BUFFER). A client that
+    falls behind is dropped instead of growing memory; on reconnect it
+    catches up from the channel history with Last-Event-ID.
+"""
+import queue
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from flask import current_app
+from models import db, Lead
+from logger import get_logger
+from config import LEAD_FEED_BUFFER
+import events
+
+logger = get_logger('LEAD_FEED')
+
+CHANNEL = 'leads'
+# Keys looked up per query when publishing
+_KEY_CHUNK = 500
+
+
+def lead_fields(data) -> Dict:
+    """Row fields of a stored lead payload (scraper.py nests them under 'row')."""
+    if isinstance(data, dict) and isinstance(data.get('row'), dict):
+        return data['row']
+    return data if isinstance(data, dict) else {}
+
+
+def publish_new_leads(keys: List[str]) -> None:
+    """Publish committed leads to the feed, in insertion order."""
+    rows = []
+    for start in range(0, len(keys), _KEY_CHUNK):
+        chunk = keys[start:start + _KEY_CHUNK]
+        rows.extend(db.session.query(Lead.id, Lead.source, Lead.key, Lead.fetched_at, Lead.data)
+                    .filter(Lead.key.in_(chunk)))
+    for row in sorted(rows, key=lambda r: r.id):
+        events.publish('lead', {
+            'id': row.id,
+            'source': row.source,
+            'key': row.key,
+            'fetched_at': row.fetched_at.isoformat() if row.fetched_at else None,
+            'fields': lead_fields(row.data),
+        }, channel=CHANNEL)
+
+
+def event_order(event_id: str) -> Tuple[int, ...]:
+    """Sortable form of an event id (integers, or Redis "ms-seq")."""
+    return tuple(int(part) for part in str(event_id).split('-'))
+
+
+class FeedFilter:
+    """Per-client selection and projection of lead events."""
+
+    def __init__(self, sources: Iterable[str] = (), contains: Optional[str] = None,
+                 fields: Iterable[str] = ()):
+        self.sources = set(sources)
+        self.contains = contains.lower() if contains else None
+        self.fields = list(fields)
+
+    @classmethod
+    def from_args(cls, args) -> 'FeedFilter':
+        """Build from query args: ?source=a,b&q=text&fields=f1,f2"""
+        split = lambda name: [v for raw in args.getlist(name) for v in raw.split(',') if v]
+        return cls(split('source'), args.get('q'), split('fields'))
+
+    def matches(self, lead: Dict) -> bool:
+        if self.sources and lead.get('source') not in self.sources:
+            return False
+        if self.contains:
+            text = ' '.join(str(v) for v in lead.get('fields', {}).values()).lower()
+            if self.contains not in text and self.contains not in str(lead.get('key', '')).lower():
+                return False
+        return True
+
+    def project(self, lead: Dict) -> Dict:
+        if not self.fields:
+            return lead
+        fields = lead.get('fields', {})
+        return dict(lead, fields={f: fields[f] for f in self.fields if f in fields})
+
+
+class FeedClient:
+    """A connected consumer with a bounded buffer."""
+
+    def __init__(self, filters: FeedFilter, maxsize: int = LEAD_FEED_BUFFER):
+        self.filters = filters
+        self.dropped = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def offer(self, event: Dict) -> bool:
+        """Queue `event` if it matches; False if the buffer overflowed."""
+        if self.dropped or not self.filters.matches(event['data']):
+            return True
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LeadFeedHub:
+    """Fan-out of the 'leads' channel to the clients of this process."""
+
+    def __init__(self, channel_name: str = CHANNEL, buffer: int = LEAD_FEED_BUFFER):
+        self.channel_name = channel_name
+        self.buffer = buffer
+        self.clients = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def channel(self):
+        return events.get_event_channel(self.channel_name)
+
+    def subscribe(self, filters: FeedFilter) -> FeedClient:
+        """Register a client; must be called inside an app context."""
+        client = FeedClient(filters, self.buffer)
+        with self._lock:
+            self.clients.add(client)
+            if self._thread is None:
+                app = current_app._get_current_object()
+                with app.app_context():
+                    latest = self.channel.recent(1)
+                self._thread = threading.Thread(target=self._pump, args=(app, latest[-1]['id'] if latest else None),
+                                                name='lead-feed', daemon=True)
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client: FeedClient) -> None:
+        with self._lock:
+            self.clients.discard(client)
+
+    def _pump(self, app, cursor: Optional[str]) -> None:
+        while True:
+            try:
+                with app.app_context():
+                    batch = self.channel.read(cursor, 1.0)
+            except Exception as e:
+                logger.error(f"Lecture du flux de leads impossible: {e}")
+                threading.Event().wait(1.0)
+                continue
+            for event in batch:
+                cursor = event['id']
+                with self._lock:
+                    clients = list(self.clients)
+                for client in clients:
+                    if not client.offer(event):
+                        logger.warning("Client du flux de leads trop lent — déconnecté")
+                        self.unsubscribe(client)
+
+
+_hub: Optional[LeadFeedHub] = None
+
+def get_hub() -> LeadFeedHub:
+    global _hub
+    if _hub is None:
+        _hub = LeadFeedHub()
+    return _hub
@@ -1,9 +1,10 @@
 """Logging configuration for the application."""
 import logging
+import logging.handlers
 import os
 import sys
 from typing import Optional
-from config import LOG_FILE
+from config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT
 
 def get_logger(name: str, log_to_file: bool = True) -> logging.Logger:
     """
@@ -32,11 +33,13 @@ def get_logger(name: str, log_to_file: bool = True) -> logging.Logger:
         console_handler.setFormatter(formatter)
         logger.addHandler(console_handler)
         
-        # File handler (optional)
+        # File handler (optional), rotated so LOG_FILE stays bounded
         if log_to_file:
             try:
                 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-                file_handler = logging.FileHandler(LOG_FILE)
+                file_handler = logging.handlers.RotatingFileHandler(
+                    LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+                )
                 file_handler.setFormatter(formatter)
                 logger.addHandler(file_handler)
             except Exception as e:
@@ -4,38 +4,49 @@ from typing import Dict, List, Set
 from datetime import datetime
 from flask import Flask
 from logger import get_logger
-from scraper import fetch_leads, random_delay, log_scraper_attempt
+from scraper import log_scraper_attempt
+from scraper_http import fetch_leads
 from state import load_state, save_state
-from notifier import post_to_n8n, NotificationError
-from readme import generate_readme
+import routing
+import outbox
+from readme import generate_readme, readme_current
+from header_schema import schema_version
 from auth import AuthenticationError
-from config import README_FILE
-from models import db, Lead
+from config import README_FILE, TABLE_SOURCES
+from ingest import ingest_leads
+from fingerprints import TableFingerprints
+from models import db
 from app_factory import create_app
-web_app = create_app()
+from single_flight import get_coordinator
 
-def main() -> None:
-    """Main execution flow."""
-    # Initialize logger
-    logger = get_logger(__name__)
-    
-    # Random delay before each attempt
-    random_delay()
-    
+def run(logger) -> Dict:
+    """Run one scrape: fetch and store new leads, and queue them for n8n.
+
+    Must be called inside an app context.
+
+    Returns:
+        Result summary with status, message and leads_count
+    """
     # Start run
     logger.info("Tentative de connexion...")
     
     try:
         # Fetch leads
-        leads = fetch_leads(logger)
+        fingerprints = TableFingerprints()
+        leads = fetch_leads(logger, fingerprints)
         logger.info("Connexion réussie et page chargée.")
         log_scraper_attempt(success=True)
+
+        # Same tables as the last processed run: nothing to compare or store
+        if fingerprints.skipped:
+            logger.info("Tableaux inchangés depuis le dernier run — traitement des lignes ignoré")
+            return {'status': 'success', 'message': 'Tables unchanged', 'leads_count': 0, 'unchanged': True}
         
         # Load seen keys
         state = load_state()
         seen_keys: Set[str] = set(state.get('seen_keys', []))
-        new_leads_count = 0
-        
+        new_leads = []
+
         # Process leads
         for lead in leads:
             # Log all leads
@@ -43,48 +54,64 @@ def main() -> None:
                 f"Lead détecté [{lead['source']}] (row {lead['row_index']}) "
                 f"key={lead['key']} -> {lead['row']}"
             )
-
-            # Send new leads to webhook
             if lead['key'] not in seen_keys:
-                try:
-                    post_to_n8n(lead, logger)
-                    seen_keys.add(lead['key'])
-                    new_leads_count += 1
-                except NotificationError as e:
-                    logger.error(str(e))
+                new_leads.append(lead)
+
+        # New leads are queued for their destinations (routing.py) in the
+        # same transaction that stores them; outbox dispatchers deliver them
+        handled = []
+        if routing.enabled():
+            queued, handled = routing.queue_leads(new_leads, logger)
+        else:
+            queued = 0
+            if new_leads:
+                logger.warning("N8N_WEBHOOK_URL non configuré — nouveaux leads non envoyés")
+        # Fingerprints are stored with the leads, so a run failing before
+        # this point never makes the next one skip its rows
+        fingerprints.save()
+        stored = ingest_leads(leads)
+        db.session.commit()  # ingest_leads does not commit an empty page
+        outbox.wake()
+        logger.info(f"{len(stored)} nouveaux leads enregistrés en base")
 
-        # Save updated state and store leads in database
+        # Save updated state once the leads are safely queued; leads that
+        # could not be queued are offered again by the next run
+        seen_keys.update(lead['key'] for lead in handled)
         state['seen_keys'] = list(seen_keys)
         save_state(state)
 
-        with web_app.app_context():
-            for lead_data in leads:
-                existing_lead = Lead.query.filter_by(key=lead_data['key']).first()
-                if not existing_lead:
-                    lead = Lead(
-                        source=lead_data['source'],
-                        key=lead_data['key'],
-                        fetched_at=datetime.fromisoformat(lead_data['fetched_at']),
-                        data=lead_data
-                    )
-                    db.session.add(lead)
-            db.session.commit()
-
-        # Generate/update README if we have leads
+        # Regenerate the README only when the table schema changed
         if leads:
-            generate_readme(leads[0], README_FILE, logger)
+            version = schema_version(TABLE_SOURCES)
+            if not readme_current(README_FILE, version):
+                generate_readme(leads[0], README_FILE, logger, version)
 
-        logger.info(f"Run terminé. Nouveaux leads envoyés : {new_leads_count}")
+        logger.info(f"Run terminé. Nouveaux leads en file d'envoi : {queued}")
+        return {'status': 'success', 'message': f'{len(leads)} leads fetched', 'leads_count': len(stored)}
 
     except AuthenticationError as e:
         error_msg = f"Erreur d'authentification: {str(e)}"
         logger.error(error_msg)
         log_scraper_attempt(success=False, error=error_msg)
-        sys.exit(1)
+        return {'status': 'failed', 'message': error_msg, 'leads_count': 0}
     except Exception as e:
         error_msg = f"Erreur inattendue: {str(e)}"
         logger.error(error_msg)
         log_scraper_attempt(success=False, error=error_msg)
+        return {'status': 'failed', 'message': error_msg, 'leads_count': 0}
+
+def main() -> None:
+    """Run one scrape now; `scheduler.py` runs them periodically."""
+    # Initialize logger
+    logger = get_logger(__name__)
+    
+    web_app = create_app('cli')
+    with web_app.app_context():
+        # Attach to a scrape already started from the dashboard or a worker
+        result = get_coordinator().run(run, logger)
+        if result.get('coalesced'):
+            logger.info(f"Scrape déjà en cours, résultat repris: {result['status']} - {result['message']}")
+    if result['status'] != 'success':
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import JSONB
 
 db = SQLAlchemy()
 
@@ -11,9 +12,17 @@ class Lead(db.Model):
     source = db.Column(db.String(50))
     key = db.Column(db.String(50), unique=True)
     fetched_at = db.Column(db.DateTime)
-    data = db.Column(db.JSON)
+    data = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Composite index backing keyset pagination on the dashboard
+        db.Index('ix_lead_fetched_at_id', 'fetched_at', 'id'),
+        # Containment queries on the lead payload (PostgreSQL only)
+        db.Index('ix_lead_data_gin', 'data', postgresql_using='gin',
+                 postgresql_ops={'data': 'jsonb_path_ops'}).ddl_if(dialect='postgresql'),
+    )
+
 class ScraperAttempt(db.Model):
     """Model to track scraper connection attempts to Tesla."""
     id = db.Column(db.Integer, primary_key=True)
@@ -47,4 +56,50 @@ class ScraperRun(db.Model):
     phase_extraction = db.Column(db.String(120))
     screenshot_path = db.Column(db.String(256), nullable=True)
     status = db.Column(db.String(32), default='pending')  # success, failed, pending
-    details = db.Column(db.Text, nullable=True)
\ No newline at end of file
+    details = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (db.Index('ix_scraper_run_timestamp_id', 'timestamp', 'id'),)
+
+
+class ScraperEvent(db.Model):
+    """Scraper progress event shared between processes (events.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    type = db.Column(db.String(32))
+    data = db.Column(db.JSON)
+
+
+class LeadEvent(db.Model):
+    """Newly ingested lead, published to the live lead feed (lead_feed.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    type = db.Column(db.String(32))
+    data = db.Column(db.JSON)
+
+
+class OutboxMessage(db.Model):
+    """Outbound webhook message and its delivery state (outbox.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    kind = db.Column(db.String(32))
+    # Identifies the message within its kind (lead key); enqueued only once
+    dedup_key = db.Column(db.String(128), nullable=True)
+    payload = db.Column(db.JSON)
+    # pending -> delivered, or dead once retries are exhausted
+    status = db.Column(db.String(16), default='pending')
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_outbox_status_due', 'status', 'next_attempt_at'),
+        db.Index('ix_outbox_kind_key', 'kind', 'dedup_key', unique=True),
+    )
+
+
+class AppMeta(db.Model):
+    """Key/value store for application bookkeeping (schema version, ...)."""
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
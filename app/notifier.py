@@ -1,39 +1,237 @@
-"""Notification module for sending leads to n8n webhook."""
-from typing import Dict
+"""Notification module for sending leads and emails to n8n webhook.
+
+Nothing is posted from the code that produces a notification:
+`queue_leads()` and `queue_email()` add it to the webhook outbox and the
+outbox dispatcher calls `post_to_n8n()` (or `post_leads_to_n8n()` in batch
+mode, WEBHOOK_BATCH_SIZE > 1) and `send_email()`. Webhooks of routed
+destinations (routing.py) go through `post_lead()` / `post_leads()`.
+
+Batch mode posts a JSON array of leads. A receiver may report per-lead
+results by answering
+    {"results": [{"key": "<lead key>", "ok": false, "status": 422, "error": "..."}]}
+(leads missing from `results` count as delivered). A receiver that
+rejects arrays (400, 404, 405, 415, 422) gets single-lead posts instead.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional
+import json
 import logging
-import requests
-from config import N8N_WEBHOOK_URL
+from http_client import get_client, destination, CircuitOpenError
+from config import N8N_WEBHOOK_URL, WEBHOOK_TIMEOUT, WEBHOOK_BATCH_SIZE, WEBHOOK_BATCH_MAX_BYTES
+from ingest import json_safe
+import outbox
 
 class NotificationError(Exception):
-    """Raised when notification fails."""
-    pass
+    """Raised when notification fails.
+
+    `permanent` is set for errors a retry cannot fix (4xx other than
+    408/429); the outbox dead-letters those right away. `deferred` is set
+    when the call was not even tried (open circuit); it does not count as
+    a delivery attempt.
+    """
+    def __init__(self, message: str, status_code: int = None, deferred: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.permanent = status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+        self.deferred = deferred
+
+# Statuses meaning "this endpoint does not take arrays"
+BATCH_REJECTED_STATUSES = (404, 405, 415)
+# Statuses that may be the array or the leads in it: the batch is retried
+# lead by lead and the URL only marked if every single post then goes through
+BATCH_INVALID_STATUSES = (400, 422)
+# Webhook URLs that rejected a batch; they get single posts until restart
+_batch_unsupported = set()
+
+def queue_leads(leads: Iterable[Dict], kind: str = 'lead') -> int:
+    """Add leads to the webhook outbox, in the caller's transaction.
+
+    Args:
+        leads: Leads to send
+        kind: Outbox kind, 'lead' for N8N_WEBHOOK_URL or the kind of a
+            routed destination
+
+    Returns:
+        Number of leads queued (a lead already queued once is skipped)
+    """
+    return outbox.enqueue(kind, ((str(lead['key']), json_safe(lead)) for lead in leads))
+
+def queue_email(payload: Dict, dedup_key: Optional[str] = None) -> int:
+    """Add an email (to, subject, text, html) to the outbox, in the caller's transaction."""
+    return outbox.enqueue('email', [(dedup_key, payload)])
+
+def send_email(payload: Dict, logger: logging.Logger) -> None:
+    """Send an email through the n8n webhook (outbox sender for 'email').
+
+    Raises:
+        NotificationError: If the webhook is not configured, unreachable or
+            answers with a non-2xx status
+    """
+    if not N8N_WEBHOOK_URL:
+        raise NotificationError("N8N_WEBHOOK_URL environment variable not set")
+    try:
+        response = get_client().post(N8N_WEBHOOK_URL, json=payload, timeout=WEBHOOK_TIMEOUT)
+    except CircuitOpenError as e:
+        raise NotificationError(f"Email not sent: {e}", deferred=True)
+    except Exception as e:
+        raise NotificationError(f"Failed to send email to {payload.get('to')}: {str(e)}")
+    if response.status_code >= 300:
+        raise NotificationError(
+            f"Webhook returned non-success status {response.status_code} for email to {payload.get('to')}",
+            status_code=response.status_code
+        )
+    logger.info(f"Email « {payload.get('subject')} » envoyé à {payload.get('to')}")
 
 def post_to_n8n(payload: Dict, logger: logging.Logger) -> None:
     """Post lead data to n8n webhook.
-    
+
     Args:
-        payload: Lead data to send
+        payload: Lead data to send (JSON-serializable)
         logger: Logger instance for recording results
-        
+
     Raises:
-        NotificationError: If webhook call fails
+        NotificationError: If the webhook is not configured, unreachable or
+            answers with a non-2xx status
     """
     if not N8N_WEBHOOK_URL:
         raise NotificationError("N8N_WEBHOOK_URL environment variable not set")
-        
+    post_lead(N8N_WEBHOOK_URL, payload, logger)
+
+def post_lead(url: str, payload: Dict, logger: logging.Logger) -> None:
+    """Post lead data to a webhook URL.
+
+    Raises:
+        NotificationError: If the webhook is unreachable or answers with a
+            non-2xx status
+    """
     try:
-        response = requests.post(
-            N8N_WEBHOOK_URL,
+        response = get_client().post(
+            url,
             json=payload,
-            timeout=10
+            timeout=WEBHOOK_TIMEOUT
+        )
+    except CircuitOpenError as e:
+        raise NotificationError(f"Lead {payload['key']} not sent: {e}", deferred=True)
+    except Exception as e:
+        raise NotificationError(f"Failed to send lead {payload['key']}: {str(e)}")
+
+    if response.status_code >= 300:
+        raise NotificationError(
+            f"Webhook returned non-success status {response.status_code} for lead {payload['key']}: "
+            f"{response.text[:200]}",
+            status_code=response.status_code
         )
-        
-        if response.status_code >= 300:
-            logger.warning(
-                f"Webhook returned non-success status {response.status_code}: {response.text}"
+    logger.info(f"Lead {payload['key']} sent successfully to webhook")
+
+def iter_batches(payloads: List[Dict], size: int = WEBHOOK_BATCH_SIZE,
+                 max_bytes: int = WEBHOOK_BATCH_MAX_BYTES) -> Iterator[List[int]]:
+    """Split payloads into batches of indexes of at most `size` items and
+    about `max_bytes` of JSON (a single larger payload gets its own batch)."""
+    batch, batch_bytes = [], 2
+    for index, payload in enumerate(payloads):
+        item_bytes = len(json.dumps(payload, ensure_ascii=False).encode()) + 1
+        if batch and (len(batch) >= size or batch_bytes + item_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 2
+        batch.append(index)
+        batch_bytes += item_bytes
+    if batch:
+        yield batch
+
+def _batch_results(response, payloads: List[Dict]) -> List[Optional[NotificationError]]:
+    """Per-lead errors from a 2xx batch response."""
+    try:
+        results = response.json().get('results')
+    except (ValueError, AttributeError):
+        results = None
+    errors: List[Optional[NotificationError]] = [None] * len(payloads)
+    if not isinstance(results, list):
+        return errors
+    positions = {str(p['key']): i for i, p in enumerate(payloads)}
+    for position, result in enumerate(results):
+        if not isinstance(result, dict) or result.get('ok', True):
+            continue
+        index = positions.get(str(result.get('key')), position if 'key' not in result else None)
+        if index is not None and index < len(payloads):
+            errors[index] = NotificationError(
+                f"Webhook rejected lead {payloads[index]['key']}: {result.get('error', 'no reason given')}",
+                status_code=result.get('status')
             )
-        else:
-            logger.info(f"Lead {payload['key']} sent successfully to webhook")
-            
+    return errors
+
+def post_leads_to_n8n(payloads: List[Dict], logger: logging.Logger,
+                      size: int = WEBHOOK_BATCH_SIZE,
+                      max_bytes: int = WEBHOOK_BATCH_MAX_BYTES) -> List[Optional[NotificationError]]:
+    """Post leads to the n8n webhook in batches.
+
+    Args:
+        payloads: Lead data to send (JSON-serializable)
+        logger: Logger instance for recording results
+        size: Maximum leads per request
+        max_bytes: Approximate maximum request body size
+
+    Returns:
+        One entry per payload: None if delivered, else its NotificationError
+    """
+    if not N8N_WEBHOOK_URL:
+        return [NotificationError("N8N_WEBHOOK_URL environment variable not set")] * len(payloads)
+    return post_leads(N8N_WEBHOOK_URL, payloads, logger, size, max_bytes)
+
+def post_leads(url: str, payloads: List[Dict], logger: logging.Logger,
+               size: int = WEBHOOK_BATCH_SIZE,
+               max_bytes: int = WEBHOOK_BATCH_MAX_BYTES) -> List[Optional[NotificationError]]:
+    """Post leads to a webhook URL in batches (see `post_leads_to_n8n()`)."""
+    def send(indexes: List[int]) -> List[Optional[NotificationError]]:
+        batch = [payloads[i] for i in indexes]
+        if len(batch) > 1 and url not in _batch_unsupported:
+            return _post_batch(url, batch, logger)
+        return _post_each(url, batch, logger)
+
+    # Batches (or single leads) go out concurrently, on the worker pool of
+    # this URL's destination so other destinations never wait on it
+    errors: List[Optional[NotificationError]] = [None] * len(payloads)
+    batches = list(iter_batches(payloads, size, max_bytes))
+    for indexes, outcomes in zip(batches, get_client().map(send, batches, pool=destination(url))):
+        for i, error in zip(indexes, outcomes):
+            errors[i] = error
+    return errors
+
+def _post_each(url: str, payloads: List[Dict], logger: logging.Logger) -> List[Optional[NotificationError]]:
+    outcomes = []
+    for payload in payloads:
+        try:
+            post_lead(url, payload, logger)
+            outcomes.append(None)
+        except NotificationError as e:
+            outcomes.append(e)
+    return outcomes
+
+def _post_batch(url: str, batch: List[Dict], logger: logging.Logger) -> List[Optional[NotificationError]]:
+    try:
+        response = get_client().post(url, json=batch, timeout=WEBHOOK_TIMEOUT)
+    except CircuitOpenError as e:
+        return [NotificationError(f"Batch of {len(batch)} leads not sent: {e}", deferred=True)] * len(batch)
     except Exception as e:
-        raise NotificationError(f"Failed to send lead {payload['key']}: {str(e)}")
\ No newline at end of file
+        return [NotificationError(f"Failed to send batch of {len(batch)} leads: {str(e)}")] * len(batch)
+
+    if response.status_code in BATCH_REJECTED_STATUSES:
+        _batch_unsupported.add(url)
+        logger.warning(f"Webhook refuse les lots (HTTP {response.status_code}) — envoi lead par lead")
+        return _post_each(url, batch, logger)
+    if response.status_code in BATCH_INVALID_STATUSES or response.status_code == 413:
+        outcomes = _post_each(url, batch, logger)
+        if response.status_code != 413 and all(e is None for e in outcomes):
+            _batch_unsupported.add(url)
+            logger.warning(f"Webhook refuse les lots (HTTP {response.status_code}) mais accepte les leads seuls "
+                           f"— envoi lead par lead")
+        return outcomes
+    if response.status_code >= 300:
+        error = NotificationError(
+            f"Webhook returned non-success status {response.status_code} for a batch of {len(batch)} leads: "
+            f"{response.text[:200]}",
+            status_code=response.status_code
+        )
+        return [error] * len(batch)
+    errors = _batch_results(response, batch)
+    logger.info(f"Lot de {len(batch)} leads envoyé au webhook "
+                f"({sum(e is None for e in errors)} acceptés)")
+    return errors
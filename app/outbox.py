@@ -0,0 +1,353 @@
+"""Durable outbox for webhook deliveries.
+
+Messages are written to the OutboxMessage table in the same transaction
+as the data they describe (a new lead is stored and queued together), and
+a background dispatcher delivers them. Scraping therefore never waits on
+n8n, and a message survives n8n being slow or down, or a restart:
+  - a failed delivery is retried after an exponential backoff with jitter
+    (OUTBOX_BACKOFF_BASE doubling up to OUTBOX_BACKOFF_MAX)
+  - after OUTBOX_MAX_ATTEMPTS, or a permanent error (4xx), the message is
+    dead-lettered and kept until retried by hand
+  - calls skipped by an open circuit breaker (http_client.py) are
+    rescheduled without counting as an attempt
+  - a dispatcher claims messages with a lease (OUTBOX_LEASE_SECONDS), so
+    several dispatchers can run and a crashed one only delays delivery; the
+    lease is renewed while a pass is still sending (timeouts on a slow
+    destination can outlast it)
+
+Senders are registered per message kind and receive (payload, logger).
+A kind may also have a batch sender, which receives the list of claimed
+payloads and returns one error (or None) per payload. A dispatcher only
+claims the kinds it has senders for; routed lead destinations
+(routing.py) each get their own kind and dispatcher, so a slow
+destination only delays its own queue.
+
+Usage:
+    python outbox.py                # dispatch until SIGTERM/SIGINT
+    python outbox.py --once         # one pass over due messages
+    python outbox.py --dead         # list dead-lettered messages
+    python outbox.py --retry 12 15  # requeue dead messages ('all' for every one)
+"""
+import argparse
+import json
+import logging
+import random
+import signal
+import sys
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import db, OutboxMessage
+from logger import get_logger
+from http_client import get_client
+from config import (
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX, OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL, OUTBOX_LEASE_SECONDS, WEBHOOK_BATCH_SIZE
+)
+
+PENDING, DELIVERED, DEAD = 'pending', 'delivered', 'dead'
+# Longest last_error kept on a message
+MAX_ERROR_LENGTH = 1000
+
+# Set by enqueue() so a dispatcher in the same process starts right away
+_wakeup = threading.Event()
+
+
+def enqueue(kind: str, messages: Iterable[Tuple[Optional[str], Dict]]) -> int:
+    """Add messages to the outbox in the caller's transaction (not committed).
+
+    Args:
+        kind: Message kind, selects the sender
+        messages: (dedup_key, payload) pairs. A dedup_key already present
+            for this kind is skipped, so re-running a step never sends twice.
+
+    Returns:
+        Number of messages added
+    """
+    now = datetime.utcnow()
+    rows = {}
+    for dedup_key, payload in messages:
+        rows.setdefault(dedup_key if dedup_key is not None else object(), {
+            'created_at': now, 'kind': kind, 'dedup_key': dedup_key, 'payload': payload,
+            'status': PENDING, 'attempts': 0, 'next_attempt_at': now,
+        })
+    if not rows:
+        return 0
+    keys = [k for k in rows if isinstance(k, str)]
+    existing = set()
+    for start in range(0, len(keys), 500):
+        existing.update(db.session.scalars(
+            select(OutboxMessage.dedup_key)
+            .where(OutboxMessage.kind == kind, OutboxMessage.dedup_key.in_(keys[start:start + 500]))
+        ))
+    fresh = [row for key, row in rows.items() if key not in existing]
+    if not fresh:
+        return 0
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = pg_insert(OutboxMessage).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        stmt = insert(OutboxMessage).prefix_with('OR IGNORE')
+    else:
+        stmt = insert(OutboxMessage)
+    db.session.execute(stmt, fresh)
+    return len(fresh)
+
+
+def wake() -> None:
+    """Start the next dispatch pass of this process now (after a commit)."""
+    _wakeup.set()
+
+
+def backoff(attempts: int, rng: random.Random = random) -> float:
+    """Delay (s) before the next try after `attempts` failures.
+
+    Exponential with "equal jitter": half the delay is fixed, half random,
+    so retries of messages that failed together spread out.
+    """
+    delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class OutboxDispatcher:
+    """Deliver due outbox messages with their kind's sender."""
+
+    def __init__(self, app, senders: Optional[Dict[str, Callable]] = None,
+                 logger: Optional[logging.Logger] = None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 rng: random.Random = None, batch_senders: Optional[Dict[str, Callable]] = None,
+                 name: str = 'outbox'):
+        self.app = app
+        self.name = name
+        self.senders = senders if senders is not None else default_senders()
+        self.batch_senders = batch_senders if batch_senders is not None else default_batch_senders()
+        self.logger = logger or get_logger('OUTBOX')
+        self.batch_size = batch_size
+        self.rng = rng or random.Random()
+        self._thread = None
+
+    def claim(self) -> List:
+        """Lease up to batch_size due messages to this dispatcher.
+
+        The lease moves next_attempt_at forward, so other dispatchers skip
+        the messages; it expires if this one dies mid-delivery.
+        """
+        now = datetime.utcnow()
+        due = (select(OutboxMessage.id)
+               .where(OutboxMessage.status == PENDING, OutboxMessage.next_attempt_at <= now,
+                      OutboxMessage.kind.in_(list(self.senders)))
+               .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+               .limit(self.batch_size))
+        if db.engine.dialect.name == 'postgresql':
+            due = due.with_for_update(skip_locked=True)
+        stmt = (update(OutboxMessage)
+                .where(OutboxMessage.id.in_(due.scalar_subquery()), OutboxMessage.next_attempt_at <= now)
+                .values(next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+                .returning(OutboxMessage.id, OutboxMessage.kind, OutboxMessage.payload, OutboxMessage.attempts))
+        rows = db.session.execute(stmt).all()
+        db.session.commit()
+        return sorted(rows, key=lambda r: r.id)
+
+    def outcome(self, message, error: Optional[Exception]) -> Dict:
+        """Column updates for a delivery attempt that ended with `error` (None: delivered)."""
+        attempts = message.attempts + 1
+        if error is None:
+            return {'status': DELIVERED, 'attempts': attempts, 'delivered_at': datetime.utcnow(),
+                    'last_error': None}
+        text = str(error)[:MAX_ERROR_LENGTH]
+        if getattr(error, 'deferred', False):
+            # Not attempted (destination circuit open): wait without using up a try
+            delay = backoff(max(message.attempts, 1), self.rng)
+            return {'last_error': text, 'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)}
+        if getattr(error, 'permanent', False) or attempts >= OUTBOX_MAX_ATTEMPTS:
+            self.logger.error(f"Message {message.kind} #{message.id} abandonné après "
+                              f"{attempts} tentative(s): {text}")
+            return {'status': DEAD, 'attempts': attempts, 'last_error': text}
+        delay = backoff(attempts, self.rng)
+        self.logger.warning(f"Échec d'envoi {message.kind} #{message.id} (tentative {attempts}), "
+                            f"nouvel essai dans {delay:.0f}s: {text}")
+        return {'attempts': attempts, 'last_error': text,
+                'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)}
+
+    def send(self, message) -> Optional[Exception]:
+        """Send one claimed message; return its error, or None once delivered."""
+        try:
+            self.senders[message.kind](message.payload, self.logger)
+            return None
+        except Exception as e:
+            return e
+
+    def send_batch(self, messages: List) -> List[Optional[Exception]]:
+        """Send claimed messages of one kind with its batch sender."""
+        try:
+            return self.batch_senders[messages[0].kind]([m.payload for m in messages], self.logger)
+        except Exception as e:
+            return [e] * len(messages)
+
+    def _record(self, message, error: Optional[Exception], counts: Dict[str, int]) -> None:
+        outcome = self.outcome(message, error)
+        db.session.execute(update(OutboxMessage).where(OutboxMessage.id == message.id).values(**outcome))
+        counts[{DELIVERED: 'delivered', DEAD: 'dead'}.get(outcome.get('status'), 'retry')] += 1
+
+    def _renew_leases(self, ids: set, lock: threading.Lock, done: threading.Event) -> None:
+        """Extend the lease of claimed messages not yet recorded until `done`."""
+        while not done.wait(OUTBOX_LEASE_SECONDS / 3):
+            with lock:
+                if not ids:
+                    return
+                try:
+                    with self.app.app_context():
+                        db.session.execute(
+                            update(OutboxMessage).where(OutboxMessage.id.in_(list(ids)))
+                            .values(next_attempt_at=datetime.utcnow() + timedelta(seconds=OUTBOX_LEASE_SECONDS)))
+                        db.session.commit()
+                except Exception as e:
+                    self.logger.warning(f"Renouvellement de la réservation impossible: {e}")
+
+    def dispatch_once(self) -> Dict[str, int]:
+        """One pass over due messages. Must be called inside an app context."""
+        counts = {'delivered': 0, 'retry': 0, 'dead': 0}
+        by_kind: Dict[str, List] = {}
+        for message in self.claim():
+            by_kind.setdefault(message.kind, []).append(message)
+        if not by_kind:
+            return counts
+        # Leases are renewed in the background while messages are in flight;
+        # recording a kind's outcomes and renewing never overlap
+        leased = {m.id for messages in by_kind.values() for m in messages}
+        lock, done = threading.Lock(), threading.Event()
+        threading.Thread(target=self._renew_leases, args=(leased, lock, done),
+                         name=f'{self.name}-lease', daemon=True).start()
+        try:
+            for kind, messages in by_kind.items():
+                if kind in self.batch_senders and len(messages) > 1:
+                    errors = self.send_batch(messages)
+                else:
+                    # Sent concurrently, bounded by this dispatcher's HTTP worker pool
+                    errors = get_client().map(self.send, messages, pool=self.name)
+                with lock:
+                    for message, error in zip(messages, errors):
+                        self._record(message, error, counts)
+                    db.session.commit()
+                    leased.difference_update(m.id for m in messages)
+        finally:
+            done.set()
+        return counts
+
+    def run_forever(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                with self.app.app_context():
+                    counts = self.dispatch_once()
+                    db.session.remove()
+            except Exception as e:
+                self.logger.error(f"Passe de l'outbox en échec: {e}")
+                counts = {}
+            if counts.get('delivered') or counts.get('retry') or counts.get('dead'):
+                continue  # more may be due
+            _wakeup.wait(OUTBOX_POLL_INTERVAL)
+            _wakeup.clear()
+
+    def start(self, stop: threading.Event = None) -> threading.Thread:
+        """Run the dispatcher in a daemon thread of this process."""
+        self._thread = threading.Thread(target=self.run_forever, args=(stop or threading.Event(),),
+                                        name=f'{self.name}-dispatcher', daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+def default_senders() -> Dict[str, Callable]:
+    """Sender per message kind."""
+    from notifier import post_to_n8n, send_email
+    return {'lead': post_to_n8n, 'email': send_email}
+
+
+def default_batch_senders() -> Dict[str, Callable]:
+    """Batch sender per message kind (leads when WEBHOOK_BATCH_SIZE > 1)."""
+    from notifier import post_leads_to_n8n
+    return {'lead': post_leads_to_n8n} if WEBHOOK_BATCH_SIZE > 1 else {}
+
+
+def stats() -> Dict[str, int]:
+    """Number of messages per status."""
+    counts = {PENDING: 0, DELIVERED: 0, DEAD: 0}
+    counts.update(db.session.execute(
+        select(OutboxMessage.status, func.count(OutboxMessage.id)).group_by(OutboxMessage.status)
+    ).all())
+    return counts
+
+
+def stats_by_kind() -> Dict[str, Dict[str, int]]:
+    """Number of messages per kind and status (one queue per kind)."""
+    counts: Dict[str, Dict[str, int]] = {}
+    for kind, status, count in db.session.execute(
+        select(OutboxMessage.kind, OutboxMessage.status, func.count(OutboxMessage.id))
+        .group_by(OutboxMessage.kind, OutboxMessage.status)
+    ):
+        counts.setdefault(kind, {PENDING: 0, DELIVERED: 0, DEAD: 0})[status] = count
+    return counts
+
+
+def dead_letters(limit: int = 100) -> List[OutboxMessage]:
+    """Most recent dead-lettered messages."""
+    return (OutboxMessage.query.filter_by(status=DEAD)
+            .order_by(OutboxMessage.id.desc()).limit(limit).all())
+
+
+def retry(ids: Optional[List[int]] = None) -> int:
+    """Requeue dead messages (all of them when `ids` is None) and commit."""
+    stmt = (update(OutboxMessage).where(OutboxMessage.status == DEAD)
+            .values(status=PENDING, attempts=0, next_attempt_at=datetime.utcnow()))
+    if ids is not None:
+        stmt = stmt.where(OutboxMessage.id.in_(ids))
+    count = db.session.execute(stmt).rowcount
+    db.session.commit()
+    wake()
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--once', action='store_true', help='Deliver due messages once and exit')
+    parser.add_argument('--dead', action='store_true', help='List dead-lettered messages')
+    parser.add_argument('--retry', nargs='+', metavar='ID', help="Requeue dead messages ('all' for every one)")
+    args = parser.parse_args()
+
+    from app_factory import create_app
+    from routing import dispatchers
+    app = create_app('cli')
+    logger = get_logger('OUTBOX')
+    workers = dispatchers(app, logger=logger)
+
+    with app.app_context():
+        if args.dead:
+            for m in dead_letters():
+                print(json.dumps({'id': m.id, 'kind': m.kind, 'key': m.dedup_key, 'attempts': m.attempts,
+                                  'created_at': m.created_at.isoformat(), 'error': m.last_error},
+                                 ensure_ascii=False))
+            return 0
+        if args.retry:
+            count = retry(None if args.retry == ['all'] else [int(i) for i in args.retry])
+            print(f"{count} message(s) remis en file")
+            return 0
+        if args.once:
+            counts = {'delivered': 0, 'retry': 0, 'dead': 0}
+            for dispatcher in workers:
+                for outcome, count in dispatcher.dispatch_once().items():
+                    counts[outcome] += count
+            print(json.dumps(dict(counts, **stats())))
+            return 0
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    logger.info(f"Dispatcher de l'outbox démarré ({len(workers)} file(s))")
+    for dispatcher in workers[1:]:
+        dispatcher.start(stop)
+    workers[0].run_forever(stop)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Keyset (cursor) pagination helpers for the dashboard tables."""
+import base64
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, func, or_
+from models import db
+
+# Cached row counts: {model name: (computed_at, count)}
+_count_cache: Dict[str, Tuple[float, int]] = {}
+_count_lock = threading.Lock()
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    """Encode a (timestamp, id) position as an opaque URL-safe cursor."""
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Decode a cursor produced by `encode_cursor`.
+
+    Returns None for missing or malformed cursors so callers fall back to
+    the first page instead of erroring.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        ts, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        return None
+
+
+def cached_count(model, ttl: float = 60.0) -> int:
+    """Return COUNT(*) for a model, recomputed at most once per `ttl` seconds."""
+    name = model.__name__
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(name)
+        if cached and now - cached[0] < ttl:
+            return cached[1]
+    count = db.session.query(func.count(model.id)).scalar() or 0
+    with _count_lock:
+        _count_cache[name] = (now, count)
+    return count
+
+
+def invalidate_counts() -> None:
+    """Drop cached counts (e.g. after an ingestion)."""
+    with _count_lock:
+        _count_cache.clear()
+
+
+class KeysetPage:
+    """One page of rows ordered newest first on (`ts_column`, id).
+
+    Exposes `items`, `has_next`/`next_cursor`, `has_prev`/`prev_cursor`
+    and an approximate `total`, so the dashboard never issues an OFFSET.
+    """
+
+    def __init__(self, items: List, ts_attr: str, has_next: bool, has_prev: bool, total: int):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self.next_cursor = None
+        self.prev_cursor = None
+        if items:
+            first, last = items[0], items[-1]
+            if has_next:
+                self.next_cursor = encode_cursor(getattr(last, ts_attr), last.id)
+            if has_prev:
+                self.prev_cursor = encode_cursor(getattr(first, ts_attr), first.id)
+
+
+def keyset_paginate(model, ts_column, after: Optional[str] = None, before: Optional[str] = None,
+                    per_page: int = 10, count_ttl: float = 60.0, options: Iterable = ()) -> KeysetPage:
+    """Paginate `model` newest first using a (timestamp, id) keyset.
+
+    Args:
+        model: SQLAlchemy model with an integer `id` primary key
+        ts_column: Timestamp column to order by (must be indexed with id)
+        after: Cursor of the last row seen; returns the next (older) page
+        before: Cursor of the first row seen; returns the previous (newer) page
+        per_page: Number of rows per page
+        count_ttl: Seconds during which the total row count is cached
+        options: Loader options for the query (e.g. `defer()` of large columns)
+
+    Rows whose timestamp is NULL have no keyset position and are left out.
+    """
+    query = model.query.options(*options).filter(ts_column.isnot(None))
+    position = decode_cursor(before)
+    backwards = position is not None
+    if not backwards:
+        position = decode_cursor(after)
+
+    if position is not None:
+        ts, row_id = position
+        if backwards:
+            query = query.filter(or_(ts_column > ts, and_(ts_column == ts, model.id > row_id)))
+        else:
+            query = query.filter(or_(ts_column < ts, and_(ts_column == ts, model.id < row_id)))
+
+    if backwards:
+        query = query.order_by(ts_column.asc(), model.id.asc())
+    else:
+        query = query.order_by(ts_column.desc(), model.id.desc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, position is not None
+
+    return KeysetPage(rows, ts_column.key, has_next, has_prev, cached_count(model, count_ttl))
@@ -1,21 +1,39 @@
-"""README generator for webhook documentation."""
+"""README generator for webhook documentation.
+
+The README records the header schema version it was generated for
+(header_schema.py) in its first line; `readme_current()` compares it so
+the file is only rewritten when the table schema changes.
+"""
 import json
 import os
-from typing import Dict
+from typing import Dict, Optional
 import logging
+from ingest import json_safe
+
+_VERSION_MARKER = '<!-- header-schema: {} -->'
+
+def readme_current(path: str, schema_version: str) -> bool:
+    """True if the README at `path` was generated for `schema_version`."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.readline().strip() == _VERSION_MARKER.format(schema_version)
+    except OSError:
+        return False
 
-def generate_readme(example_payload: Dict, path: str, logger: logging.Logger) -> None:
+def generate_readme(example_payload: Dict, path: str, logger: logging.Logger,
+                    schema_version: Optional[str] = None) -> None:
     """Generate README file documenting webhook payload format.
     
     Args:
         example_payload: Example lead data structure
         path: Path where to save the README
         logger: Logger instance
+        schema_version: Header schema version the README documents
     """
     # Ensure directory exists
     os.makedirs(os.path.dirname(path), exist_ok=True)
     
-    content = """# Tesla Partner Portal Webhook Documentation
+    content = (_VERSION_MARKER.format(schema_version) + "\n" if schema_version else "") + """# Tesla Partner Portal Webhook Documentation
 
 ## Description
 This document describes the JSON payload format sent to the configured n8n webhook for each new lead detected.
@@ -47,7 +65,7 @@ This document describes the JSON payload format sent to the configured n8n webho
   3. `id` if present
   4. SHA-256 hash (first 8 chars) of sorted row data if no other key available
 """.format(
-        json.dumps(example_payload, indent=2, ensure_ascii=False),
+        json.dumps(json_safe(example_payload), indent=2, ensure_ascii=False),
         '\n'.join(f"- `{k}`: {v if v else 'Empty string'}" 
                  for k, v in example_payload['row'].items())
     )
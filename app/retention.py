@@ -0,0 +1,305 @@
+"""Retention and archival of old rows, screenshots and logs.
+
+Rows older than their table's retention period are moved out of the hot
+database into monthly compressed NDJSON partitions:
+
+    ARCHIVE_DIR/<table>/<YYYY-MM>.ndjson.zst   (zstandard installed)
+    ARCHIVE_DIR/<table>/<YYYY-MM>.ndjson.gz    (fallback, stdlib gzip)
+
+Each batch is appended to its partition and fsynced before the rows are
+deleted, so data is never only in memory. Archived rows stay readable
+through `iter_archived()` or `python retention.py query <table>`.
+
+The scheduler daemon (scheduler.py) applies the policies every
+RETENTION_INTERVAL_HOURS from a background thread (`start_retention()`);
+the last pass is stored in AppMeta so restarts do not repeat it.
+
+Usage:
+    python retention.py run [--dry-run]
+    python retention.py query leads --since 2025-01-01 --until 2025-03-01
+"""
+import argparse
+import glob
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import inspect
+from models import db, AppMeta, Lead, ScraperRun, ScraperAttempt, LoginAttempt, OutboxMessage
+from config import (
+    ARCHIVE_DIR, SCREENSHOT_DIR, RETENTION_BATCH_SIZE, RETENTION_VACUUM_PAGES,
+    RETENTION_LEADS_DAYS, RETENTION_RUNS_DAYS, RETENTION_ATTEMPTS_DAYS,
+    RETENTION_LOGIN_ATTEMPTS_DAYS, RETENTION_SCREENSHOTS_DAYS, RETENTION_OUTBOX_DAYS,
+    RETENTION_INTERVAL_HOURS
+)
+from logger import get_logger
+import data_version
+
+# Optional: zstandard gives much better ratios; gzip is always available
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except Exception:
+    ZSTD_AVAILABLE = False
+
+# Archive name -> (model, time column attribute, retention in days; 0 disables)
+POLICIES = {
+    'leads': (Lead, 'fetched_at', RETENTION_LEADS_DAYS),
+    'scraper_runs': (ScraperRun, 'timestamp', RETENTION_RUNS_DAYS),
+    'scraper_attempts': (ScraperAttempt, 'timestamp', RETENTION_ATTEMPTS_DAYS),
+    'login_attempts': (LoginAttempt, 'timestamp', RETENTION_LOGIN_ATTEMPTS_DAYS),
+    # Only delivered messages have delivered_at: pending and dead ones stay
+    'webhook_outbox': (OutboxMessage, 'delivered_at', RETENTION_OUTBOX_DAYS),
+}
+
+
+def _serialize(row) -> Dict:
+    """Convert a model instance into a JSON-safe dict of its columns."""
+    record = {}
+    for column in inspect(row).mapper.column_attrs:
+        value = getattr(row, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, bytes):
+            value = value.decode('utf-8', errors='replace')
+        record[column.key] = value
+    return record
+
+
+def _partition_path(table: str, month: str, extension: Optional[str] = None) -> str:
+    extension = extension or ('zst' if ZSTD_AVAILABLE else 'gz')
+    return os.path.join(ARCHIVE_DIR, table, f"{month}.ndjson.{extension}")
+
+
+def _append_partition(path: str, records: List[Dict]) -> None:
+    """Append records to a compressed partition as a new frame/member and fsync."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8')
+    if path.endswith('.zst'):
+        payload = zstandard.ZstdCompressor(level=10).compress(payload)
+    else:
+        payload = gzip.compress(payload)
+    with open(path, 'ab') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_partition(path: str) -> Iterator[Dict]:
+    with open(path, 'rb') as raw:
+        if path.endswith('.zst'):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError(f"zstandard is required to read {path}")
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            stream = gzip.GzipFile(fileobj=raw)
+        for line in io.TextIOWrapper(stream, encoding='utf-8'):
+            if line.strip():
+                yield json.loads(line)
+
+
+def archive_table(name: str, days: int, logger: logging.Logger, dry_run: bool = False) -> int:
+    """Move rows older than `days` from one table into its archive partitions.
+
+    Returns:
+        Number of rows archived (or that would be archived with dry_run)
+    """
+    model, column_name, _ = POLICIES[name]
+    column = getattr(model, column_name)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    old_rows = model.query.filter(column < cutoff)
+
+    if dry_run:
+        count = old_rows.count()
+        logger.info(f"[dry-run] {name}: {count} lignes antérieures au {cutoff:%Y-%m-%d}")
+        return count
+
+    archived = 0
+    while True:
+        batch = old_rows.order_by(model.id).limit(RETENTION_BATCH_SIZE).all()
+        if not batch:
+            break
+        by_month: Dict[str, List[Dict]] = {}
+        for row in batch:
+            month = getattr(row, column_name).strftime('%Y-%m')
+            by_month.setdefault(month, []).append(_serialize(row))
+        for month, records in by_month.items():
+            _append_partition(_partition_path(name, month), records)
+
+        ids = [row.id for row in batch]
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        data_version.bump()
+        db.session.commit()
+        db.session.expunge_all()
+        archived += len(ids)
+
+    if archived:
+        logger.info(f"{name}: {archived} lignes archivées (antérieures au {cutoff:%Y-%m-%d})")
+    return archived
+
+
+def prune_screenshots(days: int, logger: logging.Logger, dry_run: bool = False) -> int:
+    """Delete scraper screenshots older than `days` and unlink them from their runs."""
+    cutoff = time.time() - days * 86400
+    removed = []
+    for path in glob.glob(os.path.join(SCREENSHOT_DIR, 'scraper_run_*.png')):
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(os.path.basename(path))
+        except OSError as e:
+            logger.warning(f"Impossible de supprimer {path}: {e}")
+
+    if removed and not dry_run:
+        for start in range(0, len(removed), RETENTION_BATCH_SIZE):
+            chunk = removed[start:start + RETENTION_BATCH_SIZE]
+            ScraperRun.query.filter(ScraperRun.screenshot_path.in_(chunk)).update(
+                {ScraperRun.screenshot_path: None}, synchronize_session=False
+            )
+        data_version.bump()
+        db.session.commit()
+    if removed:
+        logger.info(f"{'[dry-run] ' if dry_run else ''}{len(removed)} screenshots supprimés")
+    return len(removed)
+
+
+def incremental_vacuum(logger: logging.Logger) -> None:
+    """Return free pages to the filesystem without a blocking full VACUUM.
+
+    Only effective on SQLite databases in auto_vacuum=INCREMENTAL mode,
+    which create_app() enables for new databases. Older databases need a
+    single manual `VACUUM` to switch modes.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    mode = db.session.execute(db.text('PRAGMA auto_vacuum')).scalar()
+    if mode != 2:
+        logger.info("auto_vacuum n'est pas INCREMENTAL — lancer un VACUUM manuel une fois pour l'activer")
+        return
+    freelist = db.session.execute(db.text('PRAGMA freelist_count')).scalar()
+    if freelist:
+        db.session.execute(db.text(f'PRAGMA incremental_vacuum({int(RETENTION_VACUUM_PAGES)})'))
+        db.session.commit()
+        logger.info(f"incremental_vacuum: {min(freelist, RETENTION_VACUUM_PAGES)}/{freelist} pages libérées")
+
+
+def run_retention(logger: logging.Logger, dry_run: bool = False) -> Dict[str, int]:
+    """Apply every retention policy once. Must run inside an app context."""
+    results = {}
+    for name, (_, _, days) in POLICIES.items():
+        if days > 0:
+            results[name] = archive_table(name, days, logger, dry_run=dry_run)
+    if RETENTION_SCREENSHOTS_DAYS > 0:
+        results['screenshots'] = prune_screenshots(RETENTION_SCREENSHOTS_DAYS, logger, dry_run=dry_run)
+    if not dry_run:
+        incremental_vacuum(logger)
+    return results
+
+
+RETENTION_META_KEY = 'retention_last_run'
+# Seconds before a failed periodic pass is retried
+RETENTION_RETRY_SECONDS = 600
+
+
+def _retention_pass(logger: logging.Logger) -> float:
+    """Run the policies if the last pass is older than the interval.
+
+    Returns:
+        Seconds until the next pass is due
+    """
+    interval = timedelta(hours=RETENTION_INTERVAL_HOURS)
+    row = db.session.get(AppMeta, RETENTION_META_KEY)
+    last = datetime.fromisoformat(row.value) if row and row.value else None
+    now = datetime.utcnow()
+    if last is not None and now - last < interval:
+        return (last + interval - now).total_seconds()
+    results = run_retention(logger)
+    db.session.merge(AppMeta(key=RETENTION_META_KEY, value=now.isoformat()))
+    db.session.commit()
+    logger.info(f"Rétention appliquée: {results}")
+    return interval.total_seconds()
+
+
+def start_retention(app, stop: threading.Event, logger: logging.Logger) -> Optional[threading.Thread]:
+    """Apply the retention policies every RETENTION_INTERVAL_HOURS from a
+    daemon thread; None when periodic retention is disabled."""
+    if RETENTION_INTERVAL_HOURS <= 0:
+        return None
+
+    def loop():
+        while not stop.is_set():
+            with app.app_context():
+                try:
+                    wait = _retention_pass(logger)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Rétention en échec: {e}")
+                    wait = RETENTION_RETRY_SECONDS
+                finally:
+                    db.session.remove()
+            stop.wait(max(60.0, wait))
+
+    thread = threading.Thread(target=loop, name='retention', daemon=True)
+    thread.start()
+    return thread
+
+
+def iter_archived(name: str, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> Iterator[Dict]:
+    """Yield archived rows of one table whose time column is in [since, until).
+
+    Only partitions overlapping the requested months are opened.
+    """
+    if name not in POLICIES:
+        raise ValueError(f"Unknown archive: {name}")
+    column_name = POLICIES[name][1]
+    first_month = since.strftime('%Y-%m') if since else None
+    last_month = until.strftime('%Y-%m') if until else None
+
+    paths = sorted(glob.glob(os.path.join(ARCHIVE_DIR, name, '*.ndjson.*')))
+    for path in paths:
+        month = os.path.basename(path).split('.', 1)[0]
+        if (first_month and month < first_month) or (last_month and month > last_month):
+            continue
+        for record in _read_partition(path):
+            ts = record.get(column_name)
+            if ts and ((since and ts < since.isoformat()) or (until and ts >= until.isoformat())):
+                continue
+            yield record
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_run = sub.add_parser('run', help='Apply retention policies')
+    p_run.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+    p_query = sub.add_parser('query', help='Print archived rows as NDJSON')
+    p_query.add_argument('table', choices=sorted(POLICIES))
+    p_query.add_argument('--since', type=datetime.fromisoformat)
+    p_query.add_argument('--until', type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    if args.command == 'query':
+        for record in iter_archived(args.table, args.since, args.until):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return 0
+
+    from app_factory import create_app
+    logger = get_logger('RETENTION')
+    app = create_app('cli')
+    with app.app_context():
+        results = run_retention(logger, dry_run=args.dry_run)
+    logger.info(f"Rétention terminée: {results}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""Lead routing: send each new lead to the destinations its rules select.
+
+Rules are read from a JSON file (ROUTING_RULES_FILE):
+
+    {
+      "destinations": {
+        "idf": {"url": "https://n8n.example.com/webhook/idf", "batch_size": 20},
+        "model-y": {"url": "https://hooks.example.com/model-y"},
+        "archive": {"type": "ndjson", "path": "/data/routed-leads.ndjson"}
+      },
+      "rules": [
+        {"name": "Île-de-France", "source": ["tesla.com"],
+         "when": {"Code postal": {"prefix": ["75", "77", "78", "91", "92", "93", "94", "95"]}},
+         "to": ["idf", "archive"], "stop": true},
+        {"name": "Model Y", "when": {"Modèle": {"regex": "model ?y"}}, "to": ["model-y"]}
+      ],
+      "default": ["n8n"]
+    }
+
+Rules are tried in order. A lead goes to the destinations of every rule
+it matches, until a matching rule has "stop"; a lead no rule matches goes
+to "default" (["n8n"] when omitted). "n8n" is the built-in destination
+N8N_WEBHOOK_URL. A rule with "to": [] drops the leads it matches.
+
+"source" restricts a rule to leads of these sources. "when" maps a row
+field (header, compared case- and whitespace-insensitively) to a test,
+all of which must pass:
+    "value"                  equal (case-insensitive)
+    ["a", "b"]               one of
+    {"eq": ...}, {"in": [...]}, {"not_in": [...]}
+    {"prefix": "75" or [...]}, {"regex": "..."}, {"exists": true|false}
+
+The file is compiled once (and again when it changes) into predicates
+over the few fields the rules use: sets for in/eq, a tuple for
+str.startswith, precompiled patterns, rules indexed by source, and each
+distinct test evaluated at most once per lead.
+
+Each destination has its own outbox kind ('lead' for n8n, 'lead:<name>'
+otherwise) and dispatcher, so a slow or failing destination only delays
+its own queue. Destinations added to the file are picked up by the
+dispatchers on their next start (scheduler.py, outbox.py).
+"""
+import json
+import os
+import re
+import threading
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from logger import get_logger
+from config import N8N_WEBHOOK_URL, ROUTING_RULES_FILE, WEBHOOK_BATCH_SIZE
+
+logger = get_logger('ROUTING')
+
+DEFAULT_DESTINATION = 'n8n'
+LEAD_KIND = 'lead'
+# Destination names end up in OutboxMessage.kind (32 characters)
+_NAME_PATTERN = re.compile(r'^[a-z0-9_-]{1,27}$')
+_OPERATORS = ('eq', 'in', 'not_in', 'prefix', 'regex', 'exists')
+
+
+class RoutingError(Exception):
+    """Raised for an invalid routing rules file."""
+    pass
+
+
+def kind_of(destination: str) -> str:
+    """Outbox kind of a destination's queue."""
+    return LEAD_KIND if destination == DEFAULT_DESTINATION else f"{LEAD_KIND}:{destination}"
+
+
+def _normalize(value) -> str:
+    """Case- and whitespace-insensitive form of a field name or value."""
+    return ' '.join(str(value).split()).casefold()
+
+
+class Destination:
+    """A webhook URL or an NDJSON file receiving routed leads."""
+
+    def __init__(self, name: str, url: Optional[str] = None, path: Optional[str] = None,
+                 batch_size: int = WEBHOOK_BATCH_SIZE):
+        self.name = name
+        self.url = url
+        self.path = path
+        self.batch_size = batch_size
+        self.kind = kind_of(name)
+        self._lock = threading.Lock()
+
+    def senders(self) -> Tuple[Dict[str, Callable], Dict[str, Callable]]:
+        """(senders, batch_senders) for an OutboxDispatcher of this destination."""
+        from notifier import post_lead, post_leads
+        if self.path:
+            return {self.kind: self._append}, {self.kind: self._append_batch}
+        batch = {self.kind: partial(post_leads, self.url, size=self.batch_size)} if self.batch_size > 1 else {}
+        return {self.kind: partial(post_lead, self.url)}, batch
+
+    def _append(self, payload: Dict, logger) -> None:
+        self._append_batch([payload], logger)
+
+    def _append_batch(self, payloads: List[Dict], logger) -> List[None]:
+        lines = ''.join(json.dumps(p, ensure_ascii=False, default=str) + '\n' for p in payloads)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        logger.info(f"{len(payloads)} lead(s) écrit(s) dans {self.path}")
+        return [None] * len(payloads)
+
+
+class _Rule:
+    __slots__ = ('name', 'tests', 'to', 'stop')
+
+    def __init__(self, name: str, tests: Tuple, to: Tuple[str, ...], stop: bool):
+        self.name = name
+        self.tests = tests  # (test id, field position, predicate)
+        self.to = to
+        self.stop = stop
+
+
+class Router:
+    """Compiled routing rules; `route()` splits leads per destination."""
+
+    def __init__(self, destinations: Dict[str, Destination], rules: List[_Rule], default: Tuple[str, ...],
+                 fields: List[str], rules_by_source: Dict[str, Tuple[_Rule, ...]],
+                 rules_any_source: Tuple[_Rule, ...], test_count: int):
+        self.destinations = destinations
+        self.rules = rules
+        self.default = default
+        self.fields = fields
+        self._rules_by_source = rules_by_source
+        self._rules_any_source = rules_any_source
+        self._test_count = test_count
+        # Row header tuple -> original header per used field (rows of one
+        # table share their headers, so names are normalized once per table)
+        self._layouts: Dict[Tuple, Tuple[Optional[str], ...]] = {}
+
+    def _layout(self, row: Dict) -> Tuple[Optional[str], ...]:
+        headers = tuple(row)
+        layout = self._layouts.get(headers)
+        if layout is None:
+            by_name = {}
+            for header in headers:
+                by_name.setdefault(_normalize(header), header)
+            layout = tuple(by_name.get(field) for field in self.fields)
+            if len(self._layouts) < 1024:
+                self._layouts[headers] = layout
+        return layout
+
+    def targets(self, lead: Dict) -> Tuple[str, ...]:
+        """Destination names of one lead."""
+        row = lead.get('row')
+        if not isinstance(row, dict):
+            row = {}
+        values = []
+        for header in self._layout(row):
+            value = row.get(header) if header is not None else None
+            values.append(None if value is None else _normalize(value))
+        results = [None] * self._test_count
+        matched = False
+        targets: List[str] = []
+        for rule in self._rules_by_source.get(_normalize(lead.get('source', '')), self._rules_any_source):
+            for test_id, position, predicate in rule.tests:
+                result = results[test_id]
+                if result is None:
+                    result = results[test_id] = predicate(values[position])
+                if not result:
+                    break
+            else:
+                matched = True
+                for name in rule.to:
+                    if name not in targets:
+                        targets.append(name)
+                if rule.stop:
+                    break
+        return tuple(targets) if matched else self.default
+
+    def route(self, leads: Iterable[Dict]) -> Dict[str, List[Dict]]:
+        """Group leads by destination name (a lead may be in several groups)."""
+        groups: Dict[str, List[Dict]] = {}
+        for lead in leads:
+            for name in self.targets(lead):
+                groups.setdefault(name, []).append(lead)
+        return groups
+
+
+def _predicate(operator: str, argument) -> Tuple[Tuple, Callable]:
+    """(canonical form, test of a normalized value or None) for one operator."""
+    def values(arg) -> Tuple[str, ...]:
+        items = arg if isinstance(arg, (list, tuple)) else [arg]
+        return tuple(sorted({_normalize(v) for v in items if v is not None}))
+
+    if operator in ('eq', 'in'):
+        allowed = values(argument)
+        return ('in', allowed), frozenset(allowed).__contains__
+    if operator == 'not_in':
+        excluded = frozenset(values(argument))
+        return ('not_in', tuple(sorted(excluded))), lambda v: v not in excluded
+    if operator == 'prefix':
+        prefixes = values(argument)
+        return ('prefix', prefixes), lambda v: v is not None and v.startswith(prefixes)
+    if operator == 'regex':
+        try:
+            search = re.compile(str(argument), re.IGNORECASE).search
+        except re.error as e:
+            raise RoutingError(f"Invalid regex {argument!r}: {e}")
+        return ('regex', str(argument)), lambda v: v is not None and search(v) is not None
+    if operator == 'exists':
+        if argument:
+            return ('exists', True), lambda v: bool(v)
+        return ('exists', False), lambda v: not v
+    raise RoutingError(f"Unknown operator {operator!r} (expected one of {', '.join(_OPERATORS)})")
+
+
+def _destinations(spec: Dict) -> Dict[str, Destination]:
+    destinations = {DEFAULT_DESTINATION: Destination(DEFAULT_DESTINATION, url=N8N_WEBHOOK_URL)}
+    if not isinstance(spec, dict):
+        raise RoutingError("'destinations' must be an object")
+    for name, options in spec.items():
+        if name == DEFAULT_DESTINATION:
+            raise RoutingError(f"'{DEFAULT_DESTINATION}' is built in (N8N_WEBHOOK_URL)")
+        if not _NAME_PATTERN.match(name):
+            raise RoutingError(f"Invalid destination name {name!r} (a-z, 0-9, _ and -, 27 characters at most)")
+        if not isinstance(options, dict):
+            raise RoutingError(f"Destination {name!r} must be an object")
+        kind = options.get('type', 'webhook')
+        if kind == 'webhook':
+            if not options.get('url'):
+                raise RoutingError(f"Destination {name!r} has no url")
+            destinations[name] = Destination(name, url=options['url'],
+                                             batch_size=int(options.get('batch_size', WEBHOOK_BATCH_SIZE)))
+        elif kind == 'ndjson':
+            if not options.get('path'):
+                raise RoutingError(f"Destination {name!r} has no path")
+            destinations[name] = Destination(name, path=options['path'])
+        else:
+            raise RoutingError(f"Destination {name!r} has unknown type {kind!r}")
+    return destinations
+
+
+def _targets(names, destinations: Dict[str, Destination], where: str) -> Tuple[str, ...]:
+    if isinstance(names, str):
+        names = [names]
+    for name in names:
+        if name not in destinations:
+            raise RoutingError(f"{where}: unknown destination {name!r}")
+    return tuple(dict.fromkeys(names))
+
+
+def compile_rules(config: Dict) -> Router:
+    """Compile a routing config (see module docstring) into a Router.
+
+    Raises:
+        RoutingError: If the config is invalid
+    """
+    if not isinstance(config, dict):
+        raise RoutingError('Routing config must be an object')
+    destinations = _destinations(config.get('destinations', {}))
+    default = _targets(config.get('default', [DEFAULT_DESTINATION]), destinations, 'default')
+
+    fields: Dict[str, int] = {}
+    test_ids: Dict[Tuple, int] = {}
+    rules: List[_Rule] = []
+    sources: List[Optional[Tuple[str, ...]]] = []
+    for index, spec in enumerate(config.get('rules', [])):
+        if not isinstance(spec, dict) or 'to' not in spec:
+            raise RoutingError(f"Rule {index + 1} must be an object with a 'to' list")
+        name = spec.get('name') or f"rule {index + 1}"
+        conditions = spec.get('when', {})
+        if not isinstance(conditions, dict):
+            raise RoutingError(f"{name}: 'when' must be an object")
+        tests = []
+        for field, condition in conditions.items():
+            if isinstance(condition, dict):
+                operators = list(condition.items())
+            elif isinstance(condition, list):
+                operators = [('in', condition)]
+            else:
+                operators = [('eq', condition)]
+            position = fields.setdefault(_normalize(field), len(fields))
+            for operator, argument in operators:
+                canonical, predicate = _predicate(operator, argument)
+                key = (position,) + canonical
+                if key not in test_ids:
+                    test_ids[key] = len(test_ids)
+                tests.append((test_ids[key], position, predicate))
+        rules.append(_Rule(name, tuple(tests), _targets(spec['to'], destinations, name), bool(spec.get('stop'))))
+        source = spec.get('source')
+        if isinstance(source, str):
+            source = [source]
+        sources.append(tuple(_normalize(s) for s in source) if source else None)
+
+    # Ordered rule list per source; unknown sources only see source-free rules
+    known = {s for listed in sources if listed for s in listed}
+    rules_by_source = {s: tuple(rule for rule, listed in zip(rules, sources) if listed is None or s in listed)
+                       for s in known}
+    rules_any_source = tuple(rule for rule, listed in zip(rules, sources) if listed is None)
+    return Router(destinations, rules, default, list(fields), rules_by_source, rules_any_source, len(test_ids))
+
+
+def load_rules(path: str) -> Router:
+    """Read and compile a rules file.
+
+    Raises:
+        RoutingError: If the file cannot be read or is invalid
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise RoutingError(f"Cannot read routing rules {path}: {e}")
+    return compile_rules(config)
+
+
+_router: Optional[Router] = None
+_router_stamp = None
+_router_lock = threading.Lock()
+
+def get_router() -> Optional[Router]:
+    """Return the compiled rules of ROUTING_RULES_FILE (None when not set).
+
+    The file is recompiled when its modification time changes; an invalid
+    file is logged and the previous rules stay in use.
+    """
+    global _router, _router_stamp
+    if not ROUTING_RULES_FILE:
+        return None
+    try:
+        stamp = os.stat(ROUTING_RULES_FILE).st_mtime_ns
+    except OSError as e:
+        if _router is None:
+            logger.error(f"Règles de routage illisibles ({e}) — envoi au webhook n8n par défaut")
+        return _router
+    if stamp == _router_stamp:
+        return _router
+    with _router_lock:
+        if stamp != _router_stamp:
+            try:
+                _router = load_rules(ROUTING_RULES_FILE)
+                logger.info(f"Règles de routage chargées: {len(_router.rules)} règle(s), "
+                            f"{len(_router.destinations)} destination(s)")
+            except RoutingError as e:
+                logger.error(f"Règles de routage invalides, règles précédentes conservées: {e}")
+            _router_stamp = stamp
+    return _router
+
+def enabled() -> bool:
+    """Whether new leads are sent anywhere."""
+    return bool(N8N_WEBHOOK_URL or ROUTING_RULES_FILE)
+
+
+def queue_leads(leads: List[Dict], log=None) -> Tuple[int, List[Dict]]:
+    """Queue new leads on the outbox of each destination they are routed
+    to, in the caller's transaction.
+
+    Returns:
+        (number of outbox messages added, leads handled). A lead routed to
+        the default destination while N8N_WEBHOOK_URL is unset (e.g. rules
+        file unreadable) is not handled: the caller must not mark it seen.
+    """
+    from notifier import queue_leads as queue
+    log = log or logger
+    router = get_router()
+    groups = router.route(leads) if router is not None else ({DEFAULT_DESTINATION: leads} if leads else {})
+    queued = 0
+    skipped = set()
+    for name, group in groups.items():
+        if name == DEFAULT_DESTINATION and not N8N_WEBHOOK_URL:
+            log.warning(f"N8N_WEBHOOK_URL non configuré — {len(group)} lead(s) non envoyé(s)")
+            skipped.update(id(lead) for lead in group)
+            continue
+        count = queue(group, kind=kind_of(name))
+        queued += count
+        if router is not None:
+            log.info(f"Routage: {count} lead(s) en file pour {name}")
+    return queued, [lead for lead in leads if id(lead) not in skipped]
+
+
+def dispatchers(app, logger=None) -> List:
+    """Outbox dispatchers for this process: the default one (n8n leads and
+    emails) and one per routed destination."""
+    from outbox import OutboxDispatcher
+    workers = [OutboxDispatcher(app, logger=logger)]
+    router = get_router()
+    for name, destination in (router.destinations.items() if router is not None else ()):
+        if name == DEFAULT_DESTINATION:
+            continue
+        senders, batch_senders = destination.senders()
+        workers.append(OutboxDispatcher(app, senders=senders, batch_senders=batch_senders,
+                                        logger=logger, name=f"outbox-{name}"))
+    return workers
@@ -0,0 +1,150 @@
+"""Write-behind recorder for ScraperRun progress.
+
+Phase changes are published to the live status channel immediately but
+written to the database in batches: when the flush interval has elapsed,
+when a background timer fires, or when the run reaches a terminal state.
+This keeps a dozen fsyncs per run off the scraper's critical path while
+the persisted ScraperRun ends up with exactly the same values.
+"""
+import threading
+import time
+from typing import Dict, Optional
+from flask import current_app
+from sqlalchemy import update
+from models import db, ScraperRun
+import data_version
+from scraper_status import add_message
+from config import RUN_PROGRESS_FLUSH_INTERVAL
+from logger import get_logger
+
+logger = get_logger('SCRAPER')
+
+# Columns the recorder is allowed to write
+RUN_FIELDS = ('phase_connexion', 'phase_extraction', 'screenshot_path', 'status', 'details')
+TERMINAL_STATUSES = ('success', 'failed')
+
+
+class RunProgress:
+    """Buffer updates for one ScraperRun and flush them lazily.
+
+    Usage:
+        progress = RunProgress.start(phase_connexion="Démarrage", status="pending")
+        progress.update(phase_connexion="Navigation vers le portail")
+        ...
+        progress.finish('success', details="Extracted 12 leads")
+    """
+
+    def __init__(self, run: ScraperRun, flush_interval: Optional[float] = None):
+        self.run_id = run.id
+        self.flush_interval = RUN_PROGRESS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.state: Dict[str, Optional[str]] = {f: getattr(run, f) for f in RUN_FIELDS}
+        self.flush_count = 0
+        self._app = current_app._get_current_object()
+        self._pending: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        # Held from taking the pending values until their commit, so a timer
+        # write can never land after (and overwrite) a later one
+        self._write_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+    @classmethod
+    def start(cls, **columns) -> 'RunProgress':
+        """Create and commit a ScraperRun and return its recorder.
+
+        The data version is bumped with the insert, so the dashboard shows
+        the new run right away instead of a cached page.
+        """
+        run = ScraperRun(**columns)
+        db.session.add(run)
+        data_version.bump()
+        db.session.commit()
+        return cls(run)
+
+    def get(self, field: str) -> Optional[str]:
+        """Return the latest value of a run field, flushed or not."""
+        with self._lock:
+            return self.state.get(field)
+
+    def update(self, message: Optional[str] = None, **fields) -> None:
+        """Record new values for run fields.
+
+        Args:
+            message: Optional progress message; defaults to the new phase text
+            **fields: ScraperRun columns to update (see RUN_FIELDS)
+        """
+        unknown = set(fields) - set(RUN_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown ScraperRun fields: {', '.join(sorted(unknown))}")
+
+        if message is None:
+            message = fields.get('phase_connexion') or fields.get('phase_extraction')
+        if message:
+            add_message(message)
+
+        with self._lock:
+            self.state.update(fields)
+            self._pending.update(fields)
+            # Once the run is finished there is no hot path left to protect
+            due = self._closed or time.monotonic() - self._last_flush >= self.flush_interval
+            if not due and self._timer is None and not self._closed:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if due or fields.get('status') in TERMINAL_STATUSES:
+            self.flush()
+
+    def finish(self, status: str, message: Optional[str] = None, **fields) -> None:
+        """Record the terminal status and flush everything synchronously."""
+        self.update(message, status=status, **fields)
+        with self._lock:
+            self._closed = True
+        self.flush()
+
+    def flush(self) -> None:
+        """Write pending updates using the caller's session and commit."""
+        with self._write_lock:
+            pending = self._take_pending()
+            if pending:
+                self._write(pending)
+
+    def _take_pending(self) -> Dict[str, Optional[str]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._last_flush = time.monotonic()
+            return pending
+
+    def _write(self, pending: Dict[str, Optional[str]]) -> None:
+        try:
+            db.session.execute(
+                update(ScraperRun).where(ScraperRun.id == self.run_id).values(**pending)
+            )
+            data_version.bump()
+            db.session.commit()
+            self.flush_count += 1
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Échec écriture progression du run {self.run_id}: {e}")
+            # Keep the values so the next flush retries them
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+
+    def _flush_from_timer(self) -> None:
+        # Runs on the timer thread, which needs its own app context and session
+        with self._lock:
+            self._timer = None
+        with self._write_lock:
+            with self._lock:
+                if self._closed:
+                    return  # finish() writes the final values itself
+            pending = self._take_pending()
+            if not pending:
+                return
+            with self._app.app_context():
+                self._write(pending)
+                db.session.remove()
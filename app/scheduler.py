@@ -0,0 +1,258 @@
+"""Built-in scheduler for periodic scrapes.
+
+Replaces the "cron + random_delay()" pattern with one long-lived process
+that keeps its Flask app between runs:
+  - runs are spaced by a random delay between SCHEDULE_MIN_INTERVAL and
+    SCHEDULE_MAX_INTERVAL seconds
+  - consecutive ScraperAttempt failures double the delay, up to
+    SCHEDULE_BACKOFF_MAX
+  - with SCHEDULE_ADAPTIVE, the interval follows past lead arrivals for the
+    current hour of the week instead (see arrivals.py)
+  - a run planned inside SCHEDULE_QUIET_HOURS moves to the end of the window
+  - a tick is skipped while another scrape holds the single-flight lock
+  - queued webhook deliveries are drained by outbox dispatcher threads,
+    one per lead destination (routing.py)
+  - retention policies run every RETENTION_INTERVAL_HOURS (retention.py)
+
+The planned next run is stored in AppMeta so the dashboard can show it.
+
+Usage:
+    python scheduler.py           # run until SIGTERM/SIGINT
+    python scheduler.py --plan    # print the next planned run and exit
+    python scheduler.py --report  # expected detection latency vs. runs spent
+"""
+import argparse
+import json
+import logging
+import random
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+from models import db, AppMeta, ScraperAttempt
+from single_flight import get_coordinator
+from arrivals import ArrivalModel, slot_of
+import data_version
+import retention
+import routing
+from config import (
+    SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL, SCHEDULE_QUIET_HOURS,
+    SCHEDULE_TIMEZONE, SCHEDULE_BACKOFF_MAX, SCHEDULE_ADAPTIVE, SCHEDULE_LEARN_MIN_LEADS
+)
+from logger import get_logger
+
+SCHEDULE_META_KEY = 'scheduler'
+# Attempts inspected when counting consecutive failures
+BACKOFF_LOOKBACK = 10
+# Seconds before the arrival model is re-learned from the Lead table
+MODEL_REFRESH_SECONDS = 3600
+# Jitter applied around an adaptive interval
+ADAPTIVE_JITTER = 0.2
+
+
+def parse_quiet_hours(spec: str) -> Optional[Tuple[dtime, dtime]]:
+    """Parse "HH:MM-HH:MM" (the window may wrap past midnight)."""
+    if not spec or not spec.strip():
+        return None
+    start, end = (dtime.fromisoformat(part.strip().zfill(5)) for part in spec.split('-'))
+    return start, end
+
+
+def _local_tz():
+    if SCHEDULE_TIMEZONE:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(SCHEDULE_TIMEZONE)
+    return datetime.now().astimezone().tzinfo
+
+
+def quiet_until(moment: datetime, window: Optional[Tuple[dtime, dtime]]) -> Optional[datetime]:
+    """End of the quiet window containing `moment` (aware), or None."""
+    if window is None:
+        return None
+    start, end = window
+    t = moment.timetz().replace(tzinfo=None)
+    inside = start <= t < end if start <= end else (t >= start or t < end)
+    if not inside:
+        return None
+    until = moment.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+    if until <= moment:
+        until += timedelta(days=1)
+    return until
+
+
+def consecutive_failures(limit: int = BACKOFF_LOOKBACK) -> int:
+    """Number of failed ScraperAttempts since the last success."""
+    recent = (db.session.query(ScraperAttempt.success)
+              .order_by(ScraperAttempt.timestamp.desc(), ScraperAttempt.id.desc())
+              .limit(limit))
+    failures = 0
+    for (success,) in recent:
+        if success:
+            break
+        failures += 1
+    return failures
+
+
+def base_interval() -> float:
+    """Mean interval of the fixed schedule."""
+    return (SCHEDULE_MIN_INTERVAL + max(SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL)) / 2
+
+
+def plan_next_run(now: datetime, failures: int, rng: random.Random = random,
+                  window: Optional[Tuple[dtime, dtime]] = None,
+                  model: Optional[ArrivalModel] = None) -> Tuple[datetime, str]:
+    """Pick the next run time (naive UTC) and the reason for it.
+
+    Args:
+        now: Current time, naive UTC
+        failures: Consecutive failed attempts
+        rng: Random source for the jitter
+        window: Quiet hours as returned by parse_quiet_hours
+        model: Learned lead arrivals; None keeps the fixed interval
+
+    Returns:
+        (run_at, reason) with reason 'interval', 'adaptive', 'backoff' or
+        'quiet_hours'
+    """
+    if model is not None:
+        slot = slot_of(now.replace(tzinfo=timezone.utc).astimezone(_local_tz()))
+        delay = model.interval(slot, base_interval()) * rng.uniform(1 - ADAPTIVE_JITTER, 1 + ADAPTIVE_JITTER)
+        reason = 'adaptive'
+    else:
+        delay = rng.uniform(SCHEDULE_MIN_INTERVAL, max(SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL))
+        reason = 'interval'
+    if failures:
+        delay = min(delay * 2 ** failures, max(SCHEDULE_BACKOFF_MAX, SCHEDULE_MIN_INTERVAL))
+        reason = 'backoff'
+    run_at = now + timedelta(seconds=delay)
+
+    local = run_at.replace(tzinfo=timezone.utc).astimezone(_local_tz())
+    until = quiet_until(local, window)
+    if until is not None:
+        # Spread restarts after the window instead of firing exactly on the hour
+        until += timedelta(seconds=rng.uniform(0, SCHEDULE_MIN_INTERVAL))
+        run_at = until.astimezone(timezone.utc).replace(tzinfo=None)
+        reason = 'quiet_hours'
+    return run_at, reason
+
+
+def publish_schedule(schedule: Dict) -> None:
+    """Store the scheduler state for the dashboard."""
+    db.session.merge(AppMeta(key=SCHEDULE_META_KEY, value=json.dumps(schedule)))
+    data_version.bump()
+    db.session.commit()
+
+
+def get_schedule() -> Optional[Dict]:
+    """Return the scheduler state published by the daemon, if any."""
+    row = db.session.get(AppMeta, SCHEDULE_META_KEY)
+    return json.loads(row.value) if row and row.value else None
+
+
+class Scheduler:
+    """Run `job(logger)` periodically inside one app context per tick."""
+
+    def __init__(self, app, job: Callable[[logging.Logger], Dict], logger: logging.Logger,
+                 rng: random.Random = None):
+        self.app = app
+        self.job = job
+        self.logger = logger
+        self.rng = rng or random.Random()
+        self.window = parse_quiet_hours(SCHEDULE_QUIET_HOURS)
+        self.last_result: Optional[Dict] = None
+        self._model: Optional[ArrivalModel] = None
+        self._model_at = 0.0
+
+    def arrival_model(self) -> Optional[ArrivalModel]:
+        """Arrival model re-learned hourly; None until there is enough history."""
+        if not SCHEDULE_ADAPTIVE:
+            return None
+        if self._model is None or time.monotonic() - self._model_at >= MODEL_REFRESH_SECONDS:
+            self._model = ArrivalModel.from_history(_local_tz())
+            self._model_at = time.monotonic()
+        return self._model if self._model.total >= SCHEDULE_LEARN_MIN_LEADS else None
+
+    def plan(self, publish: bool = True) -> Dict:
+        """Compute the next run and publish it for the dashboard."""
+        with self.app.app_context():
+            failures = consecutive_failures()
+            model = self.arrival_model()
+            run_at, reason = plan_next_run(datetime.utcnow(), failures, self.rng, self.window, model)
+            schedule = {
+                'next_run': run_at.isoformat() + 'Z',
+                'reason': reason,
+                'failures': failures,
+                'last_status': (self.last_result or {}).get('status'),
+                'updated_at': datetime.utcnow().isoformat() + 'Z',
+            }
+            if publish:
+                publish_schedule(schedule)
+            db.session.remove()
+        return schedule
+
+    def tick(self) -> Optional[Dict]:
+        """Run the job unless a scrape is already in flight."""
+        flight = get_coordinator().try_start()
+        if flight is None:
+            self.logger.info("Scrape déjà en cours — tick ignoré")
+            return None
+        with self.app.app_context():
+            try:
+                self.last_result = flight.run(self.job, self.logger)
+            except Exception as e:
+                self.logger.error(f"Run planifié en échec: {e}")
+                self.last_result = {'status': 'failed', 'message': str(e), 'leads_count': 0}
+            finally:
+                db.session.remove()
+        return self.last_result
+
+    def run_forever(self, stop: threading.Event = None) -> None:
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            schedule = self.plan()
+            run_at = datetime.fromisoformat(schedule['next_run'].rstrip('Z'))
+            self.logger.info(f"Prochain scrape à {schedule['next_run']} ({schedule['reason']}, "
+                             f"{schedule['failures']} échec(s) consécutif(s))")
+            if stop.wait(max(0.0, (run_at - datetime.utcnow()).total_seconds())):
+                break
+            self.tick()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plan', action='store_true', help='Print the next planned run and exit')
+    parser.add_argument('--report', action='store_true',
+                        help='Compare the fixed and adaptive schedules on past arrivals')
+    args = parser.parse_args()
+
+    from app_factory import create_app
+    from main import run
+
+    logger = get_logger('SCHEDULER')
+    scheduler = Scheduler(create_app('cli'), run, logger)
+    if args.plan:
+        print(json.dumps(scheduler.plan(publish=False), indent=2))
+        return 0
+    if args.report:
+        with scheduler.app.app_context():
+            model = ArrivalModel.from_history(_local_tz())
+        print(json.dumps(model.report(base_interval()), indent=2, ensure_ascii=False))
+        return 0
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    # Deliver queued webhooks from this process too, one dispatcher per destination
+    for dispatcher in routing.dispatchers(scheduler.app):
+        dispatcher.start(stop)
+    retention.start_retention(scheduler.app, stop, get_logger('RETENTION'))
+    logger.info("Planificateur démarré")
+    scheduler.run_forever(stop)
+    logger.info("Planificateur arrêté")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,30 @@
 """Web scraper for Tesla Partner Portal leads."""
-import hashlib
-import json
-import random
-import time
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
 import socket
 from playwright.sync_api import sync_playwright
 from config import PORTAL_URL, PAGE_TIMEOUT, TABLE_SOURCES
-from utils_text import normalize_key
+from utils_text import guess_primary_key
+from header_schema import observe, compile_headers
 from auth import login_if_needed
-from models import db, ScraperAttempt, ScraperRun
+from cookies_manager import refresh_cookies
+from fingerprints import TableFingerprints, ALL_TABLES_HASH_JS
+from models import db, ScraperAttempt
 from scraper_status import add_message, set_running
+from run_progress import RunProgress
 
-def extract_headers(table) -> List[str]:
-    """Extract and normalize table headers."""
+def extract_headers(table, source: Optional[str] = None) -> List[str]:
+    """Extract and normalize table headers (checked against the header
+    schema of `source` when given, see header_schema.py)."""
     # Try thead first
     headers = table.query_selector_all('thead th')
     if not headers:
         # Fallback to first row
         headers = table.query_selector_all('tr:first-child th')
     
-    return [normalize_key(header.text_content().strip()) for header in headers]
+    raw = [header.text_content().strip() for header in headers]
+    return list(observe(source, raw) if source else compile_headers(raw))
 
 def extract_rows(table, headers: List[str]) -> List[Dict]:
     """Extract rows from table and map to headers."""
@@ -37,17 +39,6 @@ def extract_rows(table, headers: List[str]) -> List[Dict]:
             rows.append(row)
     return rows
 
-def guess_primary_key(row: Dict) -> str:
-    """Determine primary key for a lead row."""
-    # Try preferred fields in order
-    for field in ['numero_d_installation', 'numero_de_confirmation', 'id']:
-        if field in row and row[field]:
-            return row[field]
-            
-    # Fallback: create stable hash of sorted row items
-    row_str = json.dumps(dict(sorted(row.items())), ensure_ascii=False)
-    return hashlib.sha256(row_str.encode()).hexdigest()[:8]
-
 def log_scraper_attempt(success: bool, error: str = None):
     """Log a scraper connection attempt."""
     attempt = ScraperAttempt(
@@ -58,22 +49,20 @@ def log_scraper_attempt(success: bool, error: str = None):
     db.session.add(attempt)
     db.session.commit()
 
-def random_delay():
-    """Wait for a random time between 5 and 20 minutes."""
-    delay = random.randint(5 * 60, 20 * 60)  # Convert to seconds
-    time.sleep(delay)
+def fetch_leads(logger: logging.Logger, fingerprints: Optional[TableFingerprints] = None) -> List[Dict]:
+    """Fetch all leads from Tesla Partner Portal and log phases in ScraperRun.
 
-def fetch_leads(logger: logging.Logger) -> List[Dict]:
-    """Fetch all leads from Tesla Partner Portal and log phases in ScraperRun."""
+    With `fingerprints`, the tables are hashed in the page first; when they
+    all match the last processed run, no row is extracted, the run is
+    recorded as "unchanged" and `fingerprints.skipped` is set.
+    """
     leads: List[Dict] = []
-    run = ScraperRun(
+    progress = RunProgress.start(
         timestamp=datetime.utcnow(),
         phase_connexion="Démarrage",
         phase_extraction="En attente",
         status="pending"
     )
-    db.session.add(run)
-    db.session.commit()
     logger.info("Scraper: starting new run")
     add_message("Scraper: starting new run")
     set_running(True)
@@ -116,25 +105,18 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
 
         try:
             logger.info(f"Scraper: navigating to {PORTAL_URL}")
-            add_message("Navigating to portal")
-            run.phase_connexion = "Navigation vers le portail"
-            db.session.commit()
+            progress.update("Navigating to portal", phase_connexion="Navigation vers le portail")
             page.goto(PORTAL_URL, timeout=PAGE_TIMEOUT * 1000)
             logger.info("Scraper: page loaded, performing login if needed")
             add_message("Page loaded; checking login")
             try:
                 login_if_needed(page)
                 logger.info("Scraper: login check complete")
-                add_message("Login check complete")
-                run.phase_connexion = "Connexion réussie"
-                db.session.commit()
+                progress.update("Login check complete", phase_connexion="Connexion réussie")
             except Exception as e:
                 logger.error(f"Scraper: login failed or raised: {e}")
-                add_message(f"Login failed: {e}")
-                run.phase_connexion = f"Échec connexion: {e}"
-                run.status = "failed"
-                run.details = str(e)
-                db.session.commit()
+                progress.finish("failed", message=f"Login failed: {e}",
+                                phase_connexion=f"Échec connexion: {e}", details=str(e))
                 raise
 
             logger.info("Scraper: waiting for page load to complete")
@@ -142,10 +124,8 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
             page.wait_for_load_state('networkidle', timeout=PAGE_TIMEOUT * 1000)
             
             # Wait for Angular app to be ready
-            run.phase_extraction = "Initialisation Angular"
-            db.session.commit()
             logger.info("Scraper: waiting for Angular app to initialize")
-            add_message("Waiting for Angular app to initialize")
+            progress.update("Waiting for Angular app to initialize", phase_extraction="Initialisation Angular")
             try:
                 # First wait for app-root to exist
                 page.wait_for_selector('app-root', timeout=PAGE_TIMEOUT * 1000, state='attached')
@@ -174,10 +154,8 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
                 page.screenshot(path="angular_init_failed.png")
             
             # Wait for global loader to disappear
-            run.phase_extraction = "Attente disparition loader"
-            db.session.commit()
             logger.info("Scraper: waiting for main loader to disappear")
-            add_message("Waiting for loader to disappear")
+            progress.update("Waiting for loader to disappear", phase_extraction="Attente disparition loader")
             try:
                 page.wait_for_selector('.tds-loader--show', timeout=PAGE_TIMEOUT * 1000, state='hidden')
             except Exception as e:
@@ -187,10 +165,8 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
             page.wait_for_timeout(2000)
             
             # Verify content presence
-            run.phase_extraction = "Vérification du contenu"
-            db.session.commit()
             logger.info("Scraper: waiting for content to be ready")
-            add_message("Waiting for content to be ready")
+            progress.update("Waiting for content to be ready", phase_extraction="Vérification du contenu")
             
             # Wait for either table, error message, or empty state
             selectors = [
@@ -208,8 +184,7 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
                 # Take screenshot before looking for content
                 screenshot_path = f"scraper_run_{run.id}_pre_content.png"
                 page.screenshot(path=f"static/{screenshot_path}")
-                run.screenshot_path = screenshot_path
-                db.session.commit()
+                progress.update(screenshot_path=screenshot_path)
                 logger.info("Saved pre-content screenshot")
                 
                 # Try each selector individually first
@@ -260,23 +235,37 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
 
             tables = page.query_selector_all('table')
             logger.info(f"Scraper: found {len(tables)} table(s) on the page")
-            add_message(f"Found {len(tables)} table(s) on the page")
-            run.phase_extraction = f"Tables détectées: {len(tables)}"
-            db.session.commit()
+            progress.update(f"Found {len(tables)} table(s) on the page",
+                            phase_extraction=f"Tables détectées: {len(tables)}")
             if not tables:
                 logger.warning("Scraper: no tables found — returning empty list")
-                add_message("No tables found — returning empty list")
-                run.status = "success"
-                db.session.commit()
+                progress.finish("success", message="No tables found — returning empty list")
                 return []
 
+            # Keep the session rolling: store the cookies the portal refreshed
+            try:
+                refresh_cookies(context.cookies(), source='playwright')
+            except Exception as e:
+                logger.warning(f"Scraper: cookies not refreshed: {e}")
+
+            if fingerprints is not None:
+                for source, fingerprint in zip(TABLE_SOURCES, page.evaluate(ALL_TABLES_HASH_JS)):
+                    fingerprints.add(source, fingerprint)
+                if fingerprints.unchanged():
+                    fingerprints.skipped = True
+                    logger.info("Scraper: tables unchanged since last run — rows skipped")
+                    add_message("Tables unchanged since last run — rows skipped")
+                    progress.finish("unchanged", message="Tables unchanged since last run — rows skipped",
+                                    phase_extraction="Inchangé (empreintes identiques)")
+                    return []
+
             for i, table in enumerate(tables):
                 if i >= len(TABLE_SOURCES):
                     logger.debug(f"Scraper: skipping table index {i} beyond configured sources")
                     break
 
                 source = TABLE_SOURCES[i]
-                headers = extract_headers(table)
+                headers = extract_headers(table, source)
                 logger.debug(f"Scraper: table {i} headers: {headers}")
                 rows = extract_rows(table, headers)
                 logger.info(f"Scraper: extracted {len(rows)} rows from table {i} (source={source})")
@@ -294,17 +283,13 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
                     leads.append(lead)
 
             logger.info(f"Scraper: total leads extracted: {len(leads)}")
-            add_message(f"Total leads extracted: {len(leads)}")
-            run.phase_extraction = f"Extraction terminée: {len(leads)} leads"
-            run.status = "success"
-            db.session.commit()
+            progress.finish("success", message=f"Total leads extracted: {len(leads)}",
+                            phase_extraction=f"Extraction terminée: {len(leads)} leads")
 
         except Exception as e:
             logger.error(f"Scraper: unexpected error during fetch_leads: {e}")
-            add_message(f"Error during fetch: {e}")
-            run.status = "failed"
-            run.details = str(e)
-            db.session.commit()
+            progress.finish("failed", message=f"Error during fetch: {e}",
+                            details=str(e))
             raise
         finally:
             # Save console logs and network errors to details
@@ -317,8 +302,7 @@ def fetch_leads(logger: logging.Logger) -> List[Dict]:
                 debug_info.extend(network_errors[:10])  # Limit to 10 errors
             
             if debug_info:
-                run.details = (run.details or "") + "\n\n" + "\n".join(debug_info)
-                db.session.commit()
+                progress.update(details=(progress.get('details') or "") + "\n\n" + "\n".join(debug_info))
             
             try:
                 context.close()
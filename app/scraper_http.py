@@ -0,0 +1,364 @@
+"""Browserless lead fetch with the saved session cookies.
+
+When cookies_manager holds a valid portal session, the leads are read
+with plain HTTP requests instead of a browser: a pooled requests.Session
+carrying the saved cookies fetches the lead data endpoints
+(PORTAL_LEADS_API_URLS, JSON) or the PORTAL_URL page (HTML tables), and
+the rows go through the same normalization as the Playwright scraper
+(`normalize_key` headers through the header schema registry,
+`guess_primary_key`, TABLE_SOURCES per table).
+
+A session the portal rejects (401/403, redirect to a login page, login
+form served instead of the leads) or a page without any table raises
+FastPathUnavailable; with SCRAPER_FETCH_MODE=auto the browser backend
+then runs as before. Cookies the portal sets or renews during a
+successful fetch are written back with `refresh_cookies()`.
+"""
+import logging
+import re
+import threading
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    PORTAL_URL, TABLE_SOURCES, SCRAPER_FETCH_MODE, PORTAL_LEADS_API_URLS, HTTP_FETCH_TIMEOUT
+)
+from utils_text import guess_primary_key
+from header_schema import observe, compile_headers
+from cookies_manager import load_cookies, cookies_exist, cookie_expiry, refresh_cookies
+from fingerprints import TableFingerprints, digest
+from models import db
+from scraper_status import add_message, set_running
+from run_progress import RunProgress
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+# Where the portal sends a session it does not accept
+_LOGIN_URL = re.compile(r'auth|login|signin', re.IGNORECASE)
+_LOGIN_FORM = re.compile(r'<input[^>]+(name=["\']identity["\']|type=["\']password["\'])', re.IGNORECASE)
+# Markup of each table, hashed without parsing the page (fingerprints.py)
+_TABLE_MARKUP = re.compile(r'<table\b.*?</table\s*>', re.IGNORECASE | re.DOTALL)
+# Keys of a JSON response object that hold the rows
+_ROW_KEYS = ('leads', 'data', 'items', 'results', 'rows')
+
+
+class FastPathUnavailable(Exception):
+    """Raised when the leads cannot be read without a browser."""
+    pass
+
+
+class SessionRejected(FastPathUnavailable):
+    """Raised when the portal does not accept the saved session cookies."""
+    pass
+
+
+class _TableParser(HTMLParser):
+    """Collect the header and data cells of every <table>.
+
+    Mirrors the Playwright extraction: headers are the `thead th` cells, or
+    the `th` cells of the first row; data rows are the rows outside thead.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables: List[Dict] = []
+        self._open: List[Dict] = []
+        self._cell: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            table = {'head': [], 'first': None, 'rows': [], 'in_head': False, 'row': None}
+            self.tables.append(table)
+            self._open.append(table)
+        elif not self._open:
+            return
+        elif tag == 'thead':
+            self._open[-1]['in_head'] = True
+        elif tag == 'tr':
+            self._open[-1]['row'] = {'th': [], 'td': []}
+        elif tag in ('th', 'td') and self._open[-1]['row'] is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if not self._open:
+            return
+        table = self._open[-1]
+        if tag in ('th', 'td') and self._cell is not None and table['row'] is not None:
+            table['row'][tag].append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and table['row'] is not None:
+            row, table['row'] = table['row'], None
+            if table['first'] is None:
+                table['first'] = row['th']
+            if table['in_head']:
+                table['head'].extend(row['th'])
+            else:
+                table['rows'].append(row['td'])
+        elif tag == 'thead':
+            table['in_head'] = False
+        elif tag == 'table':
+            self._open.pop()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def parse_tables(html: str, sources: Sequence[str] = ()) -> List[Tuple[List[str], List[Dict]]]:
+    """(normalized headers, rows) of every table of an HTML page.
+
+    The headers of table i are checked against the header schema of
+    sources[i] when given (header_schema.py).
+    """
+    parser = _TableParser()
+    parser.feed(html)
+    parser.close()
+    tables = []
+    for i, table in enumerate(parser.tables):
+        raw = table['head'] or table['first'] or []
+        headers = list(observe(sources[i], raw) if i < len(sources) else compile_headers(raw))
+        rows = [dict(zip(headers, cells)) for cells in table['rows'] if cells and len(cells) == len(headers)]
+        tables.append((headers, rows))
+    return tables
+
+
+def parse_json_rows(payload, source: Optional[str] = None) -> List[Dict]:
+    """Rows of a lead data endpoint: a list of objects, or an object holding one.
+
+    The keys of the first object are checked against the header schema of
+    `source` when given (header_schema.py).
+    """
+    if isinstance(payload, dict):
+        payload = next((payload[k] for k in _ROW_KEYS if isinstance(payload.get(k), list)), None)
+    if not isinstance(payload, list):
+        raise FastPathUnavailable('Réponse JSON sans liste de leads')
+    def cell(value):
+        # Scalars become text like the cells of the HTML table
+        if isinstance(value, (dict, list)):
+            return value
+        return '' if value is None else str(value).strip()
+
+    items = [item for item in payload if isinstance(item, dict)]
+    if items and source:
+        observe(source, [str(k) for k in items[0]])
+    rows = []
+    for item in items:
+        # Objects of one endpoint share their keys: one cache lookup per row
+        keys = compile_headers(str(k) for k in item)
+        rows.append({key: cell(value) for key, value in zip(keys, item.values())})
+    return rows
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def portal_session(cookies) -> requests.Session:
+    """Return the process-wide portal session, loaded with `cookies`.
+
+    The session (and its keep-alive connections) is kept between runs;
+    its cookie jar is replaced on every call.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0))
+            _session.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0))
+            _session.headers.update({'User-Agent': USER_AGENT, 'Accept-Language': 'fr-FR,fr;q=0.9'})
+        _session.cookies.clear()
+        host = urlsplit(PORTAL_URL).hostname
+        items = ([{'name': k, 'value': v} for k, v in cookies.items()] if isinstance(cookies, dict) else cookies)
+        for cookie in items:
+            if isinstance(cookie, dict) and cookie.get('name') and cookie.get('value') is not None:
+                expiry = cookie_expiry(cookie)
+                _session.cookies.set(cookie['name'], str(cookie['value']), domain=cookie.get('domain') or host,
+                                     path=cookie.get('path') or '/', secure=bool(cookie.get('secure', False)),
+                                     expires=int(expiry) if expiry else None)
+        return _session
+
+
+def _jar_cookies(session: requests.Session) -> List[Dict]:
+    """Cookies of the session jar in the cookies_manager format."""
+    cookies = []
+    for c in session.cookies:
+        cookie = {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'secure': bool(c.secure)}
+        if c.expires:
+            cookie['expiry'] = c.expires
+        cookies.append(cookie)
+    return cookies
+
+
+def _get(session: requests.Session, url: str, accept: str) -> requests.Response:
+    """GET a portal URL and check that the session was accepted."""
+    try:
+        response = session.get(url, timeout=HTTP_FETCH_TIMEOUT, headers={'Accept': accept})
+    except requests.RequestException as e:
+        raise FastPathUnavailable(f"Portail injoignable: {e}")
+    if response.status_code in (401, 403):
+        raise SessionRejected(f"HTTP {response.status_code} sur {url}")
+    final = urlsplit(response.url)
+    if response.history and _LOGIN_URL.search(final.netloc + final.path):
+        raise SessionRejected(f"Redirigé vers {response.url}")
+    if response.status_code >= 400:
+        raise FastPathUnavailable(f"HTTP {response.status_code} sur {url}")
+    if 'charset' not in response.headers.get('Content-Type', '').lower():
+        # requests would assume ISO-8859-1 for text/*; the portal is UTF-8
+        response.encoding = 'utf-8'
+    return response
+
+
+def fetch_tables(session: requests.Session,
+                 fingerprints: Optional[TableFingerprints] = None) -> Optional[List[List[Dict]]]:
+    """Rows per table, in TABLE_SOURCES order.
+
+    With `fingerprints`, each JSON body or table markup is hashed before
+    parsing; None is returned (nothing parsed) when all of them match the
+    last processed run.
+
+    Raises:
+        SessionRejected: If the portal does not accept the session
+        FastPathUnavailable: If the rows cannot be read over HTTP
+    """
+    if PORTAL_LEADS_API_URLS:
+        responses = [(url, _get(session, url, 'application/json')) for url in PORTAL_LEADS_API_URLS]
+        if fingerprints is not None:
+            for source, (_, response) in zip(TABLE_SOURCES, responses):
+                fingerprints.add(source, digest(response.content))
+            if fingerprints.unchanged():
+                return None
+        tables = []
+        for i, (url, response) in enumerate(responses):
+            try:
+                payload = response.json()
+            except ValueError:
+                if _LOGIN_FORM.search(response.text):
+                    raise SessionRejected(f"Formulaire de connexion servi par {url}")
+                raise FastPathUnavailable(f"Réponse non JSON de {url}")
+            tables.append(parse_json_rows(payload, TABLE_SOURCES[i] if i < len(TABLE_SOURCES) else None))
+        return tables
+
+    response = _get(session, PORTAL_URL, 'text/html')
+    html = response.text
+    if _LOGIN_FORM.search(html):
+        raise SessionRejected('Formulaire de connexion servi à la place des leads')
+    if fingerprints is not None:
+        for source, markup in zip(TABLE_SOURCES, _TABLE_MARKUP.findall(html)):
+            fingerprints.add(source, digest(markup))
+        if fingerprints.unchanged():
+            return None
+    tables = parse_tables(html, TABLE_SOURCES)
+    if not tables:
+        # e.g. a client-rendered page: only a browser can build the table
+        raise FastPathUnavailable('Aucun tableau dans la page (rendu côté navigateur ?)')
+    return [rows for _, rows in tables]
+
+
+def _to_leads(tables: List[List[Dict]]) -> List[Dict]:
+    leads = []
+    for i, rows in enumerate(tables[:len(TABLE_SOURCES)]):
+        for row_index, row in enumerate(rows):
+            leads.append({
+                "source": TABLE_SOURCES[i],
+                "key": guess_primary_key(row),
+                "fetched_at": datetime.now(),
+                "url": PORTAL_URL,
+                "row_index": row_index,
+                "row": row
+            })
+    return leads
+
+
+def fetch_leads_http(logger: logging.Logger, fingerprints: Optional[TableFingerprints] = None) -> List[Dict]:
+    """Fetch the leads without a browser and log the run in ScraperRun.
+
+    With `fingerprints`, an unchanged portal is recorded as an "unchanged"
+    run: no leads are returned and `fingerprints.skipped` is set.
+
+    Raises:
+        FastPathUnavailable: If there is no usable session or page
+    """
+    if not cookies_exist():
+        raise FastPathUnavailable('Aucun cookie de session sauvegardé')
+    cookies = load_cookies()
+    if not cookies:
+        raise FastPathUnavailable('Cookies de session illisibles')
+    started = datetime.utcnow()
+    session = portal_session(cookies)
+    sent = _jar_cookies(session)
+    tables = fetch_tables(session, fingerprints)
+    leads = _to_leads(tables) if tables is not None else []
+    # Keep the session rolling: store cookies the portal set or renewed
+    renewed = [c for c in _jar_cookies(session) if c not in sent]
+    if renewed:
+        try:
+            refresh_cookies(renewed, source='http')
+        except Exception as e:
+            logger.warning(f"Cookies non renouvelés: {e}")
+
+    progress = RunProgress.start(timestamp=started, phase_connexion="Session HTTP (cookies)",
+                                 phase_extraction="En cours", status="pending")
+    set_running(True)
+    try:
+        if tables is None:
+            fingerprints.skipped = True
+            logger.info(f"Scraper HTTP: tableaux inchangés depuis le dernier run — lignes ignorées "
+                        f"({(datetime.utcnow() - started).total_seconds():.2f}s)")
+            add_message("Tables unchanged since last run — rows skipped (HTTP)")
+            progress.finish("unchanged", message="Tables unchanged since last run — rows skipped (HTTP)",
+                            phase_extraction="Inchangé (empreintes identiques)")
+            return leads
+        for i, rows in enumerate(tables[:len(TABLE_SOURCES)]):
+            add_message(f"Extracted {len(rows)} rows from table {i} (source={TABLE_SOURCES[i]}) via HTTP")
+        logger.info(f"Scraper HTTP: {len(leads)} leads lus sans navigateur "
+                    f"en {(datetime.utcnow() - started).total_seconds():.2f}s")
+        progress.finish("success", message=f"Total leads extracted: {len(leads)} (HTTP)",
+                        phase_extraction=f"Extraction terminée: {len(leads)} leads")
+    finally:
+        set_running(False)
+    return leads
+
+
+def fetch_leads(logger: logging.Logger, fingerprints: Optional[TableFingerprints] = None) -> List[Dict]:
+    """Fetch leads over HTTP when possible, with the browser otherwise
+    (see SCRAPER_FETCH_MODE)."""
+    if SCRAPER_FETCH_MODE != 'browser':
+        try:
+            return fetch_leads_http(logger, fingerprints)
+        except FastPathUnavailable as e:
+            if SCRAPER_FETCH_MODE == 'http':
+                raise
+            logger.warning(f"Lecture HTTP impossible ({e}) — passage au navigateur")
+            if fingerprints is not None:
+                # HTTP digests never match the browser's in-page hashes
+                fingerprints.clear()
+    from scraper import fetch_leads as fetch_with_browser
+    return fetch_with_browser(logger, fingerprints)
+
+
+def scrape_leads(logger: logging.Logger) -> Dict:
+    """HTTP counterpart of `scraper_selenium.scrape_tesla_leads()`: fetch,
+    store and return the leads (none when the tables are unchanged).
+
+    Raises:
+        FastPathUnavailable: If there is no usable session or page
+    """
+    from ingest import ingest_leads
+    fingerprints = TableFingerprints()
+    leads = fetch_leads_http(logger, fingerprints)
+    if fingerprints.skipped:
+        return {'status': 'success', 'message': 'Tables unchanged since last run (HTTP)',
+                'leads_count': 0, 'leads': [], 'unchanged': True}
+    fingerprints.save()
+    ingest_leads([{'source': lead['source'], 'key': lead['key'],
+                   'fetched_at': lead['fetched_at'], 'data': lead['row']} for lead in leads])
+    db.session.commit()  # ingest_leads does not commit an empty page
+    return {
+        'status': 'success',
+        'message': f"Successfully extracted {len(leads)} leads (HTTP)",
+        'leads_count': len(leads),
+        'leads': [{'table': TABLE_SOURCES.index(lead['source']), 'row': lead['row_index'] + 1, 'data': lead['row']}
+                  for lead in leads],
+    }
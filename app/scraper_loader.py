@@ -0,0 +1,74 @@
+"""Lazy access to the scraper backend.
+
+Importing `scraper_selenium` pulls in Selenium and its dependencies, which
+the web server and workers only need once a scrape actually runs. Callers
+import `scrape_tesla_leads` from here; the backend module is loaded on the
+first call and cached.
+
+With saved session cookies, `scrape_tesla_leads()` first tries the
+browserless fetch (scraper_http.py) and only launches Chrome when the
+portal rejects the session (SCRAPER_FETCH_MODE).
+"""
+import threading
+from typing import Callable, Dict, Optional
+from logger import get_logger
+from config import SCRAPER_FETCH_MODE
+
+logger = get_logger('SCRAPER')
+
+_lock = threading.Lock()
+_scrape_fn: Optional[Callable[..., Dict]] = None
+_load_error: Optional[str] = None
+
+
+def _unavailable(**kwargs) -> Dict:
+    return {
+        'status': 'failed',
+        'message': f'Scraper not available - {_load_error}',
+        'leads_count': 0,
+        'leads': []
+    }
+
+
+def get_scraper() -> Callable[..., Dict]:
+    """Import the Selenium backend on first use and return its entry point."""
+    global _scrape_fn, _load_error
+    if _scrape_fn is None:
+        with _lock:
+            if _scrape_fn is None:
+                try:
+                    from scraper_selenium import scrape_tesla_leads as backend
+                    logger.info("Scraper Selenium imported successfully")
+                except Exception as e:
+                    _load_error = str(e)
+                    logger.error(f"Scraper import failed: {e}")
+                    logger.warning("Le scraper ne sera pas disponible")
+                    backend = _unavailable
+                _scrape_fn = backend
+    return _scrape_fn
+
+
+def scraper_available() -> bool:
+    """Return True if the scraper backend can be imported."""
+    return get_scraper() is not _unavailable
+
+
+def scrape_tesla_leads(driver_factory: Optional[Callable] = None, **kwargs) -> Dict:
+    """Run the scraper: over HTTP when the saved session allows it, with the
+    Selenium backend (loading it if needed) otherwise.
+
+    Args:
+        driver_factory: Returns the WebDriver to use, called only when the
+            browser is needed (warm browser of a persistent worker)
+    """
+    if SCRAPER_FETCH_MODE != 'browser':
+        from scraper_http import scrape_leads, FastPathUnavailable
+        try:
+            return scrape_leads(logger)
+        except FastPathUnavailable as e:
+            if SCRAPER_FETCH_MODE == 'http':
+                return {'status': 'failed', 'message': f'HTTP fetch failed - {e}', 'leads_count': 0, 'leads': []}
+            logger.warning(f"Lecture HTTP impossible ({e}) — passage au navigateur")
+    if driver_factory is not None:
+        kwargs['driver'] = driver_factory()
+    return get_scraper()(**kwargs)
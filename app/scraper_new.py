@@ -7,7 +7,9 @@ from typing import Dict, List
 import logging
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
 from models import db, ScraperRun, Lead
+from run_progress import RunProgress
 from config import PORTAL_URL
+from cookies_manager import refresh_cookies
 
 # Configure logging to stdout for visibility
 logging.basicConfig(
@@ -38,6 +40,7 @@ def scrape_tesla_leads() -> Dict:
     )
     db.session.add(run)
     db.session.commit()
+    progress = RunProgress(run)
     
     logger.info("="*80)
     logger.info("🚀 DÉMARRAGE DU SCRAPER TESLA")
@@ -47,8 +50,7 @@ def scrape_tesla_leads() -> Dict:
         try:
             # Launch browser with anti-detection
             logger.info("🌐 Lancement du navigateur Chromium avec anti-détection...")
-            run.phase_connexion = "Lancement du navigateur"
-            db.session.commit()
+            progress.update(phase_connexion="Lancement du navigateur")
             
             browser = p.chromium.launch(
                 headless=True,
@@ -85,8 +87,7 @@ def scrape_tesla_leads() -> Dict:
             # Navigate to Tesla login page first (not directly to leads)
             tesla_login_url = "https://auth.tesla.com/oauth2/v3/authorize"
             logger.info(f"🔗 Navigation vers la page de login Tesla...")
-            run.phase_connexion = "Navigation vers login"
-            db.session.commit()
+            progress.update(phase_connexion="Navigation vers login")
             
             page.goto(tesla_login_url, wait_until='domcontentloaded', timeout=60000)
             logger.info("✅ Page de login chargée (DOM ready)")
@@ -105,8 +106,7 @@ def scrape_tesla_leads() -> Dict:
             
             # Check if login is needed
             logger.info("🔐 Vérification de l'authentification...")
-            run.phase_connexion = "Vérification authentification"
-            db.session.commit()
+            progress.update(phase_connexion="Vérification authentification")
             
             # Try to login if credentials are available
             email = os.getenv('TESLA_EMAIL')
@@ -127,8 +127,7 @@ def scrape_tesla_leads() -> Dict:
                     
                     # Look for email input fields with multiple selectors
                     logger.info("🔍 Recherche des champs de formulaire...")
-                    run.phase_connexion = "Recherche formulaire login"
-                    db.session.commit()
+                    progress.update(phase_connexion="Recherche formulaire login")
                     
                     # Wait for form to appear
                     time.sleep(2)
@@ -195,32 +194,30 @@ def scrape_tesla_leads() -> Dict:
                                     
                                     if 'leads' in final_url or 'home' in final_url:
                                         logger.info("✅ Authentification réussie! Redirigé vers le portail")
-                                        run.phase_connexion = "Authentification réussie"
+                                        progress.update(phase_connexion="Authentification réussie")
                                     else:
                                         logger.warning(f"⚠️ Authentification incertaine, URL: {final_url}")
-                                        run.phase_connexion = f"Auth. incertaine: {final_url[:50]}"
+                                        progress.update(phase_connexion=f"Auth. incertaine: {final_url[:50]}")
                                 else:
                                     logger.error("❌ Bouton de soumission non trouvé")
-                                    run.phase_connexion = "Erreur: bouton submit introuvable"
+                                    progress.update(phase_connexion="Erreur: bouton submit introuvable")
                             else:
                                 logger.error("❌ Champ password non trouvé")
-                                run.phase_connexion = "Erreur: champ password introuvable"
+                                progress.update(phase_connexion="Erreur: champ password introuvable")
                         else:
                             logger.error("❌ Champ email non trouvé sur la page de login")
-                            run.phase_connexion = "Erreur: champ email introuvable"
+                            progress.update(phase_connexion="Erreur: champ email introuvable")
                     else:
                         logger.info("✅ Déjà authentifié (pas de redirection vers login)")
-                        run.phase_connexion = "Déjà authentifié"
+                        progress.update(phase_connexion="Déjà authentifié")
                         
                 except Exception as e:
                     logger.error(f"❌ Erreur lors du login: {e}")
                     logger.error(f"Stack trace:", exc_info=True)
-                    run.phase_connexion = f"Erreur login: {str(e)[:50]}"
+                    progress.update(phase_connexion=f"Erreur login: {str(e)[:50]}")
             else:
                 logger.warning("⚠️ Pas de credentials fournis")
-                run.phase_connexion = "Pas de credentials"
-            
-            db.session.commit()
+                progress.update(phase_connexion="Pas de credentials")
             
             # Verify we're on the right page
             final_url = page.url
@@ -244,22 +241,19 @@ def scrape_tesla_leads() -> Dict:
             
             logger.info(f"💾 Sauvegarde screenshot vers {screenshot_full_path}")
             page.screenshot(path=screenshot_full_path, full_page=True)
-            run.screenshot_path = screenshot_filename
-            db.session.commit()
+            progress.update(screenshot_path=screenshot_filename)
             
             logger.info(f"✅ Screenshot sauvegardé: {screenshot_filename}")
             
             # Wait for content to load
             logger.info("⏳ Attente du chargement du contenu (5 secondes pour Angular)...")
-            run.phase_extraction = "Attente du contenu"
-            db.session.commit()
+            progress.update(phase_extraction="Attente du contenu")
             
             time.sleep(5)  # Give Angular time to render
             
             # Extract page content
             logger.info("🔍 Analyse du contenu de la page...")
-            run.phase_extraction = "Analyse du contenu"
-            db.session.commit()
+            progress.update(phase_extraction="Analyse du contenu")
             
             # Get all text content
             page_text = page.inner_text('body')
@@ -315,7 +309,7 @@ def scrape_tesla_leads() -> Dict:
             
             # Save leads to database
             logger.info(f"💾 Sauvegarde de {len(leads_data)} leads dans la base de données...")
-            run.phase_extraction = f"Extraction: {len(leads_data)} leads trouvés"
+            progress.update(phase_extraction=f"Extraction: {len(leads_data)} leads trouvés")
             
             saved_count = 0
             for lead_data in leads_data:
@@ -338,10 +332,15 @@ def scrape_tesla_leads() -> Dict:
             
             db.session.commit()
             
+            # Keep the session rolling: store the cookies the portal refreshed
+            try:
+                if not any(word in page.url.lower() for word in ('auth', 'login', 'signin')):
+                    refresh_cookies(context.cookies(), source='playwright')
+            except Exception as e:
+                logger.warning(f"⚠️ Cookies non renouvelés: {e}")
+            
             # Update run status
-            run.status = "success"
-            run.details = f"Extracted {len(leads_data)} leads from {len(tables)} tables"
-            db.session.commit()
+            progress.finish("success", details=f"Extracted {len(leads_data)} leads from {len(tables)} tables")
             
             result['status'] = 'success'
             result['message'] = f"Successfully extracted {len(leads_data)} leads"
@@ -360,10 +359,8 @@ def scrape_tesla_leads() -> Dict:
             logger.error("="*80)
             logger.error("Stack trace:", exc_info=True)
             
-            run.status = "failed"
-            run.phase_extraction = "Échec"
-            run.details = str(e)
-            db.session.commit()
+            db.session.rollback()
+            progress.finish("failed", phase_extraction="Échec", details=str(e))
             
             result['status'] = 'failed'
             result['message'] = str(e)
@@ -11,18 +11,64 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from models import db, ScraperRun, Lead
+from models import db
+from ingest import ingest_leads
+from run_progress import RunProgress
 from config import PORTAL_URL
-from cookies_manager import load_cookies, cookies_exist
+from cookies_manager import load_cookies, cookies_exist, refresh_cookies, cookie_expiry
+from fingerprints import TableFingerprints, ALL_TABLES_HASH_JS
+from header_schema import observe
+from utils_text import guess_primary_key
 from logger import get_logger
 
 # Use unified logger
 logger = get_logger('SCRAPER')
 
-def scrape_tesla_leads() -> Dict:
+def create_driver():
+    """Launch Chrome with the scraper's anti-detection options."""
+    logger.info("🌐 Configuration de Chrome avec anti-détection...")
+    chrome_options = Options()
+    
+    # Check if we should run in headless mode
+    headless_mode = os.getenv('SCRAPER_HEADLESS', 'true').lower() == 'true'
+    
+    if headless_mode:
+        logger.info("🕶️ Mode headless activé")
+        chrome_options.add_argument('--headless')
+    else:
+        logger.info("👁️ Mode visible activé (pour résolution manuelle du captcha)")
+        
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+    
+    # Launch Chrome
+    logger.info("🚀 Lancement de Chrome...")
+    driver = webdriver.Chrome(options=chrome_options)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver.set_page_load_timeout(60)
+    return driver
+
+def _refresh_session_cookies(driver) -> None:
+    """Keep the session rolling: store the cookies the portal refreshed."""
+    try:
+        if not any(word in driver.current_url.lower() for word in ('auth', 'login', 'signin')):
+            refresh_cookies(driver.get_cookies(), source='selenium')
+    except Exception as e:
+        logger.warning(f"⚠️ Cookies non renouvelés: {e}")
+
+def scrape_tesla_leads(driver=None) -> Dict:
     """
     Scrape Tesla Partner Portal for leads using Selenium.
     Returns a dict with status, message, and leads data.
+
+    Args:
+        driver: Optional already running WebDriver (warm browser kept by a
+            persistent worker). It is left open; otherwise a new browser is
+            launched and closed at the end of the run.
     """
     result = {
         'status': 'pending',
@@ -32,49 +78,25 @@ def scrape_tesla_leads() -> Dict:
     }
     
     # Create ScraperRun record
-    run = ScraperRun(
+    progress = RunProgress.start(
         timestamp=datetime.utcnow(),
         phase_connexion="Démarrage",
         phase_extraction="En attente",
         status="pending"
     )
-    db.session.add(run)
-    db.session.commit()
     
     logger.info("="*80)
     logger.info("🚀 DÉMARRAGE DU SCRAPER TESLA (SELENIUM)")
     logger.info("="*80)
     
-    driver = None
+    owns_driver = driver is None
     try:
-        # Configure Chrome options
-        logger.info("🌐 Configuration de Chrome avec anti-détection...")
-        run.phase_connexion = "Configuration du navigateur"
-        db.session.commit()
-        
-        chrome_options = Options()
-        
-        # Check if we should run in headless mode
-        headless_mode = os.getenv('SCRAPER_HEADLESS', 'true').lower() == 'true'
-        
-        if headless_mode:
-            logger.info("🕶️ Mode headless activé")
-            chrome_options.add_argument('--headless')
+        if owns_driver:
+            progress.update(phase_connexion="Configuration du navigateur")
+            driver = create_driver()
         else:
-            logger.info("👁️ Mode visible activé (pour résolution manuelle du captcha)")
-            
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-        
-        # Launch Chrome
-        logger.info("🚀 Lancement de Chrome...")
-        driver = webdriver.Chrome(options=chrome_options)
-        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        driver.set_page_load_timeout(60)
+            logger.info("♻️ Réutilisation du navigateur déjà lancé")
+            progress.update(phase_connexion="Navigateur réutilisé")
         
         # Get credentials (needed if cookies fail)
         email = os.getenv('TESLA_EMAIL')
@@ -89,8 +111,7 @@ def scrape_tesla_leads() -> Dict:
         
         if has_cookies:
             logger.info("🍪 Chargement des cookies pour authentification automatique...")
-            run.phase_connexion = "Chargement cookies"
-            db.session.commit()
+            progress.update(phase_connexion="Chargement cookies")
             
             # First, navigate to domain to set cookies
             logger.info("🔗 Navigation initiale vers auth.tesla.com...")
@@ -159,14 +180,16 @@ def scrape_tesla_leads() -> Dict:
                             # Inject cookies for this domain
                             for cookie in domain_cookies:
                                 try:
-                                    # Clean cookie: keep only essential fields
+                                    # Clean cookie: keep only essential fields (WebDriver wants an int expiry)
+                                    expiry = cookie_expiry(cookie)
                                     cookie_clean = {
                                         'name': cookie['name'],
                                         'value': cookie['value'],
                                         'domain': cookie.get('domain', domain_clean),
                                         'path': cookie.get('path', '/'),
                                         'secure': cookie.get('secure', True),
-                                        'httpOnly': cookie.get('httpOnly', False)
+                                        'httpOnly': cookie.get('httpOnly', False),
+                                        'expiry': int(expiry) if expiry is not None else None
                                     }
                                     
                                     # Remove None values
@@ -186,12 +209,11 @@ def scrape_tesla_leads() -> Dict:
                     
                     logger.info(f"📊 Résultat injection: {injected_count} réussis, {failed_count} échoués")
                     if injected_count > 0:
-                        run.phase_connexion = f"Cookies: {injected_count} injectés ✅"
+                        progress.update(phase_connexion=f"Cookies: {injected_count} injectés ✅")
                         should_login = False
                     else:
                         logger.warning("⚠️ Aucun cookie injecté, passage au login classique")
                         should_login = True
-                    db.session.commit()
                 else:
                     should_login = True
             
@@ -206,14 +228,12 @@ def scrape_tesla_leads() -> Dict:
             # Check if we're authenticated
             if 'auth' not in current_url.lower() and 'login' not in current_url.lower():
                 logger.info("✅ Authentification par cookies réussie!")
-                run.phase_connexion = "Authentifié via cookies"
-                db.session.commit()
+                progress.update(phase_connexion="Authentifié via cookies")
                 # Skip login process
                 should_login = False
             else:
                 logger.warning("⚠️ Cookies expirés ou invalides, passage au login classique...")
-                run.phase_connexion = "Cookies invalides - login requis"
-                db.session.commit()
+                progress.update(phase_connexion="Cookies invalides - login requis")
                 should_login = True
         else:
             # No cookies, need to login
@@ -222,8 +242,7 @@ def scrape_tesla_leads() -> Dict:
             
             # Navigate to Tesla portal
             logger.info(f"🔗 Navigation vers {PORTAL_URL}")
-            run.phase_connexion = "Navigation vers le portail"
-            db.session.commit()
+            progress.update(phase_connexion="Navigation vers le portail")
             
             driver.get(PORTAL_URL)
             logger.info("⏳ Attente du chargement de la page (10 secondes)...")
@@ -242,8 +261,7 @@ def scrape_tesla_leads() -> Dict:
         # Check if we're on login/auth page
         if should_login and ('auth' in current_url.lower() or 'login' in current_url.lower() or 'signin' in current_url.lower()):
             logger.info("🔐 Page d'authentification détectée")
-            run.phase_connexion = "Sur la page de login"
-            db.session.commit()
+            progress.update(phase_connexion="Sur la page de login")
             
             # Take screenshot of login page for debugging
             login_screenshot = f"scraper_run_{run.id}_login_page.png"
@@ -302,23 +320,21 @@ def scrape_tesla_leads() -> Dict:
                     
                     if 'leads' in final_url or 'home' in final_url:
                         logger.info("✅ Authentification réussie!")
-                        run.phase_connexion = "Authentification réussie"
+                        progress.update(phase_connexion="Authentification réussie")
                     else:
                         logger.warning(f"⚠️ Authentification incertaine, URL: {final_url}")
-                        run.phase_connexion = f"Auth incertaine"
+                        progress.update(phase_connexion=f"Auth incertaine")
                         
                 except NoSuchElementException:
                     logger.error("❌ Bouton 'Sign In' non trouvé")
-                    run.phase_connexion = "Erreur: bouton signin introuvable"
+                    progress.update(phase_connexion="Erreur: bouton signin introuvable")
                     
             except TimeoutException:
                 logger.error("❌ Timeout: champs de formulaire non trouvés")
-                run.phase_connexion = "Erreur: timeout formulaire"
+                progress.update(phase_connexion="Erreur: timeout formulaire")
         else:
             logger.info("✅ Déjà authentifié")
-            run.phase_connexion = "Déjà authentifié"
-        
-        db.session.commit()
+            progress.update(phase_connexion="Déjà authentifié")
         
         # Take screenshot
         screenshot_filename = f"scraper_run_{run.id}_page.png"
@@ -327,20 +343,17 @@ def scrape_tesla_leads() -> Dict:
         
         logger.info(f"💾 Sauvegarde screenshot...")
         driver.save_screenshot(screenshot_full_path)
-        run.screenshot_path = screenshot_filename
-        db.session.commit()
+        progress.update(screenshot_path=screenshot_filename)
         logger.info(f"✅ Screenshot sauvegardé: {screenshot_filename}")
         
         # Wait for content
         logger.info("⏳ Attente du chargement du contenu (5 secondes pour Angular)...")
-        run.phase_extraction = "Attente du contenu"
-        db.session.commit()
+        progress.update(phase_extraction="Attente du contenu")
         time.sleep(5)
         
         # Extract content
         logger.info("🔍 Analyse du contenu de la page...")
-        run.phase_extraction = "Analyse du contenu"
-        db.session.commit()
+        progress.update(phase_extraction="Analyse du contenu")
         
         page_text = driver.find_element(By.TAG_NAME, 'body').text
         logger.info(f"📄 Longueur du contenu texte: {len(page_text)} caractères")
@@ -350,6 +363,20 @@ def scrape_tesla_leads() -> Dict:
         tables = driver.find_elements(By.TAG_NAME, 'table')
         logger.info(f"📊 Nombre de tableaux trouvés: {len(tables)}")
         
+        # Same tables as the last processed run: skip the row extraction
+        fingerprints = TableFingerprints()
+        for idx, fingerprint in enumerate(driver.execute_script(f"return {ALL_TABLES_HASH_JS};") or []):
+            fingerprints.add(f"Tesla Table {idx}", fingerprint)
+        if fingerprints.unchanged():
+            logger.info("♻️ Tableaux inchangés depuis le dernier run — extraction ignorée")
+            _refresh_session_cookies(driver)
+            progress.finish("unchanged", phase_extraction="Inchangé (empreintes identiques)",
+                            details=f"{len(tables)} tables unchanged since last run")
+            result['status'] = 'success'
+            result['message'] = "Tables unchanged since last run"
+            result['unchanged'] = True
+            return result
+        
         leads_data = []
         
         for idx, table in enumerate(tables):
@@ -369,6 +396,7 @@ def scrape_tesla_leads() -> Dict:
                         headers.append(cell.text.strip())
                     
                     logger.info(f"   ↳ En-têtes: {headers}")
+                    keys = observe(f"Tesla Table {idx}", headers)
                     
                     # Extract data rows
                     for row_idx, row in enumerate(rows[1:], 1):
@@ -376,13 +404,18 @@ def scrape_tesla_leads() -> Dict:
                         
                         if len(cells) > 0:
                             row_data = {}
+                            key_row = {}
                             for cell_idx, cell in enumerate(cells):
                                 header = headers[cell_idx] if cell_idx < len(headers) else f"column_{cell_idx}"
                                 row_data[header] = cell.text.strip()
+                                key_row[keys[cell_idx] if cell_idx < len(keys) else header] = row_data[header]
                             
                             leads_data.append({
                                 'table': idx,
                                 'row': row_idx,
+                                # Same key as the other backends, so a lead still
+                                # listed on the portal is stored only once
+                                'key': guess_primary_key(key_row),
                                 'data': row_data
                             })
                     
@@ -393,31 +426,23 @@ def scrape_tesla_leads() -> Dict:
         
         # Save leads
         logger.info(f"💾 Sauvegarde de {len(leads_data)} leads...")
-        run.phase_extraction = f"Extraction: {len(leads_data)} leads trouvés"
+        progress.update(phase_extraction=f"Extraction: {len(leads_data)} leads trouvés")
         
-        saved_count = 0
-        for lead_data in leads_data:
-            key = f"table{lead_data['table']}_row{lead_data['row']}_{int(time.time())}"
-            
-            try:
-                lead = Lead(
-                    source=f"Tesla Table {lead_data['table']}",
-                    key=key,
-                    fetched_at=datetime.utcnow(),
-                    data=lead_data['data']
-                )
-                db.session.add(lead)
-                saved_count += 1
-            except Exception as e:
-                logger.error(f"❌ Erreur sauvegarde lead: {e}")
+        fetched_at = datetime.utcnow()
+        fingerprints.save()
+        saved = ingest_leads([{
+            'source': f"Tesla Table {lead_data['table']}",
+            'key': lead_data['key'],
+            'fetched_at': fetched_at,
+            'data': lead_data['data'],
+        } for lead_data in leads_data])
+        db.session.commit()  # ingest_leads does not commit an empty page
+        logger.info(f"✅ {len(saved)}/{len(leads_data)} leads sauvegardés")
         
-        logger.info(f"✅ {saved_count}/{len(leads_data)} leads sauvegardés")
-        db.session.commit()
+        _refresh_session_cookies(driver)
         
         # Update run status
-        run.status = "success"
-        run.details = f"Extracted {len(leads_data)} leads from {len(tables)} tables"
-        db.session.commit()
+        progress.finish("success", details=f"Extracted {len(leads_data)} leads from {len(tables)} tables")
         
         result['status'] = 'success'
         result['message'] = f"Successfully extracted {len(leads_data)} leads"
@@ -436,16 +461,14 @@ def scrape_tesla_leads() -> Dict:
         logger.error("="*80)
         logger.error("Stack trace:", exc_info=True)
         
-        run.status = "failed"
-        run.phase_extraction = "Échec"
-        run.details = str(e)
-        db.session.commit()
+        db.session.rollback()
+        progress.finish("failed", phase_extraction="Échec", details=str(e))
         
         result['status'] = 'failed'
         result['message'] = str(e)
     
     finally:
-        if driver:
+        if driver and owns_driver:
             try:
                 driver.quit()
                 logger.info("🔒 Navigateur fermé")
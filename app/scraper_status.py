@@ -1,8 +1,10 @@
 from collections import deque
 import threading
+import events
 
 # Simple in-memory status store for scraper progress messages.
-# This is process-local; for multiple replicas use Redis or DB-backed store.
+# The deque is process-local; every message and state change is also
+# published on the cross-process event channel (events.py) for /scrape-events.
 
 _lock = threading.Lock()
 _messages = deque(maxlen=200)
@@ -11,6 +13,7 @@ _running = False
 def add_message(msg: str):
     with _lock:
         _messages.append({'ts': __import__('datetime').datetime.utcnow().isoformat() + 'Z', 'msg': msg})
+    events.publish('progress', {'msg': msg})
 
 def get_messages():
     with _lock:
@@ -20,6 +23,7 @@ def set_running(value: bool):
     global _running
     with _lock:
         _running = bool(value)
+    events.publish('state', {'running': bool(value)})
 
 def is_running() -> bool:
     with _lock:
@@ -0,0 +1,369 @@
+"""Single-flight coordination for scrape runs.
+
+At most one scrape runs at a time across web threads, gunicorn workers,
+RQ workers and the cron entry point. A trigger that finds a run in flight
+attaches to it and gets that run's result instead of launching a second
+browser against the same account.
+
+Lock backends:
+  - RedisFlightLock: SET NX with a TTL, used when REDIS_URL is set so every
+    host shares the same lock
+  - FileFlightLock: flock() on SCRAPE_LOCK_FILE for a single host
+
+The holder refreshes a heartbeat every SCRAPE_LOCK_TTL / 3 seconds. If the
+holder crashes, the Redis key expires after SCRAPE_LOCK_TTL and the kernel
+drops the file lock with the process. A holder that is alive but no longer
+heartbeats is reported as stale.
+"""
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from logger import get_logger
+from scraper_status import set_running
+import events
+from config import REDIS_URL, SCRAPE_LOCK_FILE, SCRAPE_LOCK_TTL, SCRAPE_JOB_TIMEOUT, SCRAPE_RESULT_TTL
+
+logger = get_logger('SINGLE_FLIGHT')
+
+# Poll interval for triggers waiting on an in-flight run
+WAIT_POLL_SECONDS = 0.5
+# File backend: results kept for attached triggers
+MAX_FILE_RESULTS = 20
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def _summary(result: Optional[Dict]) -> Dict:
+    """The part of a scrape result shared with attached triggers."""
+    if result is None:
+        return {'status': 'failed', 'message': 'Run ended without a result', 'leads_count': 0}
+    return {
+        'status': result.get('status'),
+        'message': result.get('message'),
+        'leads_count': result.get('leads_count', 0),
+    }
+
+
+class FileFlightLock:
+    """flock()-based lock for processes sharing one host.
+
+    The lock file holds the holder's info as JSON; the results of recent
+    flights are kept next to it.
+    """
+
+    def __init__(self, path: str = SCRAPE_LOCK_FILE):
+        self.path = path
+        self.results_path = f"{path}.results.json"
+        self._fds: Dict[str, int] = {}
+
+    def _open(self) -> int:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @staticmethod
+    def _read(fd: int) -> Optional[Dict]:
+        raw = os.pread(fd, 65536, 0)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _write(fd: int, info: Dict) -> None:
+        # Write then trim: the file is only ever empty while nobody holds it
+        data = json.dumps(info).encode()
+        os.pwrite(fd, data, 0)
+        os.ftruncate(fd, len(data))
+
+    def acquire(self, flight_id: str, info: Dict, ttl: int) -> bool:
+        fd = self._open()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        previous = self._read(fd)
+        if previous:
+            # Never released: its holder died and the kernel dropped the lock
+            logger.warning(f"Verrou de scrape orphelin récupéré (détenteur {previous.get('owner')}, "
+                           f"démarré {previous.get('started_at')})")
+        self._write(fd, info)
+        self._fds[flight_id] = fd
+        return True
+
+    def refresh(self, flight_id: str, info: Dict, ttl: int) -> bool:
+        fd = self._fds.get(flight_id)
+        if fd is None:
+            return False
+        self._write(fd, info)
+        return True
+
+    def release(self, flight_id: str) -> None:
+        fd = self._fds.pop(flight_id, None)
+        if fd is None:
+            return
+        try:
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def holder(self) -> Optional[Dict]:
+        """Info of the live holder, read without taking the lock: a flock()
+        probe would make a concurrent acquire() fail."""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            # The holder may be rewriting its heartbeat; retry a torn read
+            for _ in range(5):
+                raw = os.pread(fd, 65536, 0)
+                if not raw:
+                    return None
+                try:
+                    info = json.loads(raw)
+                    break
+                except ValueError:
+                    time.sleep(0.01)
+            else:
+                return {'id': None}
+        finally:
+            os.close(fd)
+        return info if self._alive(info) else None
+
+    @staticmethod
+    def _alive(info: Dict) -> bool:
+        """False if the holder was a process of this host that has exited
+        (the kernel dropped its lock but the info file remains)."""
+        host, _, pid = str(info.get('owner', '')).rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            # Another host or container: only the heartbeat tells
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _results(self) -> Dict:
+        try:
+            with open(self.results_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def set_result(self, flight_id: str, result: Dict) -> None:
+        results = self._results()
+        results[flight_id] = result
+        results = dict(list(results.items())[-MAX_FILE_RESULTS:])
+        tmp = f"{self.results_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(results, f)
+        os.replace(tmp, self.results_path)
+
+    def get_result(self, flight_id: str) -> Optional[Dict]:
+        return self._results().get(flight_id)
+
+
+class RedisFlightLock:
+    """Lock shared by every process connected to the same Redis."""
+
+    KEY = 'leads:scrape:lock'
+    INFO_KEY = 'leads:scrape:lock:info'
+    RESULT_KEY = 'leads:scrape:result:{}'
+
+    _REFRESH = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        redis.call('expire', KEYS[1], ARGV[2])
+        redis.call('set', KEYS[2], ARGV[3], 'EX', ARGV[2])
+        return 1
+    end
+    return 0
+    """
+    _RELEASE = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1], KEYS[2])
+    end
+    return 0
+    """
+
+    def __init__(self, connection, result_ttl: int = SCRAPE_RESULT_TTL):
+        self.connection = connection
+        self.result_ttl = result_ttl
+        self._refresh = connection.register_script(self._REFRESH)
+        self._release = connection.register_script(self._RELEASE)
+
+    def acquire(self, flight_id: str, info: Dict, ttl: int) -> bool:
+        if not self.connection.set(self.KEY, flight_id, nx=True, ex=ttl):
+            return False
+        self.connection.set(self.INFO_KEY, json.dumps(info), ex=ttl)
+        return True
+
+    def refresh(self, flight_id: str, info: Dict, ttl: int) -> bool:
+        return bool(self._refresh(keys=[self.KEY, self.INFO_KEY], args=[flight_id, ttl, json.dumps(info)]))
+
+    def release(self, flight_id: str) -> None:
+        self._release(keys=[self.KEY, self.INFO_KEY], args=[flight_id])
+
+    def holder(self) -> Optional[Dict]:
+        flight_id = self.connection.get(self.KEY)
+        if flight_id is None:
+            return None
+        raw = self.connection.get(self.INFO_KEY)
+        info = json.loads(raw) if raw else {}
+        info['id'] = flight_id.decode() if isinstance(flight_id, bytes) else flight_id
+        return info
+
+    def set_result(self, flight_id: str, result: Dict) -> None:
+        self.connection.set(self.RESULT_KEY.format(flight_id), json.dumps(result), ex=self.result_ttl)
+
+    def get_result(self, flight_id: str) -> Optional[Dict]:
+        raw = self.connection.get(self.RESULT_KEY.format(flight_id))
+        return json.loads(raw) if raw else None
+
+
+class Flight:
+    """A scrape run holding the lock. Keeps the lock alive until finished."""
+
+    def __init__(self, coordinator: 'ScrapeCoordinator', info: Dict):
+        self.coordinator = coordinator
+        self.info = info
+        self.id = info['id']
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, name=f"flight-{self.id[:8]}", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self) -> None:
+        interval = max(self.coordinator.ttl / 3.0, 0.1)
+        while not self._stop.wait(interval):
+            self.info['heartbeat_at'] = _now()
+            try:
+                if not self.coordinator.lock.refresh(self.id, self.info, self.coordinator.ttl):
+                    logger.warning(f"Verrou de scrape perdu pendant le run {self.id}")
+            except Exception as e:
+                logger.error(f"Heartbeat du verrou de scrape impossible: {e}")
+
+    def run(self, fn: Callable[..., Dict], *args, **kwargs) -> Dict:
+        """Run `fn` as this flight's scrape, then publish its result and release."""
+        set_running(True)
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except Exception as e:
+            result = {'status': 'failed', 'message': str(e), 'leads_count': 0}
+            raise
+        finally:
+            set_running(False)
+            self.finish(result)
+
+    def finish(self, result: Optional[Dict]) -> None:
+        """Publish the result for attached triggers and release the lock."""
+        self._stop.set()
+        summary = dict(_summary(result), finished_at=_now())
+        try:
+            self.coordinator.lock.set_result(self.id, summary)
+        except Exception as e:
+            logger.error(f"Résultat du run {self.id} non publié: {e}")
+        finally:
+            self.coordinator.lock.release(self.id)
+        events.publish('run', dict(summary, flight_id=self.id))
+
+
+class ScrapeCoordinator:
+    """Start scrapes through a shared lock and coalesce concurrent triggers."""
+
+    def __init__(self, lock, ttl: int = SCRAPE_LOCK_TTL):
+        self.lock = lock
+        self.ttl = ttl
+
+    def try_start(self) -> Optional[Flight]:
+        """Take the lock for a new run, or return None if one is in flight."""
+        now = _now()
+        info = {
+            'id': uuid.uuid4().hex,
+            'owner': f"{socket.gethostname()}:{os.getpid()}",
+            'started_at': now,
+            'heartbeat_at': now,
+        }
+        if not self.lock.acquire(info['id'], info, self.ttl):
+            return None
+        return Flight(self, info)
+
+    def current(self) -> Optional[Dict]:
+        """Info about the run in flight, with a `stale` flag, or None."""
+        info = self.lock.holder()
+        if info is None:
+            return None
+        heartbeat = info.get('heartbeat_at')
+        if heartbeat:
+            age = (datetime.utcnow() - datetime.fromisoformat(heartbeat.rstrip('Z'))).total_seconds()
+            info['stale'] = age > self.ttl
+        return info
+
+    def wait(self, flight_id: str, timeout: float = SCRAPE_JOB_TIMEOUT) -> Dict:
+        """Wait for the result of another process's run."""
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.lock.get_result(flight_id)
+            if result is not None:
+                return result
+            holder = self.lock.holder()
+            if holder is None or holder.get('id') not in (flight_id, None):
+                # Finished between the two reads, or the holder died
+                return self.lock.get_result(flight_id) or _summary(None)
+            if time.monotonic() >= deadline:
+                return {'status': 'timeout', 'message': f'Run {flight_id} still in flight', 'leads_count': 0}
+            time.sleep(WAIT_POLL_SECONDS)
+
+    def run(self, fn: Callable[..., Dict], *args, timeout: float = SCRAPE_JOB_TIMEOUT, **kwargs) -> Dict:
+        """Run `fn` unless a scrape is in flight; then return that run's result.
+
+        Results from an attached trigger carry `coalesced: True`.
+        """
+        for _ in range(10):
+            flight = self.try_start()
+            if flight is not None:
+                return flight.run(fn, *args, **kwargs)
+            holder = self.current()
+            if holder is None or holder.get('id') is None:
+                # Released (or being written) between the two calls
+                time.sleep(0.05)
+                continue
+            logger.info(f"Scrape déjà en cours ({holder.get('owner')}, run {holder['id']}) — rattachement")
+            return dict(self.wait(holder['id'], timeout), coalesced=True, flight_id=holder['id'])
+        raise RuntimeError('Could not acquire or attach to the scrape lock')
+
+
+_coordinator: Optional[ScrapeCoordinator] = None
+
+def get_coordinator() -> ScrapeCoordinator:
+    """Return the process-wide coordinator (Redis lock if configured)."""
+    global _coordinator
+    if _coordinator is None:
+        if REDIS_URL:
+            from redis import Redis
+            _coordinator = ScrapeCoordinator(RedisFlightLock(Redis.from_url(REDIS_URL)))
+        else:
+            _coordinator = ScrapeCoordinator(FileFlightLock())
+    return _coordinator
+
+def set_coordinator(coordinator: Optional[ScrapeCoordinator]) -> None:
+    """Replace the coordinator (used by worker.py and tests)."""
+    global _coordinator
+    _coordinator = coordinator
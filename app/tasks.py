@@ -1,30 +1,229 @@
-import os
-import logging
+"""Background scrape jobs for RQ workers.
+
+`run_fetch_task` is the RQ job. It reuses one Flask app per worker process
+and, when the persistent worker (worker.py) enables it, one warm browser
+across jobs. Each job's outcome and timings are recorded in a job store:
+Redis when REDIS_URL is set, an in-memory stand-in otherwise.
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
 from logger import get_logger
 from app_factory import create_app
-
-# Try to import scraper
-try:
-    from scraper_selenium import scrape_tesla_leads
-    SCRAPER_AVAILABLE = True
-except Exception as e:
-    SCRAPER_AVAILABLE = False
-    print(f"⚠️ Scraper import failed in tasks.py: {e}")
-    def scrape_tesla_leads():
-        return {'status': 'failed', 'message': 'Scraper not available', 'leads_count': 0, 'leads': []}
+from scraper_loader import scrape_tesla_leads
+from single_flight import get_coordinator
+from config import (
+    REDIS_URL, SCRAPE_JOB_TIMEOUT, SCRAPE_RESULT_TTL,
+    WORKER_BROWSER_MAX_JOBS, WORKER_BROWSER_MAX_AGE
+)
 
 logger = get_logger(__name__)
 
+# Single job id so concurrent triggers collapse into one queued scrape
+SCRAPE_JOB_ID = 'scrape-tesla-leads'
+JOB_FUNCTION = 'tasks.run_fetch_task'
+ACTIVE_JOB_STATUSES = ('queued', 'started', 'deferred', 'scheduled')
+
+# Flask app shared by all jobs run in this worker process
+_app = None
+
+def _get_app():
+    global _app
+    if _app is None:
+        _app = create_app('worker')
+    return _app
+
+
+class MemoryJobStore:
+    """In-process job result store (tests, or no Redis configured)."""
+
+    def __init__(self, maxlen: int = 50, ttl: int = SCRAPE_RESULT_TTL):
+        self.ttl = ttl
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, result: Dict) -> None:
+        with self._lock:
+            self._records.appendleft((time.time(), result))
+
+    def recent(self, limit: int = 10) -> List[Dict]:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [r for ts, r in list(self._records)[:limit] if ts >= cutoff]
+
+
+class RedisJobStore:
+    """Job results kept in a capped Redis list that expires after `ttl`."""
+
+    KEY = 'leads:jobs'
+
+    def __init__(self, connection, maxlen: int = 50, ttl: int = SCRAPE_RESULT_TTL):
+        self.connection = connection
+        self.maxlen = maxlen
+        self.ttl = ttl
+
+    def record(self, result: Dict) -> None:
+        pipe = self.connection.pipeline()
+        pipe.lpush(self.KEY, json.dumps(result))
+        pipe.ltrim(self.KEY, 0, self.maxlen - 1)
+        pipe.expire(self.KEY, self.ttl)
+        pipe.execute()
+
+    def recent(self, limit: int = 10) -> List[Dict]:
+        return [json.loads(r) for r in self.connection.lrange(self.KEY, 0, limit - 1)]
+
+
+_job_store = None
+
+def get_job_store():
+    """Return the process-wide job store (Redis if configured)."""
+    global _job_store
+    if _job_store is None:
+        if REDIS_URL:
+            from redis import Redis
+            _job_store = RedisJobStore(Redis.from_url(REDIS_URL))
+        else:
+            _job_store = MemoryJobStore()
+    return _job_store
+
+def set_job_store(store) -> None:
+    """Replace the job store (used by worker.py and tests)."""
+    global _job_store
+    _job_store = store
+
+
+class WarmBrowser:
+    """Keep one Selenium driver alive between jobs of a persistent worker.
+
+    The driver is recycled after `max_jobs` jobs, after `max_age` seconds,
+    or as soon as it stops responding.
+    """
+
+    def __init__(self, max_jobs: int = WORKER_BROWSER_MAX_JOBS, max_age: int = WORKER_BROWSER_MAX_AGE):
+        self.max_jobs = max_jobs
+        self.max_age = max_age
+        self.driver = None
+        self._jobs = 0
+        self._started = 0.0
+
+    def _alive(self) -> bool:
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def get(self):
+        """Return a ready driver, launching a new one if needed."""
+        expired = (self._jobs >= self.max_jobs or time.monotonic() - self._started >= self.max_age)
+        if self.driver is not None and (expired or not self._alive()):
+            self.close()
+        if self.driver is None:
+            from scraper_selenium import create_driver
+            self.driver = create_driver()
+            self._jobs = 0
+            self._started = time.monotonic()
+        self._jobs += 1
+        return self.driver
+
+    def close(self) -> None:
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+
+_warm_browser: Optional[WarmBrowser] = None
+
+def enable_warm_browser(browser: Optional[WarmBrowser] = None) -> WarmBrowser:
+    """Keep a browser between jobs. Only safe in non-forking workers."""
+    global _warm_browser
+    _warm_browser = browser or WarmBrowser()
+    return _warm_browser
+
+
 def run_fetch_task():
     """Wrapper to run scraper in a task worker environment.
 
-    This function is suitable to be enqueued into RQ. It creates an app
-    context and runs the simplified scraper.
+    This function is suitable to be enqueued into RQ. It runs the scraper
+    in an app context; the app is created once per worker process. If a
+    scrape is already in flight, the job waits for it and records its
+    result instead of scraping again.
     """
-    app = create_app()
-    with app.app_context():
+    started = time.perf_counter()
+    record = {'started_at': datetime.utcnow().isoformat() + 'Z'}
+    try:
+        from rq import get_current_job
+        job = get_current_job()
+        if job is not None:
+            record['job_id'] = job.id
+            if job.enqueued_at:
+                record['queued_seconds'] = round((datetime.utcnow() - job.enqueued_at).total_seconds(), 3)
+    except Exception:
+        pass
+
+    result = None
+    with _get_app().app_context():
         try:
-            result = scrape_tesla_leads()
+            kwargs = {}
+            if _warm_browser is not None:
+                # Launched only if the HTTP fetch cannot be used
+                kwargs['driver_factory'] = _warm_browser.get
+            record['setup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            # Attaches to a scrape started elsewhere instead of running a second one
+            result = get_coordinator().run(scrape_tesla_leads, **kwargs)
+            if result.get('coalesced'):
+                record['coalesced_with'] = result['flight_id']
             logger.info(f"Scraper finished: {result['status']} - {result['message']}")
+            if result['status'] != 'success' and _warm_browser is not None:
+                # Do not carry a possibly broken session into the next job
+                _warm_browser.close()
         except Exception as e:
             logger.error(f"Task run_fetch_task failed: {e}")
+            result = {'status': 'failed', 'message': str(e), 'leads_count': 0}
+
+    record.update({
+        'status': result['status'],
+        'message': result['message'],
+        'leads_count': result.get('leads_count', 0),
+        'duration_seconds': round(time.perf_counter() - started, 3),
+        'finished_at': datetime.utcnow().isoformat() + 'Z',
+    })
+    try:
+        get_job_store().record(record)
+    except Exception as e:
+        logger.error(f"Could not record job result: {e}")
+    return record
+
+
+def enqueue_scrape(connection):
+    """Enqueue a scrape unless one is already queued or running.
+
+    Returns:
+        (job, created) where created is False when an active job was reused
+    """
+    from rq import Queue
+    from rq.job import Job
+    from rq.exceptions import NoSuchJobError
+
+    try:
+        job = Job.fetch(SCRAPE_JOB_ID, connection=connection)
+        if job.get_status() in ACTIVE_JOB_STATUSES:
+            return job, False
+    except NoSuchJobError:
+        pass
+
+    queue = Queue(connection=connection)
+    job = queue.enqueue(
+        JOB_FUNCTION,
+        job_id=SCRAPE_JOB_ID,
+        job_timeout=SCRAPE_JOB_TIMEOUT,
+        result_ttl=SCRAPE_RESULT_TTL,
+        failure_ttl=SCRAPE_RESULT_TTL
+    )
+    return job, True
@@ -1,6 +1,9 @@
 """Text utilities for normalizing headers and strings."""
+import hashlib
+import json
 import re
 import unicodedata
+from typing import Dict
 
 def strip_accents(s: str) -> str:
     """Remove accents from string while preserving base characters."""
@@ -24,4 +27,15 @@ def normalize_key(header: str) -> str:
     text = re.sub(r'_+', '_', text)
     
     # Remove leading/trailing underscores
-    return text.strip('_')
\ No newline at end of file
+    return text.strip('_')
+
+def guess_primary_key(row: Dict) -> str:
+    """Determine primary key for a lead row."""
+    # Try preferred fields in order
+    for field in ['numero_d_installation', 'numero_de_confirmation', 'id']:
+        if field in row and row[field]:
+            return row[field]
+            
+    # Fallback: create stable hash of sorted row items
+    row_str = json.dumps(dict(sorted(row.items())), ensure_ascii=False)
+    return hashlib.sha256(row_str.encode()).hexdigest()[:8]
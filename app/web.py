@@ -1,41 +1,45 @@
 """Web interface for Tesla Leads dashboard."""
 import os
+import json
+import time
+import hashlib
 from datetime import datetime
 import bcrypt
 import socket
 import secrets
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from flask import make_response, session
+from werkzeug.http import is_resource_modified
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from itsdangerous import URLSafeTimedSerializer
 from flask_cors import CORS
-import requests
+from sqlalchemy.orm import defer
 from models import db, User, LoginAttempt, Lead, ScraperAttempt, ScraperRun
 import threading
-from config import PORTAL_URL
+from config import PORTAL_URL, DASHBOARD_PAGE_SIZE, DASHBOARD_COUNT_TTL, DASHBOARD_RENDER_CACHE_SIZE
+from config import LEAD_DETAIL_MAX_AGE
+from config import SSE_MAX_STREAMS, SSE_STREAM_SECONDS, SSE_HEARTBEAT_SECONDS, LEAD_FEED_TOKEN, LEAD_FEED_MAX_STREAMS
+from pagination import keyset_paginate
+import data_version
+from data_version import RenderCache
+import outbox
 from logger import get_logger
 
-# Initialize logger for web module
-web_logger = get_logger('WEB')
-
-# Try to import scraper - log error if it fails
-try:
-    from scraper_selenium import scrape_tesla_leads
-    SCRAPER_AVAILABLE = True
-    web_logger.info("Scraper Selenium imported successfully")
-except Exception as e:
-    SCRAPER_AVAILABLE = False
-    web_logger.error(f"Scraper import failed: {e}")
-    web_logger.warning("Le scraper ne sera pas disponible")
-    # Define a dummy function
-    def scrape_tesla_leads():
-        return {'status': 'failed', 'message': 'Scraper not available - Selenium not installed', 'leads_count': 0, 'leads': []}
-from config import N8N_WEBHOOK_URL
+# The Selenium backend is imported on the first scrape, not at startup
+from scraper_loader import scrape_tesla_leads
+from config import REDIS_URL
+from notifier import queue_email, send_email
 from app_factory import create_app
 from scraper_status import get_messages, is_running
+from tasks import enqueue_scrape, get_job_store
+from single_flight import get_coordinator
+from scheduler import get_schedule
+from events import get_event_channel
+from lead_feed import get_hub, FeedFilter, event_order
 # Optional: support Redis + RQ if REDIS_URL is provided in environment
 try:
     from redis import Redis
-    from rq import Queue
+    import rq
     REDIS_AVAILABLE = True
 except Exception:
     REDIS_AVAILABLE = False
@@ -43,6 +47,8 @@ except Exception:
 # Configuration
 DOMAIN = os.getenv('DOMAIN', 'https://api2.energum.earth')
 ADMIN_EMAIL = "contact@energum.earth"
+# Repeated access requests for one address within this window send one email
+VALIDATION_EMAIL_DEDUP_SECONDS = 300
 
 # Create Flask application
 app = create_app()
@@ -64,7 +70,12 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 def send_validation_email(user):
-    """Send validation email with token."""
+    """Queue the validation email for `user` and return immediately.
+
+    The email is committed to the webhook outbox and posted to n8n by a
+    background dispatcher (retried if n8n is slow or down), so the calling
+    request never waits on the webhook.
+    """
     token = serializer.dumps(user.email, salt='email-validation')
     validation_url = f"{DOMAIN}/validate/{token}"
     
@@ -79,45 +90,104 @@ def send_validation_email(user):
     }
     
     try:
-        response = requests.post(N8N_WEBHOOK_URL, json=payload)
-        if response.status_code == 200:
-            logger.info(f"Email de validation envoyé pour {user.email}")
-        else:
-            logger.error(f"Échec envoi email pour {user.email}: {response.status_code}")
+        # One email per address and time window: a resubmit shortly after is
+        # deduplicated, a later request is sent again (the column holds 128 chars)
+        window = int(time.time() // VALIDATION_EMAIL_DEDUP_SECONDS)
+        dedup_key = f"validation:{hashlib.sha1(user.email.lower().encode()).hexdigest()}:{window}"
+        if not queue_email(payload, dedup_key=dedup_key):
+            logger.info(f"Email de validation déjà en file pour {user.email}")
+            return
+        db.session.commit()
+        _start_email_dispatcher()
+        outbox.wake()
+        logger.info(f"Email de validation mis en file pour {user.email}")
     except Exception as e:
-        logger.error(f"Erreur envoi email: {str(e)}")
+        db.session.rollback()
+        logger.error(f"Erreur mise en file email: {str(e)}")
+
+_email_dispatcher = None
+_email_dispatcher_lock = threading.Lock()
+
+def _start_email_dispatcher() -> None:
+    """Deliver queued emails from this process (the scheduler's dispatcher also does)."""
+    global _email_dispatcher
+    with _email_dispatcher_lock:
+        if _email_dispatcher is None:
+            _email_dispatcher = outbox.OutboxDispatcher(app, senders={'email': send_email}, batch_senders={})
+            _email_dispatcher.start()
+
+# Rendered dashboard pages, keyed by data version, user and query args
+_render_cache = RenderCache(DASHBOARD_RENDER_CACHE_SIZE)
+# Template changes (deploys) must invalidate client copies too
+_TEMPLATE_STAMP = '-'.join(
+    str(int(os.path.getmtime(os.path.join(app.root_path, 'templates', name))))
+    for name in ('base.html', 'dashboard.html')
+)
+
 
 @app.route('/')
 @login_required
 def dashboard():
-    """Dashboard principal avec les 3 tableaux et pagination."""
-    # Determine pages from query params
-    try:
-        leads_page = int(request.args.get('leads_page', 1))
-    except ValueError:
-        leads_page = 1
-
-    try:
-        success_page = int(request.args.get('success_page', 1))
-    except ValueError:
-        success_page = 1
-
-    try:
-        failed_page = int(request.args.get('failed_page', 1))
-    except ValueError:
-        failed_page = 1
+    """Dashboard principal avec les 3 tableaux et pagination par curseur.
 
+    Unchanged data returns 304 (ETag / Last-Modified from the data
+    version) and recently rendered pages are served from the render cache.
+    Pages carrying flash messages are always rendered.
+    """
+    version, modified = data_version.current()
+    view = (current_user.id, tuple(sorted(request.args.items(multi=True))))
+    etag = f"{version}-{hashlib.sha1(repr((view, _TEMPLATE_STAMP)).encode()).hexdigest()[:16]}"
+    cacheable = not session.get('_flashes')
+
+    html = None
+    if cacheable:
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+        html = _render_cache.get((version, view))
+
+    if html is None:
+        html = _render_dashboard()
+        if cacheable:
+            _render_cache.put((version, view), html)
+
+    response = make_response(html)
+    if cacheable:
+        response.set_etag(etag, weak=True)
+        if modified:
+            response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _render_dashboard() -> str:
     # Which tab should be active
     active_tab = request.args.get('tab', 'leads')
 
-    latest_leads = Lead.query.order_by(Lead.fetched_at.desc()).paginate(page=leads_page, per_page=10, error_out=False)
-    scraper_page = int(request.args.get('scraper_page', 1))
-    scraper_runs = ScraperRun.query.order_by(ScraperRun.timestamp.desc()).paginate(page=scraper_page, per_page=10, error_out=False)
+    # Summary rows only: details are fetched from /leads/<id> on expand
+    latest_leads = keyset_paginate(
+        Lead, Lead.fetched_at,
+        after=request.args.get('leads_after'),
+        before=request.args.get('leads_before'),
+        per_page=DASHBOARD_PAGE_SIZE,
+        count_ttl=DASHBOARD_COUNT_TTL,
+        options=[defer(Lead.data)]
+    )
+    scraper_runs = keyset_paginate(
+        ScraperRun, ScraperRun.timestamp,
+        after=request.args.get('runs_after'),
+        before=request.args.get('runs_before'),
+        per_page=DASHBOARD_PAGE_SIZE,
+        count_ttl=DASHBOARD_COUNT_TTL
+    )
 
     return render_template('dashboard.html',
                          latest_leads=latest_leads,
                          scraper_runs=scraper_runs,
                          active_tab=active_tab,
+                         schedule=get_schedule(),
                          portal_url=PORTAL_URL)
 
 
@@ -126,45 +196,58 @@ def dashboard():
 def scrape_now():
     """Trigger a scraping run in background and return immediately.
 
-    If REDIS_URL is configured and RQ is available, enqueue the task into RQ.
-    Otherwise, fall back to a local background thread.
+    If a scrape is already in flight (in any process), the request attaches
+    to it instead of starting another one. If REDIS_URL is configured and
+    RQ is available, enqueue the task into RQ. Otherwise, fall back to a
+    local background thread.
     """
-    redis_url = os.getenv('REDIS_URL')
+    tab = request.args.get('tab', 'leads')
+    in_flight = get_coordinator().current()
+    if in_flight is not None:
+        flash(f"Un scrape est déjà en cours depuis {in_flight.get('started_at', '?')} — "
+              f"son résultat s'affichera ici.", 'info')
+        return redirect(url_for('dashboard', tab=tab))
+
+    redis_url = REDIS_URL
     if redis_url and REDIS_AVAILABLE:
         try:
             conn = Redis.from_url(redis_url)
-            q = Queue(connection=conn)
-            q.enqueue('app.tasks.run_fetch_task')
-            flash("Scrape en file d'attente (Redis/RQ).", 'info')
+            job, created = enqueue_scrape(conn)
+            if created:
+                flash("Scrape en file d'attente (Redis/RQ).", 'info')
+            else:
+                flash(f"Un scrape est déjà en cours ou en attente (job {job.id}).", 'info')
         except Exception as e:
             logger.error(f"Failed to enqueue job to RQ: {e}")
             flash("Impossible d'enregistrer le job RQ — exécution locale.", 'warning')
-            def _background():
-                with app.app_context():
-                    try:
-                        scrape_tesla_leads()
-                    except Exception as e:
-                        logger.error(f"Background scrape failed: {e}")
-
-            thread = threading.Thread(target=_background, daemon=True)
-            thread.start()
+            _start_local_scrape()
     else:
-        def _background():
-            with app.app_context():
-                try:
-                    scrape_tesla_leads()
-                except Exception as e:
-                    logger.error(f"Background scrape failed: {e}")
-
-        thread = threading.Thread(target=_background, daemon=True)
-        thread.start()
-        flash('Scrape lancé en tâche de fond — vérifiez les logs ou le tableau pour les résultats.', 'info')
+        if _start_local_scrape():
+            flash('Scrape lancé en tâche de fond — vérifiez les logs ou le tableau pour les résultats.', 'info')
 
     # keep the user on the same tab if provided
-    tab = request.args.get('tab', 'leads')
     return redirect(url_for('dashboard', tab=tab))
 
 
+def _start_local_scrape() -> bool:
+    """Run a scrape in a background thread if no other scrape holds the lock."""
+    flight = get_coordinator().try_start()
+    if flight is None:
+        flash('Un scrape est déjà en cours — son résultat s\'affichera ici.', 'info')
+        return False
+
+    def _background():
+        with app.app_context():
+            try:
+                flight.run(scrape_tesla_leads)
+            except Exception as e:
+                logger.error(f"Background scrape failed: {e}")
+
+    thread = threading.Thread(target=_background, daemon=True)
+    thread.start()
+    return True
+
+
 @app.route('/upload-cookies', methods=['POST'])
 @login_required
 def upload_cookies():
@@ -193,11 +276,10 @@ def upload_cookies():
 @app.route('/cookies-status')
 @login_required
 def cookies_status():
-    """Check if cookies are available."""
+    """Check if cookies are available, and until when."""
     try:
-        from cookies_manager import cookies_exist
-        exists = cookies_exist()
-        return jsonify({'exists': exists})
+        from cookies_manager import cookies_status as status
+        return jsonify(status())
     except Exception as e:
         return jsonify({'exists': False, 'error': str(e)})
 
@@ -209,11 +291,266 @@ def cookies_export_page():
     return render_template('cookies_export.html')
 
 
+@app.route('/webhooks')
+@login_required
+def webhooks_page():
+    """Webhook outbox status and dead-lettered messages."""
+    return render_template('webhooks.html', stats=outbox.stats(), queues=outbox.stats_by_kind(),
+                           dead=outbox.dead_letters())
+
+
+@app.route('/webhooks/retry', methods=['POST'])
+@login_required
+def webhooks_retry():
+    """Requeue one dead-lettered message (form field `id`) or all of them."""
+    ids = [int(i) for i in request.form.getlist('id')] or None
+    count = outbox.retry(ids)
+    logger.info(f"{count} message(s) de l'outbox remis en file par {current_user.email}")
+    flash(f"{count} message(s) remis en file d'envoi.", 'info')
+    return redirect(url_for('webhooks_page'))
+
+
+@app.route('/export/leads.<fmt>')
+@login_required
+def export_leads(fmt):
+    """Stream all leads as CSV, NDJSON or Parquet.
+
+    Query params: source, since, until (ISO dates, filter on fetched_at).
+    """
+    from export import iter_export, ExportError, EXPORT_FORMATS
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        chunks = iter_export(
+            fmt,
+            source=request.args.get('source') or None,
+            since=datetime.fromisoformat(since) if since else None,
+            until=datetime.fromisoformat(until) if until else None
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Invalid date: {e}'}), 400
+    except ExportError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    logger.info(f"Export {fmt} demandé par {current_user.email}")
+    filename = f"leads_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
 @app.route('/scrape-status')
 @login_required
 def scrape_status():
-    """Return recent scraper progress messages and running flag as JSON."""
-    return jsonify({'running': is_running(), 'messages': get_messages()})
+    """Return recent scraper progress messages and running flag as JSON.
+
+    `in_flight` describes the run holding the scrape lock, whichever
+    process started it; `schedule` is the next run planned by scheduler.py.
+    """
+    in_flight = get_coordinator().current()
+    return jsonify({
+        'running': is_running() or in_flight is not None,
+        'in_flight': in_flight,
+        'schedule': get_schedule(),
+        'messages': get_messages()
+    })
+
+
+# Each open stream holds a server thread; cap them per process and endpoint
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+_feed_slots = threading.BoundedSemaphore(LEAD_FEED_MAX_STREAMS)
+# Events replayed to a client connecting without Last-Event-ID
+SSE_INITIAL_EVENTS = 50
+# Reconnection delay sent to a client turned away because all slots are taken
+SSE_BUSY_RETRY_MS = 10000
+
+
+def _sse(event) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@app.route('/scrape-events')
+@login_required
+def scrape_events():
+    """Server-Sent Events stream of scraper progress (`progress`, `state`, `run`).
+
+    Resumes after the `Last-Event-ID` header (sent by EventSource on
+    reconnect). Streams end after SSE_STREAM_SECONDS so server threads are
+    recycled; the browser reconnects and resumes transparently. When all
+    slots are taken the stream only asks the browser to retry later (a 503
+    would make EventSource give up).
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    channel = get_event_channel()
+
+    def generate():
+        # The slot is taken once the response is actually streamed, so it is
+        # released by the same generator even if the view fails before that
+        if not _sse_slots.acquire(blocking=False):
+            yield f"retry: {SSE_BUSY_RETRY_MS}\n\n"
+            return
+        try:
+            cursor = last_id
+            yield f"retry: 3000\n\n"
+            pending = channel.read(cursor, 0) if cursor else channel.recent(SSE_INITIAL_EVENTS)
+            deadline = time.monotonic() + SSE_STREAM_SECONDS
+            while True:
+                for event in pending:
+                    cursor = event['id']
+                    yield _sse(event)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pending = channel.read(cursor, min(SSE_HEARTBEAT_SECONDS, remaining))
+                if not pending:
+                    yield ": keep-alive\n\n"
+        finally:
+            _sse_slots.release()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _feed_authorized() -> bool:
+    """Dashboard session, or the LEAD_FEED_TOKEN bearer token for integrations."""
+    if current_user.is_authenticated:
+        return True
+    header = request.headers.get('Authorization', '')
+    return bool(LEAD_FEED_TOKEN) and secrets.compare_digest(header, f"Bearer {LEAD_FEED_TOKEN}")
+
+
+@app.route('/leads/feed')
+def lead_feed():
+    """Server-Sent Events stream of newly ingested leads (`lead` events).
+
+    Query args: `source` (comma-separated), `q` (text match on key and
+    fields), `fields` (projection of the row fields). Resumes after
+    `Last-Event-ID`. A client that cannot keep up receives a `dropped`
+    event and should reconnect. When all feed slots are taken the stream
+    only asks the client to retry later.
+    """
+    if not _feed_authorized():
+        return jsonify({'status': 'error', 'message': 'Authentication required'}), 401
+    filters = FeedFilter.from_args(request.args)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    hub = get_hub()
+
+    def send(event) -> str:
+        return _sse(dict(event, data=filters.project(event['data'])))
+
+    def generate():
+        # Slot and subscription are owned by the generator (see scrape_events)
+        if not _feed_slots.acquire(blocking=False):
+            yield f"retry: {SSE_BUSY_RETRY_MS}\n\n"
+            return
+        client = None
+        try:
+            client = hub.subscribe(filters)
+            yield "retry: 3000\n\n"
+            delivered = None
+            # Catch up from history; the hub buffers live events meanwhile
+            cursor = last_id
+            while cursor:
+                batch = hub.channel.read(cursor, 0)
+                if not batch:
+                    break
+                for event in batch:
+                    cursor = delivered = event['id']
+                    if filters.matches(event['data']):
+                        yield send(event)
+            deadline = time.monotonic() + SSE_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                event = client.get(min(SSE_HEARTBEAT_SECONDS, max(0.0, deadline - time.monotonic())))
+                if client.dropped:
+                    yield "event: dropped\ndata: {}\n\n"
+                    break
+                if event is None:
+                    yield ": keep-alive\n\n"
+                elif delivered is None or event_order(event['id']) > event_order(delivered):
+                    delivered = event['id']
+                    yield send(event)
+        finally:
+            if client is not None:
+                hub.unsubscribe(client)
+            _feed_slots.release()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/leads/<int:lead_id>')
+def lead_detail(lead_id):
+    """Return one lead with its full payload as JSON.
+
+    Stored leads never change, so the response carries an ETag and may be
+    reused by the client for LEAD_DETAIL_MAX_AGE seconds.
+    """
+    if not _feed_authorized():
+        return jsonify({'status': 'error', 'message': 'Authentication required'}), 401
+    lead = db.session.get(Lead, lead_id)
+    if lead is None:
+        return jsonify({'status': 'error', 'message': 'Lead not found'}), 404
+
+    response = jsonify({
+        'id': lead.id,
+        'source': lead.source,
+        'key': lead.key,
+        'fetched_at': lead.fetched_at.isoformat() if lead.fetched_at else None,
+        'created_at': lead.created_at.isoformat() if lead.created_at else None,
+        'data': lead.data,
+    })
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.max_age = LEAD_DETAIL_MAX_AGE
+    return response.make_conditional(request)
+
+
+@app.route('/api/v1/leads')
+def api_leads():
+    """Cursor-paginated JSON list of leads for sync clients (see api.py).
+
+    Conditional requests are answered from the data version alone: an
+    unchanged page returns 304 without querying the leads.
+    """
+    from api import list_leads, compress, ApiError
+    if not _feed_authorized():
+        return jsonify({'status': 'error', 'message': 'Authentication required'}), 401
+
+    version, modified = data_version.current()
+    args = tuple(sorted(request.args.items(multi=True)))
+    etag = f"{version}-{hashlib.sha1(repr(args).encode()).hexdigest()[:16]}"
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        response = Response(status=304)
+    else:
+        try:
+            page = list_leads(request.args)
+        except ApiError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        body, encoding = compress(json.dumps(page, ensure_ascii=False).encode(), request.accept_encodings)
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.content_encoding = encoding
+        if modified:
+            response.last_modified = modified
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/scrape-jobs')
+@login_required
+def scrape_jobs():
+    """Return the most recent background scrape jobs with their timings."""
+    try:
+        jobs = get_job_store().recent(int(request.args.get('limit', 10)))
+    except Exception as e:
+        logger.error(f"Failed to read job results: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({'jobs': jobs})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
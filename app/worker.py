@@ -0,0 +1,64 @@
+"""Persistent RQ worker for scrape jobs.
+
+Unlike `rq worker`, which forks a fresh work horse per job, this worker
+runs jobs in-process (rq.SimpleWorker). The Flask app is created once at
+startup and a warm browser is kept between jobs, so a job only pays for
+the scrape itself.
+
+Usage:
+    REDIS_URL=redis://localhost:6379/0 python worker.py [--burst] [--no-warm-browser]
+"""
+import argparse
+import sys
+from config import REDIS_URL
+from logger import get_logger
+import tasks
+from single_flight import ScrapeCoordinator, RedisFlightLock, set_coordinator
+import events
+
+logger = get_logger('WORKER')
+
+
+def run_worker(connection, burst: bool = False, warm_browser: bool = True) -> bool:
+    """Preload the app and process scrape jobs from the default queue.
+
+    Args:
+        connection: Redis connection (a fakeredis instance works for tests)
+        burst: Exit once the queue is empty
+        warm_browser: Keep the Selenium browser open between jobs
+    """
+    from rq import Queue, SimpleWorker
+
+    tasks._get_app()
+    tasks.set_job_store(tasks.RedisJobStore(connection))
+    set_coordinator(ScrapeCoordinator(RedisFlightLock(connection)))
+    events.use_redis(connection)
+    browser = tasks.enable_warm_browser() if warm_browser else None
+    logger.info(f"Worker prêt (navigateur persistant: {'oui' if browser else 'non'})")
+
+    worker = SimpleWorker([Queue(connection=connection)], connection=connection)
+    try:
+        return worker.work(burst=burst)
+    finally:
+        if browser is not None:
+            browser.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis-url', default=REDIS_URL, help='Defaults to REDIS_URL')
+    parser.add_argument('--burst', action='store_true', help='Exit when the queue is empty')
+    parser.add_argument('--no-warm-browser', action='store_true', help='Launch a new browser for every job')
+    args = parser.parse_args()
+
+    if not args.redis_url:
+        logger.error("REDIS_URL n'est pas configuré")
+        return 2
+
+    from redis import Redis
+    run_worker(Redis.from_url(args.redis_url), burst=args.burst, warm_browser=not args.no_warm_browser)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())